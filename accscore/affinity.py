@@ -0,0 +1,90 @@
+"""Node affinity for task claims.
+
+Tasks opt in through reserved keys in their ``params`` (normally set via the
+workflow step's ``default_params``):
+
+``required_labels``
+    JSON object that must be contained in the claiming node's
+    ``nodes.labels``, e.g. ``{"gpu": true}``.
+``preferred_node``
+    Name of the node that should run the task.
+
+A task's *home node* is its ``preferred_node``, else the node it was last
+assigned to (so retries stick), else the node that ran its most recently
+finished upstream task (so inputs are already local). Tasks with a home node
+are only claimable by that node until ``fallback_after`` has passed since the
+task became ready; after that any node with matching labels may take them.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+REQUIRED_LABELS_PARAM = "required_labels"
+PREFERRED_NODE_PARAM = "preferred_node"
+
+_UPSTREAM_NODE = """(
+        SELECT up.assigned_node FROM job_tasks up
+        WHERE up.job_id = jt.job_id
+          AND up.task_key = ANY(jt.depends_on)
+          AND up.assigned_node IS NOT NULL
+        ORDER BY up.finished_at DESC NULLS LAST
+        LIMIT 1
+      )"""
+
+_HOME_NODE_SQL = f"""COALESCE(
+      jt.params ->> '{PREFERRED_NODE_PARAM}',
+      jt.assigned_node,
+      {_UPSTREAM_NODE}
+    )"""
+
+_READY_AT_SQL = """GREATEST(
+      jt.created_at,
+      jt.next_attempt_at,
+      (SELECT max(up.finished_at) FROM job_tasks up
+       WHERE up.job_id = jt.job_id AND up.task_key = ANY(jt.depends_on))
+    )"""
+
+
+@dataclass(frozen=True)
+class NodeAffinity:
+    """Restrict and bias a claim towards tasks suited to ``node``.
+
+    Parameters
+    ----------
+    node:
+        Name of the claiming node as stored in ``nodes.name``.
+    fallback_after:
+        How long a ready task waits for its home node before any node may
+        claim it.
+    """
+
+    node: str
+    fallback_after: timedelta = timedelta(minutes=2)
+
+    def where(self) -> str:
+        """Return the predicate to ``AND`` onto the runnable filter."""
+        return f"""(jt.params -> '{REQUIRED_LABELS_PARAM}' IS NULL
+        OR COALESCE(
+             (SELECT n.labels FROM nodes n WHERE n.name = :aff_node), '{{}}'::jsonb
+           ) @> (jt.params -> '{REQUIRED_LABELS_PARAM}'))
+      AND ({_HOME_NODE_SQL} IS NULL
+        OR {_HOME_NODE_SQL} = :aff_node
+        OR {_READY_AT_SQL} <= :now - :aff_fallback)"""
+
+    def prefer(self) -> str:
+        """Return the leading ``ORDER BY`` key favouring home-node tasks."""
+        return f"CASE WHEN {_HOME_NODE_SQL} = :aff_node THEN 0 ELSE 1 END ASC"
+
+    def params(self) -> dict[str, Any]:
+        """Return bind parameters used by :meth:`where` and :meth:`prefer`."""
+        return {"aff_node": self.node, "aff_fallback": self.fallback_after}
+
+
+__all__ = [
+    "NodeAffinity",
+    "REQUIRED_LABELS_PARAM",
+    "PREFERRED_NODE_PARAM",
+]
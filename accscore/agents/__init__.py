@@ -0,0 +1 @@
+"""Long-running ACCS processes built on the library helpers."""
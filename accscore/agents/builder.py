@@ -0,0 +1,237 @@
+"""Builder tick: instantiate the tasks of jobs that became due.
+
+Instead of rescanning every queued job on each tick, a :class:`Builder`
+remembers two watermarks from its last drained tick: the time it ran up to
+and the highest ``order_seq`` it processed. The next tick only looks at jobs
+whose ``scheduled_at`` passed since then and at jobs submitted after the
+``order_seq`` watermark. Due jobs are locked with ``FOR UPDATE SKIP LOCKED``
+in bounded batches, so several builders can run side by side, and each batch
+is instantiated with set-based statements in its own transaction.
+
+Jobs can slip past the watermarks, e.g. when a low ``order_seq`` commits
+late or a concurrent builder rolls back a batch it had locked. Every
+``full_scan_every`` ticks the builder therefore falls back to the full scan.
+
+Example::
+
+    Builder(batch_size=500).run()
+"""
+
+from __future__ import annotations
+
+import logging
+import signal
+import threading
+import time
+from datetime import UTC, datetime
+from typing import NamedTuple
+
+from sqlalchemy.engine import Engine
+
+from .. import db
+from ..db import sqlite
+from ..db.jobs import instantiate_jobs
+from ..db.statements import statement
+from ..nodes.planner import WakePlanner
+from .wakeups import WakeupScheduler
+
+logger = logging.getLogger(__name__)
+
+_DUE_SQL = """
+SELECT id, order_seq, COALESCE(scheduled_at, created_at) AS due_at
+FROM jobs
+WHERE status = 'queued'
+  AND (scheduled_at IS NULL OR scheduled_at <= :now)
+  {incremental}
+ORDER BY order_seq
+LIMIT :limit
+FOR UPDATE SKIP LOCKED
+"""
+
+_INCREMENTAL_SQL = "AND (scheduled_at > :due_after OR order_seq > :after_seq)"
+
+
+class BuilderTick(NamedTuple):
+    """What a builder tick did.
+
+    ``lag`` is the longest time in seconds an instantiated job waited past
+    its due time (``scheduled_at``, else ``created_at``); ``batch_seconds``
+    holds the wall time of each batch transaction. A tick that stopped at
+    ``max_batches`` is not ``drained`` and keeps its watermarks.
+    """
+
+    jobs: int
+    batches: int
+    lag: float
+    batch_seconds: tuple[float, ...]
+    full_scan: bool
+    drained: bool
+
+
+class Builder:
+    """Instantiate due jobs in bounded, lock-skipping batches.
+
+    Parameters
+    ----------
+    engine:
+        Engine to use, defaults to :data:`accscore.db.engine`.
+    batch_size:
+        Jobs locked and instantiated per transaction.
+    max_batches:
+        Upper bound of batches per tick; the rest is left for the next tick.
+    tick_interval:
+        Seconds between ticks in :meth:`run`.
+    full_scan_every:
+        Run the full due-job scan every this many ticks.
+    wake_planner:
+        Run this planner after every tick in :meth:`run` to wake nodes for
+        upcoming work.
+    scheduler:
+        Tick as soon as a job's ``scheduled_at`` is reached instead of at
+        the next ``tick_interval``.
+    """
+
+    def __init__(
+        self,
+        *,
+        engine: Engine | None = None,
+        batch_size: int = 500,
+        max_batches: int = 20,
+        tick_interval: float = 5.0,
+        full_scan_every: int = 60,
+        wake_planner: WakePlanner | None = None,
+        scheduler: WakeupScheduler | None = None,
+    ) -> None:
+        if batch_size <= 0 or max_batches <= 0 or full_scan_every <= 0:
+            raise ValueError(
+                "batch_size, max_batches and full_scan_every must be positive"
+            )
+        self.engine = engine or db.engine
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.tick_interval = tick_interval
+        self.full_scan_every = full_scan_every
+        self.wake_planner = wake_planner
+        self.scheduler = scheduler
+
+        self.due_after: datetime | None = None
+        self.after_seq: int | None = None
+        self._ticks = 0
+        self._full_pending = True
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def tick(self, now: datetime | None = None) -> BuilderTick:
+        """Instantiate jobs that became due up to ``now``, by default UTC now.
+
+        The due-job scan locks rows, so SQLite engines raise
+        :class:`~accscore.db.sqlite.UnsupportedBackendError`.
+        """
+        if sqlite.is_sqlite(self.engine):
+            raise sqlite.UnsupportedBackendError("the builder")
+        now = now or datetime.now(UTC)
+        if self._ticks % self.full_scan_every == 0:
+            self._full_pending = True
+        self._ticks += 1
+        full_scan = self._full_pending or self.due_after is None
+
+        if full_scan:
+            sql = statement(_DUE_SQL.format(incremental=""))
+            params = {"now": now, "limit": self.batch_size}
+        else:
+            sql = statement(_DUE_SQL.format(incremental=_INCREMENTAL_SQL))
+            params = {
+                "now": now,
+                "limit": self.batch_size,
+                "due_after": self.due_after,
+                "after_seq": self.after_seq or 0,
+            }
+
+        jobs = 0
+        lag = 0.0
+        max_seq = self.after_seq
+        batch_seconds: list[float] = []
+        drained = False
+        while len(batch_seconds) < self.max_batches:
+            started = time.perf_counter()
+            with self.engine.begin() as conn:
+                rows = conn.execute(sql, params).all()
+                instantiate_jobs([row.id for row in rows], conn=conn)
+            if not rows:
+                drained = True
+                break
+            batch_seconds.append(time.perf_counter() - started)
+            jobs += len(rows)
+            lag = max(lag, *((now - row.due_at).total_seconds() for row in rows))
+            max_seq = max(max_seq or 0, *(row.order_seq for row in rows))
+            if len(rows) < self.batch_size:
+                drained = True
+                break
+
+        if drained:
+            self.due_after = now
+            self.after_seq = max_seq
+            if full_scan:
+                self._full_pending = False
+
+        result = BuilderTick(
+            jobs, len(batch_seconds), lag, tuple(batch_seconds), full_scan, drained
+        )
+        if jobs:
+            logger.info(
+                "instantiated %d jobs in %d batches (%.3fs), max lag %.1fs%s",
+                jobs,
+                result.batches,
+                sum(batch_seconds),
+                lag,
+                "" if drained else ", backlog remains",
+            )
+        return result
+
+    def stop(self) -> None:
+        """Ask :meth:`run` to return after the current tick; safe from any thread."""
+        self._stopping.set()
+        self._wakeup.set()
+
+    def wake(self) -> None:
+        """Tick right away instead of after ``tick_interval``; safe from any thread."""
+        self._wakeup.set()
+
+    def install_signal_handlers(self) -> None:
+        """Stop gracefully on ``SIGTERM`` and ``SIGINT`` (main thread only)."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self.stop())
+
+    def run(self) -> None:
+        """Tick until :meth:`stop` is called.
+
+        A tick that left a backlog is followed by the next one right away.
+        """
+        if self.scheduler is not None:
+            self.scheduler.subscribe(self.wake)
+        try:
+            self._run()
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.unsubscribe(self.wake)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                result = self.tick()
+            except sqlite.UnsupportedBackendError:
+                raise
+            except Exception:
+                logger.exception("builder tick failed")
+                result = None
+            if self.wake_planner is not None:
+                try:
+                    self.wake_planner.tick()
+                except Exception:
+                    logger.exception("wake planning failed")
+            if result is None or result.drained:
+                self._wakeup.wait(self.tick_interval)
+
+
+__all__ = ["Builder", "BuilderTick"]
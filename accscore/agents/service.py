@@ -0,0 +1,486 @@
+"""Service agent runtime: claim, run and report tasks of one service.
+
+A :class:`ServiceAgent` runs task handlers in a thread or process pool sized
+from the node's ``max_concurrency`` for the service. It claims as many tasks
+as it has free slots and claims again as soon as a handler returns instead of
+sleeping a fixed interval. Handlers report progress and events through their
+:class:`TaskContext`; the agent buffers these and writes them in one
+transaction per flush, together with ``running``/``done``/``error``
+transitions. Leases are renewed in bulk alongside the node heartbeat.
+
+A flush that fails, e.g. while the database or object storage is down,
+keeps its reports and finished tasks and is retried with exponential backoff.
+Failed claims are retried the same way. A failed lease renewal keeps the
+leases and is retried well within the lease TTL; a task is only abandoned
+once its lease is reported lost.
+
+On :meth:`ServiceAgent.stop` the agent stops claiming, hands claims whose
+handler has not started back to the queue, and waits for running handlers
+before the final flush.
+
+Example::
+
+    def render(ctx: TaskContext) -> dict:
+        ctx.progress(50)
+        return {"frames": 240}
+
+    ServiceAgent("renderer", "gpu1", render).run()
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Literal
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .. import codec, db
+from ..affinity import NodeAffinity
+from ..db.events import log_events
+from ..db.leases import DEFAULT_LEASE_TTL, LeaseLostError, release_tasks, renew_leases
+from ..db.statements import statement
+from ..ordering import OrderingPolicy
+from ..schema import Node
+from .wakeups import WakeupScheduler
+
+logger = logging.getLogger(__name__)
+
+TaskHandler = Callable[["TaskContext"], dict[str, Any] | None]
+
+# Upper bound in seconds of the delay between retries of a failing flush or claim.
+MAX_FLUSH_BACKOFF = 30.0
+
+
+@dataclass
+class TaskContext:
+    """What a handler gets to see of its task.
+
+    The context is picklable so that it can be handed to process pools;
+    reports are queued and written by the agent.
+    """
+
+    task: dict[str, Any]
+    source: str
+    _reports: Any = field(repr=False)
+    _cancelled: Any = field(repr=False)
+
+    @property
+    def task_id(self) -> str:
+        """Id of the task."""
+        return str(self.task["id"])
+
+    @property
+    def params(self) -> dict[str, Any]:
+        """The task's ``params``."""
+        return self.task.get("params") or {}
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the agent lost the task's lease; the handler should give up."""
+        return self._cancelled.is_set()
+
+    def progress(self, percent: float) -> None:
+        """Report task progress in percent; only the latest value is written."""
+        self._reports.put(("progress", self.task_id, float(percent)))
+
+    def event(
+        self,
+        message: str,
+        *,
+        level: str = "info",
+        type: str = "log",
+        data: dict[str, Any] | None = None,
+    ) -> None:
+        """Queue a ``task_events`` row for this task."""
+        self._reports.put(
+            (
+                "event",
+                self.task_id,
+                {
+                    "job_id": str(self.task["job_id"]),
+                    "job_task_id": self.task_id,
+                    "source": self.source,
+                    "level": level,
+                    "type": type,
+                    "message": message,
+                    "data": data,
+                },
+            )
+        )
+
+
+def _execute(handler: TaskHandler, ctx: TaskContext) -> dict[str, Any] | None:
+    """Pool entry point: announce the start, then run the handler."""
+    ctx._reports.put(("running", ctx.task_id, None))
+    return handler(ctx)
+
+
+@dataclass
+class _Slot:
+    task: dict[str, Any]
+    lease_token: int
+    future: Future
+    cancelled: Any
+
+
+class ServiceAgent:
+    """Run a service's tasks on this node.
+
+    Parameters
+    ----------
+    service:
+        Service name as used in ``job_tasks.service_name``.
+    node:
+        The node (model or ``nodes.name``). Its ``max_concurrency`` for the
+        service sizes the pool unless ``max_workers`` is given.
+    handler:
+        Callable receiving a :class:`TaskContext` and returning the task
+        results. Exceptions mark the task as errored. With
+        ``executor="process"`` it must be picklable.
+    engine:
+        Engine to use, defaults to :data:`accscore.db.engine`.
+    executor:
+        ``"thread"`` or ``"process"`` pool.
+    max_workers:
+        Pool size override.
+    lease_ttl:
+        Lease duration of claims; leases are renewed every third of it.
+    flush_interval:
+        Seconds between writes of buffered progress and events.
+    poll_interval:
+        Seconds between claim attempts while the queue is empty.
+    ordering, affinity:
+        Passed on to :func:`accscore.db.claim_tasks`.
+    scheduler:
+        Wake up to claim as soon as a delayed retry of the service is due,
+        so ``poll_interval`` can be long.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        node: Node | str,
+        handler: TaskHandler,
+        *,
+        engine: Engine | None = None,
+        executor: Literal["thread", "process"] = "thread",
+        max_workers: int | None = None,
+        lease_ttl: timedelta = DEFAULT_LEASE_TTL,
+        flush_interval: float = 0.5,
+        poll_interval: float = 5.0,
+        ordering: OrderingPolicy | None = None,
+        affinity: NodeAffinity | None = None,
+        scheduler: WakeupScheduler | None = None,
+    ) -> None:
+        if executor not in ("thread", "process"):
+            raise ValueError(f"invalid executor: {executor!r}")
+        self.service = service
+        self.node = node.name if isinstance(node, Node) else node
+        self.handler = handler
+        self.engine = engine or db.engine
+        self.executor = executor
+        self.lease_ttl = lease_ttl
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.ordering = ordering
+        self.affinity = affinity
+        self.scheduler = scheduler
+        self.source = f"agent:{service}"
+        if max_workers is None and isinstance(node, Node):
+            max_workers = node.max_concurrency.get(service)
+        self.max_workers = max_workers
+
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._slots: dict[str, _Slot] = {}
+        self._workers = 0  # max_workers once resolved by run()
+        self._manager: Any = None
+        self._reports: Any = None
+        self._next_claim = 0.0
+        self._next_flush = 0.0
+        self._next_renew = 0.0
+        self._flush_failures = 0
+        self._claim_failures = 0
+        self._renew_failures = 0
+        # reports drained but not written yet
+        self._started: list[str] = []
+        self._progress: dict[str, float] = {}
+        self._events: list[dict[str, Any]] = []
+
+    # -- public API -----------------------------------------------------
+
+    def stop(self) -> None:
+        """Ask :meth:`run` to shut down gracefully; safe from any thread."""
+        self._stopping.set()
+        self._wakeup.set()
+
+    def wake(self) -> None:
+        """Claim right away instead of at the next poll; safe from any thread."""
+        self._next_claim = 0.0
+        self._wakeup.set()
+
+    def install_signal_handlers(self) -> None:
+        """Stop gracefully on ``SIGTERM`` and ``SIGINT`` (main thread only)."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self.stop())
+
+    def run(self, *, stop_when_idle: bool = False) -> None:
+        """Claim and run tasks until :meth:`stop` is called.
+
+        With ``stop_when_idle`` the agent also returns once nothing is
+        running and a claim came back empty, e.g. for batch jobs and tests.
+        """
+        if self.max_workers is None:
+            self.max_workers = self._node_capacity()
+        self._workers = self.max_workers
+        pool = self._open_pool()
+        if self.scheduler is not None:
+            self.scheduler.subscribe(self.wake, self.service)
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.clear()
+                claimed = self._claim(pool)
+                self._tick()
+                if stop_when_idle and not self._slots and claimed == 0:
+                    break
+                self._wakeup.wait(self._timeout())
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.unsubscribe(self.wake, self.service)
+            self._shutdown(pool)
+
+    # -- internals --------------------------------------------------------
+
+    def _node_capacity(self) -> int:
+        with self.engine.connect() as conn:
+            limits = conn.execute(
+                statement("SELECT max_concurrency FROM nodes WHERE name = :node"),
+                {"node": self.node},
+            ).scalar()
+        if isinstance(limits, str):
+            limits = codec.loads(limits)
+        return max(1, int((limits or {}).get(self.service) or 1))
+
+    def _open_pool(self) -> Executor:
+        if self.executor == "process":
+            self._manager = multiprocessing.Manager()
+            self._reports = self._manager.Queue()
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        self._reports = queue.SimpleQueue()
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=f"accscore-{self.service}"
+        )
+
+    def _new_event(self) -> Any:
+        return self._manager.Event() if self._manager is not None else threading.Event()
+
+    def _timeout(self) -> float:
+        now = time.monotonic()
+        deadlines = [self._next_flush, self._next_renew]
+        if len(self._slots) < self._workers:
+            deadlines.append(self._next_claim)
+        return max(0.0, min(deadlines) - now)
+
+    def _backoff(self, failures: int) -> float:
+        return min(self.flush_interval * 2**failures, MAX_FLUSH_BACKOFF)
+
+    def _claim(self, pool: Executor) -> int:
+        free = self._workers - len(self._slots)
+        now = time.monotonic()
+        if free <= 0 or now < self._next_claim:
+            return -1
+        try:
+            with Session(self.engine) as session, session.begin():
+                tasks = db.claim_tasks(
+                    session,
+                    self.service,
+                    free,
+                    self.node,
+                    ordering=self.ordering,
+                    affinity=self.affinity,
+                    lease_ttl=self.lease_ttl,
+                )
+        except Exception:
+            self._claim_failures += 1
+            backoff = self._backoff(self._claim_failures)
+            logger.exception("claim failed; retrying in %.1fs", backoff)
+            self._next_claim = now + backoff
+            return -1
+        self._claim_failures = 0
+        for task in tasks:
+            cancelled = self._new_event()
+            ctx = TaskContext(task, self.source, self._reports, cancelled)
+            future = pool.submit(_execute, self.handler, ctx)
+            future.add_done_callback(lambda _: self._wakeup.set())
+            self._slots[str(task["id"])] = _Slot(
+                task, task["lease_token"], future, cancelled
+            )
+        if len(tasks) < free:
+            # the queue is drained; completions still wake the loop earlier
+            self._next_claim = time.monotonic() + self.poll_interval
+        return len(tasks)
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        finished = any(slot.future.done() for slot in self._slots.values())
+        if (finished and not self._flush_failures) or now >= self._next_flush:
+            try:
+                self._flush()
+            except Exception:
+                self._flush_failures += 1
+                backoff = self._backoff(self._flush_failures)
+                logger.exception("flush failed; retrying in %.1fs", backoff)
+                self._next_flush = now + backoff
+            else:
+                self._flush_failures = 0
+                self._next_flush = now + self.flush_interval
+        if now >= self._next_renew:
+            self._tick_renew(now)
+
+    def _tick_renew(self, now: float) -> None:
+        ttl = self.lease_ttl.total_seconds()
+        try:
+            self._renew()
+        except Exception:
+            # keep the leases: retry often enough to renew before they expire
+            self._renew_failures += 1
+            delay = min(self._backoff(self._renew_failures), ttl / 6)
+            logger.exception("lease renewal failed; retrying in %.1fs", delay)
+            self._next_renew = now + delay
+        else:
+            self._renew_failures = 0
+            self._next_renew = now + ttl / 3
+
+    def _drain_reports(self) -> None:
+        """Move queued reports to the buffers written by the next flush."""
+        while True:
+            try:
+                kind, task_id, payload = self._reports.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "running":
+                self._started.append(task_id)
+            elif kind == "progress":
+                self._progress[task_id] = payload
+            else:
+                self._events.append(payload)
+
+    def _flush(self) -> None:
+        """Write buffered reports and finished tasks in one transaction.
+
+        If the transaction fails the buffers and finished slots are kept for
+        the next attempt.
+        """
+        finished = {
+            task_id: slot for task_id, slot in self._slots.items() if slot.future.done()
+        }
+        self._drain_reports()
+        started, progress, events = self._started, self._progress, self._events
+        if not (finished or started or progress or events):
+            return
+
+        with Session(self.engine) as session, session.begin():
+            for task_id in started:
+                if task_id in self._slots:
+                    self._fenced(db.mark_task_running, session, task_id)
+            for task_id, percent in progress.items():
+                if task_id in self._slots:
+                    self._fenced(db.update_task_progress, session, task_id, percent)
+            if events:
+                log_events(events, conn=session.connection())
+            for task_id, slot in finished.items():
+                error = slot.future.exception()
+                if error is None:
+                    self._fenced(
+                        db.mark_task_done, session, task_id, slot.future.result()
+                    )
+                else:
+                    self._fenced(
+                        db.mark_task_error,
+                        session,
+                        task_id,
+                        type(error).__name__,
+                        str(error),
+                    )
+        self._started, self._progress, self._events = [], {}, []
+        for task_id in finished:
+            del self._slots[task_id]
+
+    def _fenced(
+        self,
+        transition: Callable[..., None],
+        session: Session,
+        task_id: str,
+        *args: Any,
+    ) -> None:
+        try:
+            transition(
+                session, task_id, *args, lease_token=self._slots[task_id].lease_token
+            )
+        except LeaseLostError:
+            logger.warning(
+                "lease on task %s was taken over; dropping its report", task_id
+            )
+
+    def _renew(self) -> None:
+        leases = {task_id: slot.lease_token for task_id, slot in self._slots.items()}
+        with Session(self.engine) as session, session.begin():
+            conn = session.connection()
+            conn.execute(
+                statement(
+                    "UPDATE nodes SET last_seen = CURRENT_TIMESTAMP WHERE name = :node"
+                ),
+                {"node": self.node},
+            )
+            kept = renew_leases(leases, conn=conn, ttl=self.lease_ttl)
+        for task_id in leases.keys() - kept:
+            logger.warning("lost the lease on task %s", task_id)
+            self._slots[task_id].cancelled.set()
+
+    def _release_unstarted(self) -> None:
+        unstarted = {
+            task_id: slot.lease_token
+            for task_id, slot in self._slots.items()
+            if slot.future.cancel()
+        }
+        if not unstarted:
+            return
+        for task_id in unstarted:
+            del self._slots[task_id]
+        try:
+            with Session(self.engine) as session, session.begin():
+                release_tasks(unstarted, conn=session.connection())
+        except Exception:
+            logger.exception(
+                "releasing %d unstarted tasks failed; they are requeued once"
+                " their leases expire",
+                len(unstarted),
+            )
+
+    def _shutdown(self, pool: Executor) -> None:
+        try:
+            self._release_unstarted()
+            while self._slots:
+                self._wakeup.clear()
+                self._tick()
+                if self._slots:
+                    self._wakeup.wait(self._timeout())
+            self._flush()
+        finally:
+            pool.shutdown(wait=True)
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+
+__all__ = ["ServiceAgent", "TaskContext", "TaskHandler"]
@@ -0,0 +1,251 @@
+"""Wake claim and builder loops when delayed work becomes due.
+
+A task retried with a backoff or a job submitted with ``scheduled_at`` is
+only picked up when its agent or builder next polls, so delays get rounded
+up to the poll interval while the loops query the database for nothing in
+between. A :class:`WakeupScheduler` loads the due times within ``horizon``
+with :mod:`accscore.db.timers` into an in-memory heap and calls the
+subscribed loops' wake-up callbacks the moment a time is reached, so the
+loops can poll rarely and still start delayed work on time.
+
+Refreshes are incremental like the builder's ticks: every
+``refresh_interval`` seconds only the slice of the window not loaded yet and
+the times of rows written since the previous refresh are read. Every
+``full_refresh_every`` refreshes the heap is rebuilt from a full window scan,
+which drops times of rows that were claimed, rescheduled or deleted in the
+meantime and picks up writes that committed late. A stale time only causes
+one extra claim attempt. Processes that schedule retries themselves can
+:meth:`~WakeupScheduler.notify` the scheduler instead of waiting for the
+next refresh.
+
+Example::
+
+    scheduler = WakeupScheduler()
+    scheduler.start()
+    ServiceAgent(
+        "renderer", "gpu1", render, poll_interval=60, scheduler=scheduler
+    ).run()
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy.engine import Engine
+
+from .. import db
+from ..db.timers import DueTime, upcoming_attempts, upcoming_schedules
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[], None]
+
+
+class WakeupScheduler:
+    """Call wake-up callbacks when queued work becomes due.
+
+    Callbacks subscribed for a service fire at the ``next_attempt_at`` of
+    its queued tasks; callbacks subscribed without a service fire at the
+    ``scheduled_at`` of queued jobs.
+
+    Parameters
+    ----------
+    engine:
+        Engine to use, defaults to :data:`accscore.db.engine`.
+    horizon:
+        How far ahead due times are loaded.
+    refresh_interval:
+        Seconds between incremental refreshes in :meth:`run`.
+    full_refresh_every:
+        Rebuild the heap from a full window scan every this many refreshes.
+    limit:
+        Maximum due times read per query; the window is shortened to what
+        was read when the limit is hit.
+    clock_slack:
+        Margin subtracted from the previous refresh time when looking for
+        rows written since, covering clock differences with the database.
+    """
+
+    def __init__(
+        self,
+        *,
+        engine: Engine | None = None,
+        horizon: timedelta = timedelta(minutes=10),
+        refresh_interval: float = 15.0,
+        full_refresh_every: int = 20,
+        limit: int = 1000,
+        clock_slack: timedelta = timedelta(seconds=2),
+    ) -> None:
+        if full_refresh_every <= 0 or limit <= 0:
+            raise ValueError("full_refresh_every and limit must be positive")
+        self.engine = engine or db.engine
+        self.horizon = horizon
+        self.refresh_interval = refresh_interval
+        self.full_refresh_every = full_refresh_every
+        self.limit = limit
+        self.clock_slack = clock_slack
+
+        self._lock = threading.Lock()
+        self._heap: list[tuple[datetime, str]] = []
+        self._pending: set[tuple[datetime, str]] = set()
+        self._subscribers: dict[str | None, list[Callback]] = {}
+        self._loaded_until: datetime | None = None
+        self._refreshed_at: datetime | None = None
+        self._refreshes = 0
+        self._full_pending = True
+        self._changed = threading.Event()
+        self._stopping = threading.Event()
+
+    # heap entries use "" for jobs so that equal due times stay comparable
+    @staticmethod
+    def _target(service: str | None) -> str:
+        return "" if service is None else f"service:{service}"
+
+    def subscribe(self, callback: Callback, service: str | None = None) -> None:
+        """Call ``callback`` when a task of ``service`` is due, a job if ``None``."""
+        with self._lock:
+            self._subscribers.setdefault(service, []).append(callback)
+            self._full_pending = True
+        self._changed.set()
+
+    def unsubscribe(self, callback: Callback, service: str | None = None) -> None:
+        """Stop calling ``callback``."""
+        with self._lock:
+            callbacks = self._subscribers.get(service, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(service, None)
+
+    def notify(self, due_at: datetime, service: str | None = None) -> None:
+        """Add a due time written by this process; safe from any thread."""
+        with self._lock:
+            self._push(DueTime(due_at, service))
+        self._changed.set()
+
+    def _push(self, due: DueTime) -> None:
+        entry = (due.due_at, self._target(due.service))
+        if entry not in self._pending:
+            self._pending.add(entry)
+            heapq.heappush(self._heap, entry)
+
+    def next_due(self) -> datetime | None:
+        """Return the earliest pending due time."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def refresh(self, now: datetime | None = None) -> int:
+        """Load due times up to ``now + horizon``; return how many were read."""
+        now = now or datetime.now(UTC)
+        until = now + self.horizon
+        with self._lock:
+            services = sorted(s for s in self._subscribers if s is not None)
+            jobs = None in self._subscribers
+            if self._refreshes % self.full_refresh_every == 0:
+                self._full_pending = True
+            full = self._full_pending or self._loaded_until is None
+            self._full_pending = False
+            self._refreshes += 1
+            after = None if full else self._loaded_until
+            last = self._refreshed_at
+            since = None if full or last is None else last - self.clock_slack
+        if not services and not jobs:
+            return 0
+
+        window: dict[str, Any] = {
+            "now": now,
+            "until": until,
+            "after": after,
+            "changed_since": since,
+            "limit": self.limit,
+        }
+        loaded_until = until
+        read: list[DueTime] = []
+        with self.engine.connect() as conn:
+            batches = [upcoming_attempts(services, conn=conn, **window)]
+            if jobs:
+                batches.append(upcoming_schedules(conn=conn, **window))
+        for batch in batches:
+            read += batch
+            if len(batch) == self.limit:
+                # ties with the last time read may have been cut off
+                loaded_until = min(
+                    loaded_until, batch[-1].due_at - timedelta(microseconds=1)
+                )
+
+        with self._lock:
+            if full:
+                self._heap = [entry for entry in self._heap if entry[0] <= now]
+                heapq.heapify(self._heap)
+                self._pending = set(self._heap)
+            for due in read:
+                self._push(due)
+            self._loaded_until = max(loaded_until, after) if after else loaded_until
+            self._refreshed_at = now
+        logger.debug(
+            "%s refresh read %d due times up to %s",
+            "full" if full else "incremental",
+            len(read),
+            loaded_until,
+        )
+        return len(read)
+
+    def fire(self, now: datetime | None = None) -> int:
+        """Call the callbacks of everything due by ``now``; return how many ran."""
+        now = now or datetime.now(UTC)
+        targets = set()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                self._pending.discard(entry)
+                targets.add(entry[1])
+            callbacks = [
+                callback
+                for service, subscribed in self._subscribers.items()
+                if self._target(service) in targets
+                for callback in subscribed
+            ]
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("wake-up callback failed")
+        return len(callbacks)
+
+    def stop(self) -> None:
+        """Ask :meth:`run` to return; safe from any thread."""
+        self._stopping.set()
+        self._changed.set()
+
+    def start(self) -> threading.Thread:
+        """Run the scheduler in a daemon thread and return it."""
+        thread = threading.Thread(target=self.run, name="accscore-wakeups", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self) -> None:
+        """Refresh and fire until :meth:`stop` is called."""
+        next_refresh = 0.0
+        while not self._stopping.is_set():
+            self._changed.clear()
+            if time.monotonic() >= next_refresh:
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("loading due times failed")
+                next_refresh = time.monotonic() + self.refresh_interval
+            self.fire()
+            timeout = next_refresh - time.monotonic()
+            due = self.next_due()
+            if due is not None:
+                timeout = min(timeout, (due - datetime.now(UTC)).total_seconds())
+            self._changed.wait(max(0.0, timeout))
+
+
+__all__ = ["WakeupScheduler"]
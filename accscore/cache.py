@@ -0,0 +1,174 @@
+"""Node-local, content-addressed on-disk cache for object storage downloads."""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+_TMP_PREFIX = ".tmp-"
+_STALE_TMP_SEC = 3600
+
+
+@dataclass
+class CacheStats:
+    """Counters for a single :class:`ArtifactCache` instance."""
+
+    hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0
+    bytes_written: int = 0
+    evictions: int = 0
+
+
+class ArtifactCache:
+    """Size-capped LRU cache of object contents keyed by bucket, key and version.
+
+    ``version`` is the object's ETag or the ``TaskArtifact.checksum``, so a
+    changed object never serves stale bytes. Entries are written to a
+    temporary file and renamed into place, which makes them visible atomically
+    to other worker processes sharing ``root``. Eviction runs under an
+    exclusive ``flock`` and removes the least recently used entries (by mtime,
+    refreshed on every hit) until the cache is below ``max_bytes``.
+
+    Parameters
+    ----------
+    root:
+        Cache directory, created if missing.
+    max_bytes:
+        Upper bound for the total size of cached entries.
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int) -> None:
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._objects = self.root / "objects"
+        self._objects.mkdir(parents=True, exist_ok=True)
+        self._stats_lock = threading.Lock()
+        # re-check the total size once this many bytes were added locally
+        self._evict_every = max(1, max_bytes // 20)
+        self._added_since_check = 0
+
+    def _path(self, bucket: str, key: str, version: str) -> Path:
+        digest = hashlib.sha256(f"{bucket}\0{key}\0{version}".encode()).hexdigest()
+        return self._objects / digest[:2] / digest
+
+    def path(self, bucket: str, key: str, version: str) -> Path | None:
+        """Return the path of a cached entry without reading it, or ``None``."""
+        path = self._path(bucket, key, version)
+        return path if path.exists() else None
+
+    def get(self, bucket: str, key: str, version: str) -> bytes | None:
+        """Return cached bytes or ``None`` on a miss."""
+        path = self._path(bucket, key, version)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._stats_lock:
+                self.stats.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another process after we read it
+        with self._stats_lock:
+            self.stats.hits += 1
+            self.stats.bytes_saved += len(data)
+        return data
+
+    def put(self, bucket: str, key: str, version: str, data: bytes) -> Path:
+        """Store ``data`` atomically and return the entry path."""
+        path = self._path(bucket, key, version)
+        path.parent.mkdir(exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=path.parent, prefix=_TMP_PREFIX)
+        tmp = Path(name)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            tmp.replace(path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+        with self._stats_lock:
+            self.stats.bytes_written += len(data)
+            self._added_since_check += len(data)
+            check = self._added_since_check >= self._evict_every
+            if check:
+                self._added_since_check = 0
+        if check:
+            self.evict()
+        return path
+
+    def fetch(
+        self, bucket: str, key: str, version: str, loader: Callable[[], bytes]
+    ) -> bytes:
+        """Return cached bytes, calling ``loader`` and caching its result on a miss."""
+        data = self.get(bucket, key, version)
+        if data is None:
+            data = loader()
+            self.put(bucket, key, version, data)
+        return data
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        with (self.root / ".lock").open("a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        now = time.time()
+        entries = []
+        for shard in os.scandir(self._objects):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(_TMP_PREFIX):
+                    # leftovers of writers that crashed before the rename
+                    if now - st.st_mtime > _STALE_TMP_SEC:
+                        Path(entry.path).unlink(missing_ok=True)
+                    continue
+                entries.append((st.st_mtime, st.st_size, Path(entry.path)))
+        return entries
+
+    def size(self) -> int:
+        """Return the current total size of cached entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """Evict least recently used entries above ``max_bytes``; return count."""
+        with self._lock():
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+        with self._stats_lock:
+            self.stats.evictions += removed
+        return removed
+
+
+__all__ = ["ArtifactCache", "CacheStats"]
@@ -0,0 +1,119 @@
+"""JSON codec shared by the database helpers, the engine and payload storage.
+
+orjson is used when installed (``pip install accscore[fast]``), the standard
+library otherwise. Both backends encode the value types found in
+:mod:`accscore.schema` natively: ``UUID`` and ``datetime`` as strings,
+``Enum`` members as their value, pydantic models as their JSON dump, and
+``Decimal`` (``numeric`` columns) as float.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Callable, Mapping
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+from pydantic import BaseModel
+
+try:  # pragma: no cover - depends on the environment
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _default(obj: Any) -> Any:
+    """Encode values that neither backend handles on its own."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, set | frozenset):
+        return list(obj)
+    # only reached with the stdlib backend; orjson encodes these natively
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, datetime | date | time):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps_bytes(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=_default).encode()
+
+
+def _orjson_dumps_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+
+_BACKENDS: dict[str, tuple[Callable[[Any], bytes], Callable[[str | bytes], Any]]] = {
+    "json": (_stdlib_dumps_bytes, json.loads),
+}
+if orjson is not None:
+    _BACKENDS["orjson"] = (_orjson_dumps_bytes, orjson.loads)
+
+backend = "orjson" if orjson is not None else "json"
+_dumps_bytes, _loads = _BACKENDS[backend]
+
+
+def use_backend(name: str) -> None:
+    """Switch the process-wide backend to ``"orjson"`` or ``"json"``."""
+    global backend, _dumps_bytes, _loads
+    if name not in _BACKENDS:
+        raise ValueError(f"JSON backend {name!r} is not available")
+    backend = name
+    _dumps_bytes, _loads = _BACKENDS[name]
+
+
+class EncodedDict(dict):
+    """A dict carrying its encoded document, which :func:`dumps` reuses.
+
+    Built by :func:`encoded`; changing it afterwards leaves the document
+    stale.
+    """
+
+    __slots__ = ("document",)
+
+    document: bytes
+
+
+def encoded(obj: Mapping[str, Any], document: bytes) -> EncodedDict:
+    """Return ``obj`` as an :class:`EncodedDict` holding its ``document``."""
+    value = EncodedDict(obj)
+    value.document = document
+    return value
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Encode ``obj`` as compact UTF-8 JSON."""
+    if type(obj) is EncodedDict:
+        return obj.document
+    return _dumps_bytes(obj)
+
+
+def dumps(obj: Any) -> str:
+    """Encode ``obj`` as a compact JSON string."""
+    return dumps_bytes(obj).decode()
+
+
+def loads(data: str | bytes) -> Any:
+    """Decode a JSON document."""
+    return _loads(data)
+
+
+__all__ = [
+    "EncodedDict",
+    "backend",
+    "dumps",
+    "dumps_bytes",
+    "encoded",
+    "loads",
+    "use_backend",
+]
@@ -0,0 +1,248 @@
+"""Critical-path hints derived from a workflow's step DAG.
+
+For every step the compiler computes its *downstream depth*, the number of
+steps on the longest chain of dependents after it, and its *remaining work*,
+the estimated seconds from its start to the end of that chain. Step
+durations are the median of recent runs of the same step in any version of
+the workflow within a time window, with a default for steps without
+history.
+
+:func:`refresh_critical_path` stores the hints in ``workflows.critical_path``;
+task instantiation copies them to ``job_tasks.downstream_depth`` and
+``job_tasks.remaining_work``, where :class:`accscore.ordering.CriticalPathOrder`
+uses them to claim tasks on long chains first.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from datetime import UTC, datetime, timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy.engine import Connection
+
+from . import codec
+from .db.statements import statement
+from .schema import WorkflowStep
+
+DEFAULT_STEP_DURATION = 60.0
+
+# How far back historical_durations looks for finished runs.
+DEFAULT_HISTORY_WINDOW = timedelta(days=7)
+
+
+class CriticalPathHint(NamedTuple):
+    """Scheduling hint of one workflow step."""
+
+    depth: int
+    remaining: float
+
+
+def _topological_order(
+    steps: Sequence[WorkflowStep | Mapping[str, Any]],
+) -> tuple[list[str], dict[str, list[str]], dict[str, list[str]]]:
+    """Return the step keys in dependency order with both edge directions."""
+    depends_on: dict[str, list[str]] = {}
+    for step in steps:
+        if isinstance(step, WorkflowStep):
+            step = step.model_dump()
+        depends_on[step["key"]] = list(step.get("depends_on") or [])
+
+    dependents: dict[str, list[str]] = {key: [] for key in depends_on}
+    for key, deps in depends_on.items():
+        for dep in deps:
+            if dep not in dependents:
+                raise ValueError(f"step {key!r} depends on unknown step {dep!r}")
+            dependents[dep].append(key)
+
+    # Kahn's algorithm
+    pending = {key: len(deps) for key, deps in depends_on.items()}
+    order = [key for key, count in pending.items() if count == 0]
+    for key in order:
+        for child in dependents[key]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                order.append(child)
+    if len(order) != len(depends_on):
+        cyclic = sorted(key for key, count in pending.items() if count > 0)
+        raise ValueError(f"workflow steps contain a cycle through {cyclic}")
+    return order, depends_on, dependents
+
+
+def compile_critical_path(
+    steps: Sequence[WorkflowStep | Mapping[str, Any]],
+    durations: Mapping[str, float] | None = None,
+    default_duration: float = DEFAULT_STEP_DURATION,
+) -> dict[str, CriticalPathHint]:
+    """Compute the hint of every step of a workflow.
+
+    Raises :class:`ValueError` if a step depends on an unknown step or the
+    steps contain a cycle.
+
+    Parameters
+    ----------
+    steps:
+        Workflow steps as models or mappings with ``key`` and ``depends_on``.
+    durations:
+        Expected duration in seconds per step key.
+    default_duration:
+        Duration assumed for steps missing from ``durations``.
+    """
+    durations = durations or {}
+    order, _, dependents = _topological_order(steps)
+    # filled from the sinks backwards
+    hints: dict[str, CriticalPathHint] = {}
+    for key in reversed(order):
+        below = [hints[child] for child in dependents[key]]
+        hints[key] = CriticalPathHint(
+            depth=max((h.depth + 1 for h in below), default=0),
+            remaining=float(durations.get(key, default_duration))
+            + max((h.remaining for h in below), default=0.0),
+        )
+    return hints
+
+
+def earliest_starts(
+    steps: Sequence[WorkflowStep | Mapping[str, Any]],
+    durations: Mapping[str, float] | None = None,
+    default_duration: float = DEFAULT_STEP_DURATION,
+) -> dict[str, float]:
+    """Return the expected start of every step in seconds after the job starts.
+
+    Parameters and errors are those of :func:`compile_critical_path`.
+    """
+    durations = durations or {}
+    order, depends_on, _ = _topological_order(steps)
+    starts: dict[str, float] = {}
+    for key in order:
+        starts[key] = max(
+            (
+                starts[dep] + float(durations.get(dep, default_duration))
+                for dep in depends_on[key]
+            ),
+            default=0.0,
+        )
+    return starts
+
+
+def hint_durations(
+    steps: Sequence[WorkflowStep | Mapping[str, Any]],
+    hints: Mapping[str, CriticalPathHint | Mapping[str, float]],
+) -> dict[str, float]:
+    """Return the step durations that ``hints`` were compiled with.
+
+    Inverts :func:`compile_critical_path`: a step's remaining work is its
+    duration plus the largest remaining work among its dependents. ``hints``
+    may be in the stored layout of :func:`hints_to_json`; steps without a
+    hint are left out.
+    """
+    _, _, dependents = _topological_order(steps)
+    remaining = {
+        key: float(
+            hint.remaining if isinstance(hint, CriticalPathHint) else hint["remaining"]
+        )
+        for key, hint in hints.items()
+    }
+    return {
+        key: remaining[key]
+        - max(
+            (remaining[child] for child in children if child in remaining), default=0.0
+        )
+        for key, children in dependents.items()
+        if key in remaining
+    }
+
+
+def historical_durations(
+    workflow_id: str,
+    *,
+    conn: Connection,
+    sample: int = 200,
+    window: timedelta = DEFAULT_HISTORY_WINDOW,
+) -> dict[str, float]:
+    """Return the median duration in seconds per step key.
+
+    The ``sample`` most recently finished runs of each step across all
+    versions of the workflow are considered. Only tasks finished within
+    ``window`` are read, through the ``job_tasks (finished_at)`` index, so
+    the cost does not grow with the retained history.
+    """
+    rows = conn.execute(
+        statement(
+            """
+            SELECT task_key,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY seconds) AS median
+            FROM (
+              SELECT jt.task_key,
+                     extract(epoch FROM jt.finished_at - jt.started_at) AS seconds,
+                     row_number() OVER (
+                       PARTITION BY jt.task_key ORDER BY jt.finished_at DESC
+                     ) AS n
+              FROM job_tasks jt
+              JOIN jobs j ON j.id = jt.job_id
+              JOIN workflows w ON w.id = j.workflow_id
+              WHERE w.name = (SELECT name FROM workflows WHERE id = :workflow_id)
+                AND jt.status = 'done'
+                AND jt.started_at IS NOT NULL
+                AND jt.finished_at >= :since
+            ) runs
+            WHERE n <= :sample
+            GROUP BY task_key
+            """
+        ),
+        {
+            "workflow_id": str(workflow_id),
+            "sample": sample,
+            "since": datetime.now(UTC) - window,
+        },
+    )
+    return {row.task_key: float(row.median) for row in rows}
+
+
+def refresh_critical_path(
+    workflow_id: str,
+    *,
+    conn: Connection,
+    default_duration: float = DEFAULT_STEP_DURATION,
+) -> dict[str, CriticalPathHint]:
+    """Recompile a workflow's hints from history and store them.
+
+    Run it when a workflow is registered and periodically afterwards; tasks
+    instantiated later pick up the new estimates.
+    """
+    steps: Any = conn.execute(
+        statement("SELECT steps FROM workflows WHERE id = :workflow_id"),
+        {"workflow_id": str(workflow_id)},
+    ).scalar_one()
+    if isinstance(steps, str):
+        steps = codec.loads(steps)
+    hints = compile_critical_path(
+        steps or [], historical_durations(workflow_id, conn=conn), default_duration
+    )
+    conn.execute(
+        statement(
+            "UPDATE workflows SET critical_path = :hints, updated_at = now()"
+            " WHERE id = :workflow_id",
+            json=("hints",),
+        ),
+        {"workflow_id": str(workflow_id), "hints": hints_to_json(hints)},
+    )
+    return hints
+
+
+def hints_to_json(hints: Mapping[str, CriticalPathHint]) -> dict[str, dict[str, float]]:
+    """Return hints in the layout stored in ``workflows.critical_path``."""
+    return {key: hint._asdict() for key, hint in hints.items()}
+
+
+__all__ = [
+    "DEFAULT_HISTORY_WINDOW",
+    "DEFAULT_STEP_DURATION",
+    "CriticalPathHint",
+    "compile_critical_path",
+    "earliest_starts",
+    "hint_durations",
+    "hints_to_json",
+    "historical_durations",
+    "refresh_critical_path",
+]
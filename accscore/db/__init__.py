@@ -1,25 +1,62 @@
 """Database utilities using SQLAlchemy."""
 
 from contextlib import contextmanager
+from datetime import timedelta
 from typing import Any, Iterator, Optional
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection, Engine, make_url
 from sqlalchemy.orm import sessionmaker, Session
 
+from .. import codec
+from ..affinity import NodeAffinity
+from ..ordering import OrderingPolicy
+from ..payloads import offload_payload
 from ..settings import Settings
+from . import sqlite
+from .leases import DEFAULT_LEASE_TTL, LeaseLostError
+from .routing import ReplicaRouter, begin_read_only
+from .statements import connect_args, statement
+from .tasks import _runnable_select, _utcnow
+
+
+def _create_engine(dsn: str) -> Engine:
+    if make_url(dsn).get_backend_name() == "sqlite":
+        return sqlite.create_sqlite_engine(dsn)
+    return create_engine(
+        dsn,
+        future=True,
+        pool_pre_ping=True,
+        json_serializer=codec.dumps,
+        json_deserializer=codec.loads,
+        connect_args=connect_args(dsn, prepared=settings.db_prepared_statements),
+    )
 
 
 settings = Settings()
-engine: Engine = create_engine(settings.postgres_dsn, future=True, pool_pre_ping=True)
+engine: Engine = _create_engine(settings.postgres_dsn)
+router = ReplicaRouter(
+    engine,
+    [_create_engine(dsn) for dsn in settings.replica_dsns],
+    max_lag=timedelta(seconds=settings.db_replica_max_lag),
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 
 @contextmanager
-def session_scope() -> Iterator[Session]:
-    """Provide a transactional scope around a series of operations."""
-    session: Session = SessionLocal()
+def session_scope(readonly: bool = False) -> Iterator[Session]:
+    """Provide a transactional scope around a series of operations.
+
+    With ``readonly`` the session runs a read-only transaction on a replica
+    picked by :data:`router`, or on the primary when no replica is within
+    the allowed lag. Claims and task transitions need the default.
+    """
+    session: Session = (
+        SessionLocal(bind=router.read_engine()) if readonly else SessionLocal()
+    )
     try:
+        if readonly:
+            begin_read_only(session.connection())
         yield session
         session.commit()
     except Exception:
@@ -29,21 +66,40 @@ def session_scope() -> Iterator[Session]:
         session.close()
 
 
+@contextmanager
+def read_connection() -> Iterator[Connection]:
+    """Open a read-only transaction on a replica, or the primary as fallback."""
+    with router.read_engine().begin() as conn:
+        begin_read_only(conn)
+        yield conn
+
+
 def check_connection() -> bool:
     """Check database connectivity."""
     try:
         with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+            conn.execute(statement("SELECT 1"))
         return True
     except Exception:
         return False
 
 
 def claim_tasks(
-    session: Session, service: str, capacity: int, agent: str
+    session: Session,
+    service: str,
+    capacity: int,
+    agent: str,
+    ordering: OrderingPolicy | None = None,
+    affinity: NodeAffinity | None = None,
+    lease_ttl: timedelta = DEFAULT_LEASE_TTL,
 ) -> list[dict[str, Any]]:
     """Claim queued tasks for a service respecting global job order.
 
+    Tasks whose previous claim's lease expired are taken over in the same
+    pass. The returned rows carry the new ``lease_token`` that has to be
+    passed to :func:`accscore.db.leases.renew_leases` and the transition
+    helpers.
+
     Parameters
     ----------
     session:
@@ -54,29 +110,38 @@ def claim_tasks(
         Maximum number of tasks to claim.
     agent:
         Identifier of the claiming agent.
+    ordering:
+        Claim ordering policy, see :mod:`accscore.ordering`. Defaults to the
+        strict global job order.
+    affinity:
+        Optional node affinity; claimed tasks are also assigned to
+        ``affinity.node`` so that retries stick to it.
+    lease_ttl:
+        Lease duration; the agent must renew before it runs out.
     """
 
-    sql = text(
-        """
-        WITH c AS (
-          SELECT jt.id
-          FROM job_tasks jt
-          JOIN jobs j ON j.id = jt.job_id
-          WHERE jt.service_name = :service
-            AND jt.status = 'queued'
-            AND (jt.next_attempt_at IS NULL OR jt.next_attempt_at <= now())
-            AND NOT EXISTS (
-              SELECT 1 FROM job_tasks dep
-              WHERE dep.job_id = jt.job_id
-                AND dep.task_key = ANY(jt.depends_on)
-                AND dep.status <> 'done'
-            )
-          ORDER BY j.order_seq ASC, jt.created_at ASC, jt.id ASC
-          FOR UPDATE SKIP LOCKED
-          LIMIT :capacity
+    conn = session.connection()
+    if sqlite.is_sqlite(conn):
+        if affinity is not None:
+            raise sqlite.UnsupportedBackendError("node affinity")
+        return sqlite.claim_tasks(
+            service,
+            capacity,
+            agent,
+            conn=conn,
+            now=_utcnow(),
+            lease_ttl=lease_ttl,
+            ordering=ordering,
         )
+
+    select_sql, params = _runnable_select(ordering, affinity)
+    sql = statement(
+        f"""
+        WITH c AS ({select_sql})
         UPDATE job_tasks t
-        SET status='starting', claimed_by=:agent, claimed_at=now()
+        SET status='starting', claimed_by=:agent, claimed_at=now(),
+            assigned_node=COALESCE(:assigned_node, t.assigned_node),
+            lease_expires_at=:now + :lease_ttl, lease_token=t.lease_token + 1
         FROM c
         WHERE t.id = c.id
         RETURNING t.*
@@ -84,73 +149,297 @@ def claim_tasks(
     )
 
     result = session.execute(
-        sql, {"service": service, "capacity": capacity, "agent": agent}
+        sql,
+        {
+            **params,
+            "service": service,
+            "limit": capacity,
+            "agent": agent,
+            "assigned_node": affinity.node if affinity else None,
+            "now": _utcnow(),
+            "lease_ttl": lease_ttl,
+        },
     )
     return [dict(row) for row in result.mappings()]
 
 
 def instantiate_tasks(session: Session, job_id: str) -> None:
-    """Instantiate job tasks for a job from its workflow definition."""
-    sql = text(
+    """Instantiate job tasks for a job from its workflow definition.
+
+    Step weights are copied to the tasks and their sum to
+    ``jobs.progress_weight`` so that job progress can be maintained
+    incrementally by the transition helpers. Critical-path hints compiled
+    into ``workflows.critical_path`` are copied as well.
+    """
+    conn = session.connection()
+    if sqlite.is_sqlite(conn):
+        sqlite.instantiate_jobs([job_id], conn=conn, start=False)
+        return
+    sql = statement(
         """
-        INSERT INTO job_tasks (job_id, task_key, service_name, status, depends_on, params)
+        INSERT INTO job_tasks
+            (job_id, task_key, service_name, status, depends_on, params, weight,
+             downstream_depth, remaining_work)
         SELECT :job_id, s.key, s.service, 'queued', COALESCE(s.depends_on, '{}'),
-               COALESCE(s.default_params, '{}')
+               COALESCE(s.default_params, '{}'), COALESCE(s.weight, 1),
+               COALESCE((w.critical_path -> s.key ->> 'depth')::int, 0),
+               (w.critical_path -> s.key ->> 'remaining')::float8
         FROM workflows w,
              jsonb_to_recordset(w.steps) AS s(
                  key TEXT,
                  service TEXT,
                  depends_on TEXT[],
-                 default_params JSONB
+                 default_params JSONB,
+                 weight NUMERIC
              )
         WHERE w.id = (SELECT workflow_id FROM jobs WHERE id = :job_id)
+        ON CONFLICT (job_id, task_key) DO NOTHING
         """
     )
     session.execute(sql, {"job_id": job_id})
+    session.execute(
+        statement(
+            """
+            UPDATE jobs j
+            SET progress = COALESCE(j.progress, 0),
+                progress_weight = (
+                  SELECT COALESCE(sum(COALESCE((s->>'weight')::numeric, 1)), 0)
+                  FROM workflows w, jsonb_array_elements(w.steps) AS s
+                  WHERE w.id = j.workflow_id
+                )
+            WHERE j.id = :job_id
+            """
+        ),
+        {"job_id": job_id},
+    )
+
+
+# Job progress is the weighted mean of task progress. Transitions add their
+# task's weighted delta instead of re-aggregating all tasks of the job; the
+# fallback covers jobs instantiated before ``progress_weight`` existed.
+_JOB_PROGRESS_SQL = """LEAST(100, GREATEST(0,
+      COALESCE(j.progress, 0) + t.delta / NULLIF(COALESCE(
+        j.progress_weight,
+        (SELECT sum(w.weight) FROM job_tasks w WHERE w.job_id = j.id)
+      ), 0)
+    ))"""
+
+# The statement snapshot still shows the finishing task as active, so it is
+# excluded explicitly; when nothing else is active the key stays on it.
+_NEXT_TASK_KEY_SQL = """COALESCE(
+      (SELECT o.task_key FROM job_tasks o
+       WHERE o.job_id = j.id AND o.id <> t.id AND o.status IN ('starting', 'running')
+       ORDER BY o.started_at DESC NULLS LAST
+       LIMIT 1),
+      t.task_key
+    )"""
+
 
+# Transitions given a fencing token only apply while the caller still holds
+# the task's lease; ``None`` skips the check.
+_FENCE_SQL = "(CAST(:lease_token AS bigint) IS NULL OR lease_token = :lease_token)"
 
-def mark_task_running(session: Session, task_id: str) -> None:
-    """Mark a task as running and set start timestamp."""
-    sql = text(
-        "UPDATE job_tasks SET status='running', started_at=COALESCE(started_at, now()) WHERE id=:task_id"
+
+def _check_fence(matched: int, task_id: str, lease_token: int | None) -> None:
+    if lease_token is not None and not matched:
+        raise LeaseLostError(
+            f"lease on task {task_id} is no longer held by token {lease_token}"
+        )
+
+
+def _lock_fenced_task(conn: Connection, task_id: str, lease_token: int | None) -> None:
+    """Lock the task row; raise :class:`LeaseLostError` if the fence fails."""
+    if lease_token is None:
+        return
+    # SQLite transactions already hold the write lock
+    lock = "" if sqlite.is_sqlite(conn) else " FOR UPDATE"
+    matched = conn.execute(
+        statement(f"SELECT 1 FROM job_tasks WHERE id=:task_id AND {_FENCE_SQL}{lock}"),
+        {"task_id": str(task_id), "lease_token": lease_token},
+    ).first()
+    _check_fence(0 if matched is None else 1, task_id, lease_token)
+
+
+def mark_task_running(
+    session: Session, task_id: str, lease_token: int | None = None
+) -> None:
+    """Mark a task as running and make it the job's current task.
+
+    Raises :class:`~accscore.db.leases.LeaseLostError` when ``lease_token``
+    is given and no longer matches the task.
+    """
+    conn = session.connection()
+    if sqlite.is_sqlite(conn):
+        matched = sqlite.mark_task_running(task_id, conn=conn, lease_token=lease_token)
+        _check_fence(matched, task_id, lease_token)
+        return
+    sql = statement(
+        f"""
+        WITH t AS (
+          UPDATE job_tasks
+          SET status='running', started_at=COALESCE(started_at, now()), updated_at=now()
+          WHERE id=:task_id AND {_FENCE_SQL}
+          RETURNING job_id, task_key
+        )
+        UPDATE jobs j
+        SET current_task_key=t.task_key, started_at=COALESCE(j.started_at, now()),
+            updated_at=now()
+        FROM t
+        WHERE j.id = t.job_id
+        """
     )
-    session.execute(sql, {"task_id": task_id})
+    result = conn.execute(sql, {"task_id": task_id, "lease_token": lease_token})
+    _check_fence(result.rowcount, task_id, lease_token)
 
 
-def update_task_progress(session: Session, task_id: str, percent: float) -> None:
-    """Update task progress percentage."""
-    sql = text(
-        "UPDATE job_tasks SET progress=:percent, updated_at=now() WHERE id=:task_id"
+def update_task_progress(
+    session: Session, task_id: str, percent: float, lease_token: int | None = None
+) -> None:
+    """Update task progress percentage and the job's weighted progress."""
+    conn = session.connection()
+    if sqlite.is_sqlite(conn):
+        matched = sqlite.update_task_progress(
+            task_id, percent, conn=conn, lease_token=lease_token
+        )
+        _check_fence(matched, task_id, lease_token)
+        return
+    sql = statement(
+        f"""
+        WITH old AS (
+          SELECT id, COALESCE(progress, 0) AS progress
+          FROM job_tasks WHERE id=:task_id AND {_FENCE_SQL}
+          FOR UPDATE
+        ), t AS (
+          UPDATE job_tasks jt
+          SET progress=:percent, updated_at=now()
+          FROM old
+          WHERE jt.id = old.id
+          RETURNING jt.job_id, jt.weight * (jt.progress - old.progress) AS delta
+        )
+        UPDATE jobs j
+        SET progress={_JOB_PROGRESS_SQL}, updated_at=now()
+        FROM t
+        WHERE j.id = t.job_id
+        """
     )
-    session.execute(sql, {"task_id": task_id, "percent": percent})
+    result = conn.execute(
+        sql, {"task_id": task_id, "percent": percent, "lease_token": lease_token}
+    )
+    _check_fence(result.rowcount, task_id, lease_token)
 
 
 def mark_task_done(
-    session: Session, task_id: str, results: Optional[dict[str, Any]] = None
+    session: Session,
+    task_id: str,
+    results: dict[str, Any] | None = None,
+    lease_token: int | None = None,
 ) -> None:
-    """Mark a task as done and optionally store results."""
-    sql = text(
-        "UPDATE job_tasks SET status='done', results=COALESCE(:results, results), finished_at=now() WHERE id=:task_id"
+    """Mark a task as done, optionally store results and roll up job progress.
+
+    Large ``results`` are offloaded to object storage, see
+    :mod:`accscore.payloads`.
+
+    With ``lease_token`` the transition is fenced: an agent whose lease was
+    taken over gets :class:`~accscore.db.leases.LeaseLostError` instead of
+    overwriting the new owner's task. The fence is checked, and the row
+    locked, before offloaded results are uploaded, so a lost lease leaves
+    no object behind.
+    """
+    conn = session.connection()
+    results = offload_payload(
+        results,
+        str(task_id),
+        before_upload=lambda: _lock_fenced_task(conn, task_id, lease_token),
+    )
+    if sqlite.is_sqlite(conn):
+        matched = sqlite.mark_task_done(
+            task_id, results, conn=conn, lease_token=lease_token
+        )
+        _check_fence(matched, task_id, lease_token)
+        return
+    sql = statement(
+        f"""
+        WITH old AS (
+          SELECT id, COALESCE(progress, 0) AS progress
+          FROM job_tasks WHERE id=:task_id AND {_FENCE_SQL}
+          FOR UPDATE
+        ), t AS (
+          UPDATE job_tasks jt
+          SET status='done', progress=100, results=COALESCE(:results, jt.results),
+              lease_expires_at=NULL, finished_at=now(), updated_at=now()
+          FROM old
+          WHERE jt.id = old.id
+          RETURNING jt.id, jt.job_id, jt.task_key,
+                    jt.weight * (100 - old.progress) AS delta
+        )
+        UPDATE jobs j
+        SET progress={_JOB_PROGRESS_SQL}, current_task_key={_NEXT_TASK_KEY_SQL},
+            updated_at=now()
+        FROM t
+        WHERE j.id = t.job_id
+        """,
+        json=("results",),
+    )
+    result = conn.execute(
+        sql,
+        {
+            "task_id": task_id,
+            "results": results,
+            "lease_token": lease_token,
+        },
     )
-    session.execute(sql, {"task_id": task_id, "results": results})
+    _check_fence(result.rowcount, task_id, lease_token)
 
 
 def mark_task_error(
-    session: Session, task_id: str, error_code: str, message: str
+    session: Session,
+    task_id: str,
+    error_code: str,
+    message: str,
+    lease_token: int | None = None,
 ) -> None:
-    """Mark a task as errored and store error info."""
-    sql = text(
-        """
-        UPDATE job_tasks
-        SET status='error', finished_at=now(),
-            results=jsonb_set(COALESCE(results, '{}'::jsonb), '{error}', to_jsonb(:error_info))
-        WHERE id=:task_id
+    """Mark a task as errored, store error info and update the current task.
+
+    ``lease_token`` fences the transition like in :func:`mark_task_done`.
+    """
+    conn = session.connection()
+    if sqlite.is_sqlite(conn):
+        matched = sqlite.mark_task_error(
+            task_id, error_code, message, conn=conn, lease_token=lease_token
+        )
+        _check_fence(matched, task_id, lease_token)
+        return
+    sql = statement(
+        f"""
+        WITH t AS (
+          UPDATE job_tasks
+          SET status='error', lease_expires_at=NULL, finished_at=now(),
+              updated_at=now(),
+              results=jsonb_set(
+                COALESCE(results, '{{}}'::jsonb), '{{error}}',
+                jsonb_build_object(
+                  'code', CAST(:code AS text), 'message', CAST(:message AS text)
+                )
+              )
+          WHERE id=:task_id AND {_FENCE_SQL}
+          RETURNING id, job_id, task_key
+        )
+        UPDATE jobs j
+        SET current_task_key={_NEXT_TASK_KEY_SQL}, updated_at=now()
+        FROM t
+        WHERE j.id = t.job_id
         """
     )
-    session.execute(
+    result = conn.execute(
         sql,
-        {"task_id": task_id, "error_info": {"code": error_code, "message": message}},
+        {
+            "task_id": task_id,
+            "code": error_code,
+            "message": message,
+            "lease_token": lease_token,
+        },
     )
+    _check_fence(result.rowcount, task_id, lease_token)
 
 
 def append_event(
@@ -163,10 +452,13 @@ def append_event(
     message: str = "",
     data: Optional[dict[str, Any]] = None,
 ) -> None:
-    """Insert a new event row."""
-    sql = text(
-        "INSERT INTO task_events (job_id, job_task_id, ts, source, level, type, message, data)"
-        " VALUES (:job_id, :job_task_id, now(), :source, :level, :type, :message, :data)"
+    """Insert a new event row; large ``data`` is offloaded to object storage."""
+    sql = statement(
+        "INSERT INTO task_events"
+        " (job_id, job_task_id, ts, source, level, type, message, data)"
+        " VALUES (:job_id, :job_task_id, CURRENT_TIMESTAMP, :source, :level, :type,"
+        " :message, :data)",
+        json=("data",),
     )
     session.execute(
         sql,
@@ -177,7 +469,7 @@ def append_event(
             "level": level,
             "type": type,
             "message": message,
-            "data": data or {},
+            "data": offload_payload(data or {}, str(job_id)),
         },
     )
 
@@ -195,10 +487,13 @@ def record_artifact(
     checksum: Optional[str] = None,
 ) -> None:
     """Insert artifact metadata."""
-    sql = text(
+    sql = statement(
         """
-        INSERT INTO task_artifacts (job_id, job_task_id, kind, bucket, key, size_bytes, content_type, checksum, created_at)
-        VALUES (:job_id, :job_task_id, :kind, :bucket, :key, :size, :content_type, :checksum, now())
+        INSERT INTO task_artifacts
+            (job_id, job_task_id, kind, bucket, key, size_bytes, content_type,
+             checksum, created_at)
+        VALUES (:job_id, :job_task_id, :kind, :bucket, :key, :size, :content_type,
+                :checksum, CURRENT_TIMESTAMP)
         """
     )
     session.execute(
@@ -218,10 +513,10 @@ def record_artifact(
 
 def maybe_finish_job(session: Session, job_id: str) -> None:
     """If all tasks are done or skipped, mark the job as finished."""
-    sql = text(
+    sql = statement(
         """
         UPDATE jobs
-        SET status='done', finished_at=now()
+        SET status='done', finished_at=CURRENT_TIMESTAMP
         WHERE id=:job_id
           AND NOT EXISTS (
             SELECT 1 FROM job_tasks WHERE job_id=:job_id AND status NOT IN ('done','skipped')
@@ -0,0 +1,303 @@
+"""Artifact metadata helpers backed by ``task_artifacts``."""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import tempfile
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any, BinaryIO, NamedTuple, cast
+
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Connection
+
+from .. import storage
+from ..schema import TaskArtifact
+from . import sqlite
+from .statements import statement
+
+_CHUNK_SIZE = 1024 * 1024
+_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+_ARTIFACT_COLUMNS = (
+    "job_id",
+    "job_task_id",
+    "kind",
+    "bucket",
+    "key",
+    "size_bytes",
+    "content_type",
+    "checksum",
+)
+
+# Fixed statement text for every batch size; see accscore.db.jobs.
+_INSERT_ARTIFACTS_SQL = f"""
+    INSERT INTO task_artifacts ({", ".join(_ARTIFACT_COLUMNS)}, created_at)
+    SELECT r.*, CURRENT_TIMESTAMP
+    FROM unnest(
+      CAST(:job_id AS uuid[]), CAST(:job_task_id AS uuid[]), CAST(:kind AS text[]),
+      CAST(:bucket AS text[]), CAST(:key AS text[]), CAST(:size_bytes AS bigint[]),
+      CAST(:content_type AS text[]), CAST(:checksum AS text[])
+    ) AS r
+"""
+
+_INSERT_ARTIFACT_SQLITE_SQL = f"""
+    INSERT INTO task_artifacts ({", ".join(_ARTIFACT_COLUMNS)}, created_at)
+    VALUES (
+        {", ".join(":" + column for column in _ARTIFACT_COLUMNS)}, CURRENT_TIMESTAMP
+    )
+"""
+
+ArtifactManifest = dict[str | None, dict[str, list[dict[str, Any]]]]
+
+
+class StoredArtifact(NamedTuple):
+    """Result of :func:`upload_artifact`."""
+
+    id: int
+    bucket: str
+    key: str
+    size_bytes: int
+    checksum: str
+    deduplicated: bool
+
+
+def _spool_and_hash(source: bytes | BinaryIO) -> tuple[BinaryIO, int, str]:
+    """Hash ``source`` while copying it into a rewindable spool file."""
+    if isinstance(source, bytes | bytearray):
+        checksum = "sha256:" + hashlib.sha256(source).hexdigest()
+        return io.BytesIO(source), len(source), checksum
+
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+    for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return cast(BinaryIO, spool), size, "sha256:" + digest.hexdigest()
+
+
+def find_artifact_by_checksum(
+    bucket: str, checksum: str, size: int, *, conn: Connection, lock: bool = False
+) -> dict[str, Any] | None:
+    """Return the oldest artifact row in ``bucket`` with this content, if any.
+
+    With ``lock`` the row is share-locked until the transaction ends, which
+    keeps :func:`accscore.retention.collect_artifacts` from purging it
+    meanwhile. SQLite write transactions are serialized anyway.
+    """
+    for_share = "\n        FOR SHARE" if lock and not sqlite.is_sqlite(conn) else ""
+    query = statement(
+        f"""
+        SELECT id, bucket, key, size_bytes, checksum
+        FROM task_artifacts
+        WHERE checksum = :checksum AND size_bytes = :size AND bucket = :bucket
+        ORDER BY id
+        LIMIT 1{for_share}
+        """
+    )
+    params = {"checksum": checksum, "size": size, "bucket": bucket}
+    row = conn.execute(query, params).mappings().first()
+    return dict(row) if row is not None else None
+
+
+def _object_exists(bucket: str, key: str) -> bool:
+    try:
+        storage.client.stat_object(bucket, key)
+        return True
+    except Exception:
+        return False
+
+
+def _insert_artifact(conn: Connection, **values: Any) -> int:
+    return conn.execute(
+        statement(
+            """
+            INSERT INTO task_artifacts
+                (job_id, job_task_id, kind, bucket, key, size_bytes, content_type,
+                 checksum, created_at)
+            VALUES
+                (:job_id, :job_task_id, :kind, :bucket, :key, :size, :content_type,
+                 :checksum, CURRENT_TIMESTAMP)
+            RETURNING id
+            """
+        ),
+        values,
+    ).scalar_one()
+
+
+def upload_artifact(
+    *,
+    job_id: str,
+    job_task_id: str | None = None,
+    kind: str,
+    bucket: str,
+    key: str,
+    source: bytes | BinaryIO,
+    content_type: str | None = None,
+    conn: Connection,
+) -> StoredArtifact:
+    """Upload an artifact unless identical content exists, then record it.
+
+    The content is hashed (SHA-256) while it is spooled, and ``task_artifacts``
+    is searched for an existing object in the same bucket with the same
+    checksum and size. When one is found and still present in object storage
+    the upload is skipped and the new row references the existing object's
+    key instead of ``key``. The reused row stays locked until ``conn``
+    commits, so artifact garbage collection either sees the new reference or
+    purges the old row first, in which case the content is uploaded again.
+
+    Parameters
+    ----------
+    job_id, job_task_id, kind:
+        Ownership and kind of the new ``task_artifacts`` row.
+    bucket, key:
+        Target location used when the content has to be uploaded.
+    source:
+        Artifact content as bytes or a readable binary stream.
+    content_type:
+        Optional MIME type stored with the object and the row.
+    conn:
+        Open SQLAlchemy connection.
+    """
+    spool, size, checksum = _spool_and_hash(source)
+    with spool:
+        existing = find_artifact_by_checksum(
+            bucket, checksum, size, conn=conn, lock=True
+        )
+        if existing is not None and _object_exists(bucket, existing["key"]):
+            key = existing["key"]
+            deduplicated = True
+        else:
+            storage.put_stream(bucket, key, spool, size, content_type=content_type)
+            deduplicated = False
+
+    artifact_id = _insert_artifact(
+        conn,
+        job_id=job_id,
+        job_task_id=job_task_id,
+        kind=kind,
+        bucket=bucket,
+        key=key,
+        size=size,
+        content_type=content_type,
+        checksum=checksum,
+    )
+    return StoredArtifact(artifact_id, bucket, key, size, checksum, deduplicated)
+
+
+def _artifact_values(artifact: TaskArtifact | Mapping[str, Any]) -> dict[str, Any]:
+    if isinstance(artifact, TaskArtifact):
+        artifact = artifact.model_dump(mode="json")
+    values = {column: artifact.get(column) for column in _ARTIFACT_COLUMNS}
+    for column in ("job_id", "job_task_id", "kind"):
+        if values[column] is not None:
+            values[column] = str(getattr(values[column], "value", values[column]))
+    return values
+
+
+def record_artifacts(
+    artifacts: Iterable[TaskArtifact | Mapping[str, Any]],
+    *,
+    conn: Connection,
+    batch_size: int = 500,
+) -> int:
+    """Insert many ``task_artifacts`` rows with one statement per batch.
+
+    Returns the number of rows inserted.
+
+    Parameters
+    ----------
+    artifacts:
+        :class:`~accscore.schema.TaskArtifact` models or mappings using the
+        same field names. ``id`` and ``created_at`` are assigned by the
+        database.
+    conn:
+        Open SQLAlchemy connection; the caller owns the transaction.
+    batch_size:
+        Rows per statement; on SQLite rows per ``executemany``.
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive")
+
+    on_sqlite = sqlite.is_sqlite(conn)
+    total = 0
+    batch: list[dict[str, Any]] = []
+
+    def flush() -> None:
+        if on_sqlite:
+            conn.execute(statement(_INSERT_ARTIFACT_SQLITE_SQL), batch)
+            return
+        conn.execute(
+            statement(_INSERT_ARTIFACTS_SQL, arrays=_ARTIFACT_COLUMNS),
+            {
+                column: [
+                    None if row[column] is None else str(row[column]) for row in batch
+                ]
+                for column in _ARTIFACT_COLUMNS
+            },
+        )
+
+    for artifact in artifacts:
+        batch.append(_artifact_values(artifact))
+        if len(batch) >= batch_size:
+            flush()
+            total += len(batch)
+            batch = []
+    if batch:
+        flush()
+        total += len(batch)
+    return total
+
+
+def artifact_manifest(
+    job_id: str,
+    *,
+    conn: Connection,
+    task_keys: Sequence[str] | None = None,
+    kinds: Sequence[str] | None = None,
+) -> ArtifactManifest:
+    """Return all artifacts of a job grouped by task key and kind.
+
+    A single query over the ``(job_id, job_task_id, kind)`` index replaces one
+    lookup per upstream task. Artifacts not attached to a task are grouped
+    under the ``None`` key.
+
+    Parameters
+    ----------
+    job_id:
+        Job whose artifacts to list.
+    conn:
+        Open SQLAlchemy connection.
+    task_keys:
+        Restrict the manifest to these tasks, e.g. a task's ``depends_on``.
+    kinds:
+        Restrict the manifest to these artifact kinds.
+    """
+    sql = """
+        SELECT jt.task_key, a.id, a.job_task_id, a.kind, a.bucket, a.key,
+               a.size_bytes, a.content_type, a.checksum, a.created_at
+        FROM task_artifacts a
+        LEFT JOIN job_tasks jt ON jt.id = a.job_task_id
+        WHERE a.job_id = :job_id
+    """
+    params: dict[str, Any] = {"job_id": job_id}
+    binds: list[Any] = []
+    if task_keys is not None:
+        sql += " AND jt.task_key IN :task_keys"
+        params["task_keys"] = list(task_keys)
+        binds.append(bindparam("task_keys", expanding=True))
+    if kinds is not None:
+        sql += " AND a.kind IN :kinds"
+        params["kinds"] = [str(getattr(k, "value", k)) for k in kinds]
+        binds.append(bindparam("kinds", expanding=True))
+    sql += " ORDER BY a.job_task_id, a.kind, a.id"
+
+    manifest: ArtifactManifest = {}
+    for row in conn.execute(statement(sql).bindparams(*binds), params).mappings():
+        entry = dict(row)
+        task_key = entry.pop("task_key")
+        manifest.setdefault(task_key, {}).setdefault(entry["kind"], []).append(entry)
+    return manifest
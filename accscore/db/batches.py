@@ -0,0 +1,237 @@
+"""Batch claims for services that process many compatible inputs at once.
+
+A service declares a :class:`BatchSpec`: tasks whose ``params`` share the
+value at ``key`` can run in one invocation, up to ``size`` tasks at a time.
+:func:`claim_batches` looks at the first ``lookahead`` runnable tasks in the
+claim order and groups them, so each batch is led by the oldest task of its
+group and global order is kept within that window. The whole group then
+finishes or fails together through :func:`mark_batch_done` and
+:func:`mark_batch_error`.
+
+The window is read without row locks; only the tasks of the chosen batches
+are locked, with ``SKIP LOCKED``, and claimed in one statement, so other
+claimers can take the rest of the window meanwhile. Tasks claimed by
+someone else between the read and the claim are left out of their batch.
+On SQLite the write lock of the claim transaction serializes claimers.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy.orm import Session
+
+from ..ordering import OrderingPolicy
+from . import mark_task_done, mark_task_error, sqlite
+from .leases import DEFAULT_LEASE_TTL
+from .statements import statement
+from .tasks import JobTaskRow, _get_capacity, _runnable_select, _utcnow
+
+# Locks the chosen tasks that are still claimable and claims them; rows taken
+# since the unlocked read are skipped.
+_CLAIM_BATCHES_SQL = """
+        WITH locked AS (
+            SELECT id
+            FROM job_tasks
+            WHERE id = ANY(:ids)
+              AND (status = 'queued'
+                   OR (status IN ('starting', 'running') AND lease_expires_at < :now))
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE job_tasks jt
+        SET claimed_by = :node,
+            assigned_node = :node,
+            status = 'starting',
+            claimed_at = :now,
+            lease_expires_at = :now + :lease_ttl,
+            lease_token = jt.lease_token + 1
+        FROM locked
+        WHERE jt.id = locked.id
+        RETURNING jt.*
+"""
+
+
+@dataclass(frozen=True)
+class BatchSpec:
+    """Batching declaration of a service.
+
+    Parameters
+    ----------
+    key:
+        Key in ``job_tasks.params`` whose value must match within a batch.
+        Tasks without it are claimed as batches of one.
+    size:
+        Maximum number of tasks per batch.
+    lookahead:
+        Number of runnable tasks, in claim order, considered for grouping.
+    """
+
+    key: str
+    size: int
+    lookahead: int = 100
+
+    def __post_init__(self) -> None:
+        if self.size <= 0 or self.lookahead <= 0:
+            raise ValueError("batch size and lookahead must be positive")
+
+
+class TaskBatch(NamedTuple):
+    """Claimed tasks sharing a batch key, in claim order."""
+
+    key: str | None
+    tasks: list[JobTaskRow]
+
+    @property
+    def task_ids(self) -> list[str]:
+        """Return the ids of the batch's tasks."""
+        return [str(task["id"]) for task in self.tasks]
+
+
+def _group(
+    rows: list[JobTaskRow], spec: BatchSpec, max_batches: int, capacity: int
+) -> list[tuple[str | None, list[JobTaskRow]]]:
+    """Group rows by batch key in order of each group's first row."""
+    groups: dict[Any, list[JobTaskRow]] = {}
+    for row in rows:
+        value = (row.get("params") or {}).get(spec.key)
+        group_key = ("key", str(value)) if value is not None else ("task", row["id"])
+        if group_key not in groups:
+            if len(groups) >= max_batches:
+                continue
+            groups[group_key] = []
+        if len(groups[group_key]) < spec.size:
+            groups[group_key].append(row)
+
+    batches = []
+    for (kind, value), tasks in groups.items():
+        tasks = tasks[:capacity]
+        capacity -= len(tasks)
+        if tasks:
+            batches.append((value if kind == "key" else None, tasks))
+    return batches
+
+
+def claim_batches(
+    session: Session,
+    service: str,
+    agent: str,
+    spec: BatchSpec,
+    max_batches: int = 1,
+    ordering: OrderingPolicy | None = None,
+    lease_ttl: timedelta = DEFAULT_LEASE_TTL,
+) -> list[TaskBatch]:
+    """Claim up to ``max_batches`` groups of runnable tasks for a service.
+
+    Returns the batches ordered by their leading task. The node concurrency
+    limit of the service bounds the total number of tasks. Tasks claimed by
+    another agent since the window was read are missing.
+
+    Parameters
+    ----------
+    session:
+        Open SQLAlchemy session.
+    service:
+        Name of the service to claim tasks for.
+    agent:
+        Identifier of the claiming agent.
+    spec:
+        The service's batching declaration.
+    max_batches:
+        Maximum number of batches to return.
+    ordering:
+        Claim ordering policy, see :mod:`accscore.ordering`.
+    lease_ttl:
+        Lease duration of every claimed task.
+    """
+    conn = session.connection()
+    now = _utcnow()
+    capacity = _get_capacity(service, spec.size * max_batches, conn=conn, now=now)
+    if capacity <= 0:
+        return []
+
+    if sqlite.is_sqlite(conn):
+        rows = sqlite.select_runnable(
+            service, spec.lookahead, conn=conn, now=now, ordering=ordering
+        )
+    else:
+        select_sql, params = _runnable_select(ordering, None, lock=False)
+        rows = [
+            dict(row)
+            for row in conn.execute(
+                statement(select_sql),
+                {**params, "service": service, "now": now, "limit": spec.lookahead},
+            ).mappings()
+        ]
+    grouped = _group(rows, spec, max_batches, capacity)
+    if not grouped:
+        return []
+
+    ids = [task["id"] for _, tasks in grouped for task in tasks]
+    if sqlite.is_sqlite(conn):
+        claimed_rows = sqlite.claim_ids(
+            ids, agent, conn=conn, now=now, lease_ttl=lease_ttl, assigned_node=agent
+        )
+    else:
+        claimed_rows = [
+            dict(row)
+            for row in conn.execute(
+                statement(_CLAIM_BATCHES_SQL),
+                {"node": agent, "now": now, "lease_ttl": lease_ttl, "ids": ids},
+            ).mappings()
+        ]
+    claimed = {str(row["id"]): row for row in claimed_rows}
+    batches = []
+    for key, tasks in grouped:
+        kept = [
+            claimed[str(task["id"])] for task in tasks if str(task["id"]) in claimed
+        ]
+        if kept:
+            batches.append(TaskBatch(key, kept))
+    return batches
+
+
+def mark_batch_done(
+    session: Session,
+    batch: TaskBatch,
+    results: Mapping[str, dict[str, Any]] | None = None,
+) -> None:
+    """Mark all tasks of a batch done, or none of them.
+
+    ``results`` maps task ids to their results. Every transition is fenced
+    with the task's lease token; if any lease was lost the savepoint is
+    rolled back and :class:`~accscore.db.leases.LeaseLostError` is raised.
+    """
+    results = results or {}
+    with session.begin_nested():
+        for task in batch.tasks:
+            task_id = str(task["id"])
+            mark_task_done(
+                session, task_id, results.get(task_id), lease_token=task["lease_token"]
+            )
+
+
+def mark_batch_error(
+    session: Session, batch: TaskBatch, error_code: str, message: str
+) -> None:
+    """Mark all tasks of a batch errored, or none of them."""
+    with session.begin_nested():
+        for task in batch.tasks:
+            mark_task_error(
+                session,
+                str(task["id"]),
+                error_code,
+                message,
+                lease_token=task["lease_token"],
+            )
+
+
+__all__ = [
+    "BatchSpec",
+    "TaskBatch",
+    "claim_batches",
+    "mark_batch_done",
+    "mark_batch_error",
+]
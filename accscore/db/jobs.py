@@ -1,15 +1,49 @@
 from __future__ import annotations
 
-import json
-from uuid import UUID
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from typing import Any
+from uuid import UUID, uuid4
 
-from sqlalchemy import text
+from sqlalchemy.engine import Connection
 
+from .. import codec
+from ..critical_path import compile_critical_path, hints_to_json
+from ..schema import WorkflowDef
+from . import sqlite
+from .statements import statement
+
+# One statement text for every batch size: the rows arrive as arrays, so the
+# statement registry and the server's plan cache see a single statement.
+_INSERT_JOBS_SQL = """
+    INSERT INTO jobs (id, workflow_id, priority, order_seq, options, scheduled_at)
+    SELECT r.id, CAST(:workflow_id AS uuid), :priority, r.seq,
+           r.options, CAST(:scheduled_at AS timestamptz)
+    FROM unnest(
+           CAST(:ids AS uuid[]), CAST(:options AS jsonb[]), CAST(:seqs AS bigint[])
+         ) AS r(id, options, seq)
+"""
+
+# Concurrent inserts taking the column default draw from the same sequence,
+# so the values are not contiguous; they are returned in the order drawn.
+_RESERVE_SEQS_SQL = """
+    SELECT array_agg(nextval('jobs_order_seq_seq') ORDER BY g)
+    FROM generate_series(1, :count) AS g
+"""
+
+# SQLite runs the single-row form once per row (executemany).
+_INSERT_JOB_SQLITE_SQL = """
+    INSERT INTO jobs (id, workflow_id, priority, order_seq, options, scheduled_at)
+    VALUES (:id, :workflow_id, :priority, :seq, :options, :scheduled_at)
+"""
 
 
 def instantiate_job_tasks(job_id: UUID, *, conn) -> None:
     """Instantiate job tasks for a job based on its workflow definition.
 
+    Critical-path hints come from ``workflows.critical_path``; workflows not
+    compiled yet get hints computed with default step durations.
+
     Parameters
     ----------
     job_id:
@@ -20,7 +54,7 @@ def instantiate_job_tasks(job_id: UUID, *, conn) -> None:
 
     with conn.begin():
         workflow_id_row = conn.execute(
-            text("SELECT workflow_id FROM jobs WHERE id=:job_id"),
+            statement("SELECT workflow_id FROM jobs WHERE id=:job_id"),
             {"job_id": str(job_id)},
         ).one_or_none()
         if workflow_id_row is None:
@@ -28,32 +62,34 @@ def instantiate_job_tasks(job_id: UUID, *, conn) -> None:
         workflow_id = workflow_id_row[0]
 
         steps_row = conn.execute(
-            text("SELECT steps FROM workflows WHERE id=:wf_id"),
+            statement("SELECT steps, critical_path FROM workflows WHERE id=:wf_id"),
             {"wf_id": workflow_id},
         ).one_or_none()
         if steps_row is None:
             return
 
-        steps = steps_row[0] or []
+        steps, hints = steps_row
+        steps = steps or []
         if isinstance(steps, str):
-            steps = json.loads(steps)
+            steps = codec.loads(steps)
+        if isinstance(hints, str):
+            hints = codec.loads(hints)
+        if not hints:
+            hints = hints_to_json(compile_critical_path(steps))
 
         inserted = 0
+        total_weight = 0.0
         for step in steps:
             task_key = step.get("key")
             service_name = step.get("service")
             depends_on = step.get("depends_on") or []
             params = step.get("default_params") or {}
-
-            if conn.dialect.name == "sqlite":
-                depends_on_param = json.dumps(depends_on)
-                params_param = json.dumps(params)
-            else:
-                depends_on_param = depends_on
-                params_param = params
+            weight = step.get("weight") or 1
+            total_weight += weight
+            hint = hints.get(task_key) or {}
 
             exists = conn.execute(
-                text(
+                statement(
                     "SELECT 1 FROM job_tasks WHERE job_id=:job_id AND task_key=:task_key"
                 ),
                 {"job_id": str(job_id), "task_key": task_key},
@@ -62,25 +98,241 @@ def instantiate_job_tasks(job_id: UUID, *, conn) -> None:
                 continue
 
             conn.execute(
-                text(
+                statement(
                     """
                     INSERT INTO job_tasks
-                        (job_id, task_key, service_name, status, depends_on, params, attempt, max_attempts)
-                    VALUES (:job_id, :task_key, :service_name, 'queued', :depends_on, :params, 0, 3)
-                    """
+                        (job_id, task_key, service_name, status, depends_on, params,
+                         attempt, max_attempts, weight, downstream_depth,
+                         remaining_work)
+                    VALUES (:job_id, :task_key, :service_name, 'queued', :depends_on,
+                            :params, 0, 3, :weight, :downstream_depth, :remaining_work)
+                    """,
+                    json=("params",),
+                    arrays=("depends_on",),
                 ),
                 {
                     "job_id": str(job_id),
                     "task_key": task_key,
                     "service_name": service_name,
-                    "depends_on": depends_on_param,
-                    "params": params_param,
+                    "depends_on": depends_on,
+                    "params": params,
+                    "weight": weight,
+                    "downstream_depth": hint.get("depth", 0),
+                    "remaining_work": hint.get("remaining"),
                 },
             )
             inserted += 1
 
         if inserted:
             conn.execute(
-                text("UPDATE jobs SET status='running' WHERE id=:job_id"),
-                {"job_id": str(job_id)},
+                statement(
+                    """
+                    UPDATE jobs
+                    SET status='running', progress=COALESCE(progress, 0),
+                        progress_weight=:total_weight
+                    WHERE id=:job_id
+                    """
+                ),
+                {"job_id": str(job_id), "total_weight": total_weight},
             )
+
+
+def _workflow_id(workflow: WorkflowDef | UUID | str, conn: Connection) -> str:
+    """Resolve a workflow model, id or name to an id."""
+    if isinstance(workflow, WorkflowDef):
+        if workflow.id is None:
+            raise ValueError(f"workflow {workflow.name!r} has not been stored")
+        return str(workflow.id)
+    if isinstance(workflow, UUID):
+        return str(workflow)
+    try:
+        return str(UUID(workflow))
+    except ValueError:
+        pass
+    row = conn.execute(
+        statement(
+            """
+            SELECT id FROM workflows
+            WHERE name = :name AND is_active
+            ORDER BY version DESC
+            LIMIT 1
+            """
+        ),
+        {"name": workflow},
+    ).one_or_none()
+    if row is None:
+        raise ValueError(f"no active workflow named {workflow!r}")
+    return str(row[0])
+
+
+def submit_jobs(
+    workflow: WorkflowDef | UUID | str,
+    options_list: Sequence[Mapping[str, Any]],
+    *,
+    conn: Connection,
+    scheduled_at: datetime | None = None,
+    priority: int = 0,
+    instantiate: bool = False,
+    batch_size: int = 1000,
+) -> list[UUID]:
+    """Create one job per entry of ``options_list`` in a few statements.
+
+    ``order_seq`` values are drawn from the sequence up front and handed
+    out in ascending order, so the jobs keep their submission order in the
+    global queue, then the rows are written with one ``INSERT`` over array
+    parameters per batch. Returns the ids of
+    the new jobs in submission order.
+
+    Parameters
+    ----------
+    workflow:
+        Stored :class:`~accscore.schema.WorkflowDef`, workflow id, or the name
+        of an active workflow (its highest version is used).
+    options_list:
+        Job options, one mapping per job.
+    conn:
+        Open SQLAlchemy connection; the caller owns the transaction.
+    scheduled_at:
+        Earliest start time applied to all submitted jobs.
+    priority:
+        Job priority applied to all submitted jobs.
+    instantiate:
+        Also create the jobs' tasks from the workflow steps, like
+        :func:`instantiate_job_tasks`.
+    batch_size:
+        Rows per ``INSERT`` statement; on SQLite rows per ``executemany``.
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive")
+    if not options_list:
+        return []
+
+    workflow_id = _workflow_id(workflow, conn)
+    count = len(options_list)
+    on_sqlite = sqlite.is_sqlite(conn)
+    scheduled: datetime | str | None = scheduled_at
+    if on_sqlite:
+        first_seq = sqlite.next_order_seq(count, conn=conn)
+        seqs = list(range(first_seq, first_seq + count))
+        if scheduled_at is not None:
+            scheduled = sqlite.timestamp(scheduled_at)
+    else:
+        reserved: list[int] = conn.execute(
+            statement(_RESERVE_SEQS_SQL), {"count": count}
+        ).scalar_one()
+        seqs = sorted(reserved)
+
+    job_ids = [uuid4() for _ in range(count)]
+    for start in range(0, count, batch_size):
+        end = min(start + batch_size, count)
+        if on_sqlite:
+            conn.execute(
+                statement(_INSERT_JOB_SQLITE_SQL, json=("options",)),
+                [
+                    {
+                        "id": str(job_ids[i]),
+                        "workflow_id": workflow_id,
+                        "priority": priority,
+                        "seq": seqs[i],
+                        "options": dict(options_list[i]),
+                        "scheduled_at": scheduled,
+                    }
+                    for i in range(start, end)
+                ],
+            )
+            continue
+        conn.execute(
+            statement(_INSERT_JOBS_SQL, arrays=("ids", "options", "seqs")),
+            {
+                "ids": [str(job_id) for job_id in job_ids[start:end]],
+                "options": [codec.dumps(dict(o)) for o in options_list[start:end]],
+                "seqs": [str(seq) for seq in seqs[start:end]],
+                "workflow_id": workflow_id,
+                "priority": priority,
+                "scheduled_at": scheduled,
+            },
+        )
+
+    if instantiate and on_sqlite:
+        sqlite.instantiate_jobs(job_ids, conn=conn)
+    elif instantiate:
+        _instantiate_many([str(job_id) for job_id in job_ids], workflow_id, conn)
+    return job_ids
+
+
+def instantiate_jobs(job_ids: Sequence[UUID | str], *, conn: Connection) -> int:
+    """Create the tasks of many jobs with one set-based insert per workflow.
+
+    Returns the number of jobs found.
+
+    Parameters
+    ----------
+    job_ids:
+        Jobs to instantiate, typically locked by the caller.
+    conn:
+        Open SQLAlchemy connection; the caller owns the transaction.
+    """
+    if not job_ids:
+        return 0
+    if sqlite.is_sqlite(conn):
+        return sqlite.instantiate_jobs(job_ids, conn=conn)
+
+    rows = conn.execute(
+        statement(
+            """
+            SELECT workflow_id, array_agg(CAST(id AS text)) AS job_ids
+            FROM jobs
+            WHERE id = ANY(CAST(:job_ids AS uuid[]))
+            GROUP BY workflow_id
+            """
+        ),
+        {"job_ids": [str(job_id) for job_id in job_ids]},
+    ).all()
+    for row in rows:
+        _instantiate_many(list(row.job_ids), str(row.workflow_id), conn)
+    return sum(len(row.job_ids) for row in rows)
+
+
+def _instantiate_many(job_ids: list[str], workflow_id: str, conn: Connection) -> None:
+    """Create the tasks of many jobs of one workflow with set-based statements."""
+    conn.execute(
+        statement(
+            """
+            INSERT INTO job_tasks
+                (job_id, task_key, service_name, status, depends_on, params, weight,
+                 downstream_depth, remaining_work)
+            SELECT j.id, s.key, s.service, 'queued', COALESCE(s.depends_on, '{}'),
+                   COALESCE(s.default_params, '{}'), COALESCE(s.weight, 1),
+                   COALESCE((w.critical_path -> s.key ->> 'depth')::int, 0),
+                   (w.critical_path -> s.key ->> 'remaining')::float8
+            FROM unnest(CAST(:job_ids AS uuid[])) AS j(id),
+                 workflows w,
+                 jsonb_to_recordset(w.steps) AS s(
+                     key TEXT,
+                     service TEXT,
+                     depends_on TEXT[],
+                     default_params JSONB,
+                     weight NUMERIC
+                 )
+            WHERE w.id = :workflow_id
+            ON CONFLICT (job_id, task_key) DO NOTHING
+            """
+        ),
+        {"job_ids": job_ids, "workflow_id": workflow_id},
+    )
+    conn.execute(
+        statement(
+            """
+            UPDATE jobs
+            SET status = 'running', progress = COALESCE(progress, 0),
+                started_at = COALESCE(started_at, now()),
+                progress_weight = (
+                  SELECT COALESCE(sum(COALESCE((s->>'weight')::numeric, 1)), 0)
+                  FROM workflows w, jsonb_array_elements(w.steps) AS s
+                  WHERE w.id = :workflow_id
+                )
+            WHERE id = ANY(CAST(:job_ids AS uuid[]))
+            """
+        ),
+        {"job_ids": job_ids, "workflow_id": workflow_id},
+    )
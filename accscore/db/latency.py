@@ -0,0 +1,201 @@
+"""Task lifecycle latency distributions.
+
+Every finished task passes through four stages, each measured between two
+timestamps of its ``job_tasks`` row:
+
+``dependency_wait``
+    ``created_at`` until the task became ready, i.e. the latest of the
+    job's ``scheduled_at`` and its dependencies' ``finished_at``.
+``queue_wait``
+    Ready until ``claimed_at``; time spent waiting for a free slot.
+``claim_to_start``
+    ``claimed_at`` until ``started_at``; agent pick-up and input download.
+``run_time``
+    ``started_at`` until ``finished_at``.
+
+:func:`task_latencies` computes sample count, mean, maximum, percentiles and a
+fixed-bucket histogram of each stage per service, workflow or node for the
+tasks that finished within a time window, in one set-based query. For
+retried tasks ``claimed_at`` belongs to the last attempt while
+``started_at`` is kept from the first, so stages that would come out
+negative are left out. Postgres only: SQLite lacks ``percentile_cont``.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from datetime import UTC, datetime, timedelta
+from typing import Literal, NamedTuple
+
+from sqlalchemy.engine import Connection
+
+from . import sqlite
+from .routing import reads_from_replica
+from .statements import statement
+
+LatencyGroup = Literal["service", "workflow", "node"]
+
+STAGES = ("dependency_wait", "queue_wait", "claim_to_start", "run_time")
+
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Upper bucket bounds in seconds; values at or above the last bound are
+# counted in an overflow bucket.
+DEFAULT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 14400.0)
+
+_GROUP_SQL = {
+    "service": "jt.service_name",
+    "workflow": "w.name",
+    "node": "COALESCE(jt.assigned_node, jt.claimed_by, '')",
+}
+
+_LATENCY_SQL = """
+WITH t AS (
+  SELECT {group} AS grp, jt.created_at, jt.claimed_at, jt.started_at, jt.finished_at,
+         GREATEST(
+           jt.created_at,
+           j.scheduled_at,
+           (SELECT max(dep.finished_at) FROM job_tasks dep
+            WHERE dep.job_id = jt.job_id AND dep.task_key = ANY(jt.depends_on))
+         ) AS ready_at
+  FROM job_tasks jt
+  JOIN jobs j ON j.id = jt.job_id
+  JOIN workflows w ON w.id = j.workflow_id
+  WHERE jt.finished_at >= :since AND jt.finished_at < :until
+    AND jt.status IN ('done', 'error')
+    {services}
+), d AS (
+  SELECT t.grp, s.stage, s.seconds,
+         width_bucket(s.seconds, CAST(:buckets AS float8[])) AS bucket
+  FROM t, LATERAL (VALUES
+    ('dependency_wait', CAST(extract(epoch FROM t.ready_at - t.created_at) AS float8)),
+    ('queue_wait', CAST(extract(epoch FROM t.claimed_at - t.ready_at) AS float8)),
+    ('claim_to_start', CAST(extract(epoch FROM t.started_at - t.claimed_at) AS float8)),
+    ('run_time', CAST(extract(epoch FROM t.finished_at - t.started_at) AS float8))
+  ) AS s(stage, seconds)
+  WHERE s.seconds >= 0
+), h AS (
+  SELECT grp, stage, array_agg(bucket ORDER BY bucket) AS buckets,
+         array_agg(n ORDER BY bucket) AS counts
+  FROM (SELECT grp, stage, bucket, count(*) AS n FROM d GROUP BY grp, stage, bucket) b
+  GROUP BY grp, stage
+)
+SELECT d.grp, d.stage,
+       count(*) AS samples, avg(d.seconds) AS mean, max(d.seconds) AS max,
+       percentile_cont(CAST(:percentiles AS float8[])) WITHIN GROUP (ORDER BY d.seconds)
+         AS percentiles,
+       h.buckets, h.counts
+FROM d
+JOIN h ON h.grp = d.grp AND h.stage = d.stage
+GROUP BY d.grp, d.stage, h.buckets, h.counts
+"""
+
+
+class LatencyStats(NamedTuple):
+    """Distribution of one stage within one group, in seconds.
+
+    ``histogram[i]`` counts durations below ``buckets[i]`` and at least
+    ``buckets[i - 1]``; the last entry counts those at or above
+    ``buckets[-1]``.
+    """
+
+    group: str
+    stage: str
+    samples: int
+    mean: float
+    max: float
+    percentiles: dict[float, float]
+    buckets: tuple[float, ...]
+    histogram: tuple[int, ...]
+
+
+@reads_from_replica
+def task_latencies(
+    *,
+    conn: Connection | None = None,
+    by: LatencyGroup = "service",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    window: timedelta = timedelta(hours=1),
+    services: Sequence[str] | None = None,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> list[LatencyStats]:
+    """Return stage latency distributions of recently finished tasks.
+
+    Parameters
+    ----------
+    conn:
+        Open SQLAlchemy connection to a Postgres database; defaults to a
+        replica connection.
+    by:
+        Group by ``service`` name, ``workflow`` name or ``node`` (the
+        assigned node, else the claiming agent).
+    since, until:
+        Window of ``finished_at``; ``until`` defaults to the current UTC
+        time and ``since`` to ``until - window``.
+    services:
+        Only include tasks of these services.
+    percentiles:
+        Fractions between 0 and 1, interpolated like ``percentile_cont``.
+    buckets:
+        Ascending histogram bucket bounds in seconds.
+
+    One :class:`LatencyStats` is returned per group and stage with at least
+    one sample, sorted by group and then in lifecycle order of
+    :data:`STAGES`.
+    """
+    assert conn is not None  # supplied by reads_from_replica
+    if sqlite.is_sqlite(conn):
+        raise sqlite.UnsupportedBackendError("latency analytics")
+    if by not in _GROUP_SQL:
+        raise ValueError(f"invalid grouping: {by!r}")
+    if any(not 0 <= p <= 1 for p in percentiles):
+        raise ValueError("percentiles must be between 0 and 1")
+    if not buckets or list(buckets) != sorted(buckets):
+        raise ValueError("buckets must be ascending")
+
+    until = until or datetime.now(UTC)
+    since = since or until - window
+    only = "AND jt.service_name = ANY(CAST(:services AS text[]))"
+    sql = _LATENCY_SQL.format(group=_GROUP_SQL[by], services=only if services else "")
+    params = {
+        "since": since,
+        "until": until,
+        "percentiles": [float(p) for p in percentiles],
+        "buckets": [float(b) for b in buckets],
+    }
+    if services:
+        params["services"] = list(services)
+
+    stats = []
+    for row in conn.execute(statement(sql), params):
+        histogram = [0] * (len(buckets) + 1)
+        for bucket, count in zip(row.buckets, row.counts, strict=True):
+            histogram[bucket] = int(count)
+        stats.append(
+            LatencyStats(
+                group=row.grp,
+                stage=row.stage,
+                samples=int(row.samples),
+                mean=float(row.mean),
+                max=float(row.max),
+                percentiles=dict(
+                    zip(percentiles, map(float, row.percentiles), strict=True)
+                ),
+                buckets=tuple(float(b) for b in buckets),
+                histogram=tuple(histogram),
+            )
+        )
+    stats.sort(key=lambda s: (s.group, STAGES.index(s.stage)))
+    return stats
+
+
+__all__ = [
+    "DEFAULT_BUCKETS",
+    "DEFAULT_PERCENTILES",
+    "LatencyGroup",
+    "LatencyStats",
+    "STAGES",
+    "task_latencies",
+]
@@ -0,0 +1,111 @@
+"""Claim leases and fencing tokens for ``job_tasks``.
+
+A claim holds a lease until ``lease_expires_at``; the claim queries hand out
+``starting``/``running`` tasks whose lease expired to the next claimant. Every
+claim increments ``lease_token``, so an agent that lost its lease (e.g. after
+a network partition) is fenced off: renewals and transitions carrying its
+old token no longer match the row.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy.engine import Connection
+
+from . import sqlite
+from .statements import statement
+
+DEFAULT_LEASE_TTL = timedelta(seconds=120)
+
+
+class LeaseLostError(RuntimeError):
+    """Raised when a task transition carries a stale fencing token."""
+
+
+def renew_leases(
+    leases: Mapping[str, int],
+    *,
+    conn: Connection,
+    ttl: timedelta = DEFAULT_LEASE_TTL,
+    now: datetime | None = None,
+) -> set[str]:
+    """Extend the leases of many claimed tasks in one statement.
+
+    Returns the ids of the renewed tasks. Tasks missing from the result were
+    taken over or finished and must be abandoned by the caller.
+
+    Parameters
+    ----------
+    leases:
+        Mapping of task id to the fencing token received when claiming it.
+    conn:
+        Open SQLAlchemy connection; the caller owns the transaction.
+    ttl:
+        New lease duration counted from ``now``.
+    now:
+        Reference time, defaults to the current UTC time.
+    """
+    if not leases:
+        return set()
+
+    now = now or datetime.now(UTC)
+    if sqlite.is_sqlite(conn):
+        return sqlite.renew_leases(leases, conn=conn, expires=now + ttl)
+
+    rows = conn.execute(
+        statement(
+            """
+            UPDATE job_tasks jt
+            SET lease_expires_at = :now + :ttl
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:tokens AS bigint[])) AS l(id, token)
+            WHERE jt.id = l.id
+              AND jt.lease_token = l.token
+              AND jt.status IN ('starting', 'running')
+            RETURNING jt.id
+            """
+        ),
+        {
+            "now": now,
+            "ttl": ttl,
+            "ids": [str(task_id) for task_id in leases],
+            "tokens": [int(token) for token in leases.values()],
+        },
+    )
+    return {str(row[0]) for row in rows}
+
+
+def release_tasks(leases: Mapping[str, int], *, conn: Connection) -> set[str]:
+    """Hand claimed tasks that never started back to the queue.
+
+    Only tasks still in ``starting`` and held with the given fencing tokens
+    are released; returns their ids.
+    """
+    if not leases:
+        return set()
+    if sqlite.is_sqlite(conn):
+        return sqlite.release_tasks(leases, conn=conn)
+
+    rows = conn.execute(
+        statement(
+            """
+            UPDATE job_tasks jt
+            SET status = 'queued', claimed_by = NULL, claimed_at = NULL,
+                lease_expires_at = NULL, updated_at = now()
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:tokens AS bigint[])) AS l(id, token)
+            WHERE jt.id = l.id
+              AND jt.lease_token = l.token
+              AND jt.status = 'starting'
+            RETURNING jt.id
+            """
+        ),
+        {
+            "ids": [str(task_id) for task_id in leases],
+            "tokens": [int(token) for token in leases.values()],
+        },
+    )
+    return {str(row[0]) for row in rows}
+
+
+__all__ = ["DEFAULT_LEASE_TTL", "LeaseLostError", "release_tasks", "renew_leases"]
@@ -0,0 +1,520 @@
+"""Versioned DDL for the ACCScore tables and index diagnostics."""
+
+from __future__ import annotations
+
+import warnings
+from typing import Any, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .. import codec
+from . import sqlite
+from .tasks import _SELECT_RUNNABLE_SQL, _utcnow
+
+
+class Migration(NamedTuple):
+    """A single schema migration step."""
+
+    version: int
+    name: str
+    statements: tuple[str, ...]
+
+
+class SeqScanWarning(RuntimeWarning):
+    """Emitted when a claim query plan falls back to a sequential scan or full sort."""
+
+
+MIGRATIONS_TABLE = "accscore_schema_migrations"
+
+# Arbitrary constant used with ``pg_advisory_xact_lock`` so that concurrent
+# deployments never apply the same migration twice.
+_MIGRATION_LOCK_ID = 0x41CC5C0E
+
+
+# Status counters are sharded by backend so that concurrent transitions do
+# not serialise on one summary row; readers sum the shards.
+STATUS_COUNT_SHARDS = 16
+
+
+def _counter_upsert(counts: str, cols: str, rows: str) -> str:
+    """Upsert summing ``delta`` of ``rows`` into the backend's shard of ``counts``.
+
+    Rows are written in key order so that two backends sharing a shard lock
+    its rows in the same order and cannot deadlock.
+    """
+    return f"""
+        INSERT INTO {counts} AS c ({cols}, shard, count)
+        SELECT {cols}, pg_backend_pid() % {STATUS_COUNT_SHARDS}, sum(delta)
+        FROM ({rows}) d
+        GROUP BY {cols}
+        HAVING sum(delta) <> 0
+        ORDER BY {cols}
+        ON CONFLICT ({cols}, shard) DO UPDATE SET count = c.count + EXCLUDED.count;"""
+
+
+def _counter_function(counts: str, keys: tuple[str, ...]) -> str:
+    """Statement-level trigger function applying transition tables to ``counts``."""
+    cols = ", ".join(keys)
+
+    def upsert(rows: str) -> str:
+        return _counter_upsert(counts, cols, rows)
+
+    return f"""
+    CREATE OR REPLACE FUNCTION accscore_count_{counts}() RETURNS trigger
+    LANGUAGE plpgsql AS $fn$
+    BEGIN
+      IF TG_OP = 'INSERT' THEN{upsert(f"SELECT {cols}, 1 AS delta FROM new_rows")}
+      ELSIF TG_OP = 'DELETE' THEN{upsert(f"SELECT {cols}, -1 AS delta FROM old_rows")}
+      ELSE{upsert(
+          f"SELECT {cols}, 1 AS delta FROM new_rows"
+          f" UNION ALL SELECT {cols}, -1 FROM old_rows"
+      )}
+      END IF;
+      RETURN NULL;
+    END
+    $fn$
+    """
+
+
+def _status_counter(source: str, counts: str, keys: tuple[str, ...]) -> tuple[str, ...]:
+    """Statements installing statement-level triggers that maintain ``counts``.
+
+    ``counts`` holds one row per ``keys`` value and shard of ``source``. The
+    triggers use transition tables, so bulk statements cost one upsert per
+    distinct key instead of one per row.
+    """
+    cols = ", ".join(keys)
+    function = f"accscore_count_{counts}"
+    body = _counter_function(counts, keys)
+    key_columns = ", ".join(f"{key} text NOT NULL" for key in keys)
+    return (
+        f"LOCK TABLE {source} IN SHARE ROW EXCLUSIVE MODE",
+        f"""
+        CREATE TABLE IF NOT EXISTS {counts} (
+            {key_columns},
+            shard smallint NOT NULL,
+            count bigint NOT NULL DEFAULT 0,
+            PRIMARY KEY ({cols}, shard)
+        )
+        """,
+        body,
+        f"CREATE TRIGGER {counts}_ins AFTER INSERT ON {source}"
+        f" REFERENCING NEW TABLE AS new_rows"
+        f" FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+        # Postgres rejects column lists (UPDATE OF status) on triggers with
+        # transition tables. Updates that keep the keys, such as lease
+        # renewals, net to zero and skip the upsert; a row-level UPDATE OF
+        # trigger measured about 3x slower on bulk claims.
+        f"CREATE TRIGGER {counts}_upd AFTER UPDATE ON {source}"
+        f" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows"
+        f" FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+        f"CREATE TRIGGER {counts}_del AFTER DELETE ON {source}"
+        f" REFERENCING OLD TABLE AS old_rows"
+        f" FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+        f"INSERT INTO {counts} ({cols}, shard, count)"
+        f" SELECT {cols}, 0, count(*) FROM {source} GROUP BY {cols}",
+    )
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "initial_schema",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS workflows (
+                id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+                name text NOT NULL,
+                version int NOT NULL,
+                is_active boolean NOT NULL DEFAULT true,
+                steps jsonb NOT NULL DEFAULT '[]',
+                created_at timestamptz NOT NULL DEFAULT now(),
+                updated_at timestamptz,
+                UNIQUE (name, version)
+            )
+            """,
+            "CREATE SEQUENCE IF NOT EXISTS jobs_order_seq_seq",
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+                workflow_id uuid NOT NULL REFERENCES workflows(id),
+                status text NOT NULL DEFAULT 'queued'
+                    CHECK (status IN ('queued','running','done','error')),
+                progress numeric,
+                current_task_key text,
+                priority int NOT NULL DEFAULT 0,
+                order_seq bigint NOT NULL DEFAULT nextval('jobs_order_seq_seq'),
+                options jsonb NOT NULL DEFAULT '{}',
+                scheduled_at timestamptz,
+                error_code text,
+                error_message text,
+                created_at timestamptz NOT NULL DEFAULT now(),
+                started_at timestamptz,
+                finished_at timestamptz,
+                updated_at timestamptz
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS job_tasks (
+                id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+                job_id uuid NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+                task_key text NOT NULL,
+                service_name text NOT NULL,
+                status text NOT NULL DEFAULT 'queued' CHECK (
+                    status IN ('queued','starting','running','done','error','skipped')
+                ),
+                depends_on text[] NOT NULL DEFAULT '{}',
+                attempt int NOT NULL DEFAULT 0,
+                max_attempts int NOT NULL DEFAULT 3,
+                next_attempt_at timestamptz,
+                priority int NOT NULL DEFAULT 0,
+                progress numeric,
+                params jsonb NOT NULL DEFAULT '{}',
+                results jsonb,
+                assigned_node text,
+                claimed_by text,
+                claimed_at timestamptz,
+                started_at timestamptz,
+                finished_at timestamptz,
+                created_at timestamptz NOT NULL DEFAULT now(),
+                updated_at timestamptz
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS task_events (
+                id bigserial PRIMARY KEY,
+                job_id uuid NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+                job_task_id uuid REFERENCES job_tasks(id) ON DELETE CASCADE,
+                ts timestamptz NOT NULL DEFAULT now(),
+                source text,
+                level text NOT NULL CHECK (level IN ('debug','info','warn','error')),
+                type text NOT NULL,
+                message text,
+                data jsonb
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS task_artifacts (
+                id bigserial PRIMARY KEY,
+                job_id uuid NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+                job_task_id uuid REFERENCES job_tasks(id) ON DELETE CASCADE,
+                kind text NOT NULL CHECK (kind IN ('input','output','log')),
+                bucket text NOT NULL,
+                key text NOT NULL,
+                size_bytes bigint,
+                content_type text,
+                checksum text,
+                created_at timestamptz NOT NULL DEFAULT now()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS nodes (
+                name text PRIMARY KEY,
+                labels jsonb NOT NULL DEFAULT '{}',
+                last_seen timestamptz,
+                awake_state text NOT NULL DEFAULT 'unknown'
+                    CHECK (awake_state IN ('unknown','awake','sleep')),
+                wake_method text CHECK (wake_method IN ('wol','provider','script')),
+                mac text,
+                provider_ref text,
+                script text,
+                max_concurrency jsonb NOT NULL DEFAULT '{}'
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS jobs_status_scheduled_at_idx"
+            " ON jobs (status, scheduled_at)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS jobs_order_seq_idx ON jobs (order_seq)",
+            "CREATE INDEX IF NOT EXISTS job_tasks_service_status_job_idx"
+            " ON job_tasks (service_name, status, job_id)",
+            "CREATE INDEX IF NOT EXISTS job_tasks_job_status_idx"
+            " ON job_tasks (job_id, status)",
+            "CREATE INDEX IF NOT EXISTS task_events_job_ts_idx"
+            " ON task_events (job_id, ts DESC)",
+            "CREATE INDEX IF NOT EXISTS task_events_task_ts_idx"
+            " ON task_events (job_task_id, ts DESC)",
+            "CREATE INDEX IF NOT EXISTS task_artifacts_job_idx"
+            " ON task_artifacts (job_id)",
+            "CREATE INDEX IF NOT EXISTS task_artifacts_task_idx"
+            " ON task_artifacts (job_task_id)",
+        ),
+    ),
+    Migration(
+        2,
+        "claim_indexes",
+        (
+            # Only queued rows are ever scanned by the claim queries, so a
+            # partial index keeps the hot path small regardless of history.
+            "CREATE INDEX IF NOT EXISTS job_tasks_claim_idx"
+            " ON job_tasks (service_name, next_attempt_at) WHERE status = 'queued'",
+            # Serves the ``NOT EXISTS`` dependency probe and makes task
+            # instantiation idempotent at the database level.
+            "CREATE UNIQUE INDEX IF NOT EXISTS job_tasks_job_task_key_idx"
+            " ON job_tasks (job_id, task_key)",
+        ),
+    ),
+    Migration(
+        3,
+        "priority_order_index",
+        (
+            # PriorityOrder claims walk jobs in this order; only the tasks of
+            # one job are sorted by task priority (an Incremental Sort). Also
+            # serves the per-priority heads of FairShareOrder.
+            "CREATE INDEX IF NOT EXISTS jobs_priority_order_idx"
+            " ON jobs (priority DESC, order_seq)",
+        ),
+    ),
+    Migration(
+        4,
+        "artifact_checksum_index",
+        (
+            "CREATE INDEX IF NOT EXISTS task_artifacts_checksum_idx"
+            " ON task_artifacts (checksum, size_bytes) WHERE checksum IS NOT NULL",
+        ),
+    ),
+    Migration(
+        5,
+        "artifact_manifest_index",
+        (
+            # Serves per-job manifests in index order; supersedes (job_id).
+            "CREATE INDEX IF NOT EXISTS task_artifacts_manifest_idx"
+            " ON task_artifacts (job_id, job_task_id, kind, id)",
+            "DROP INDEX IF EXISTS task_artifacts_job_idx",
+        ),
+    ),
+    Migration(
+        6,
+        "job_progress_weights",
+        (
+            "ALTER TABLE job_tasks"
+            " ADD COLUMN IF NOT EXISTS weight numeric NOT NULL DEFAULT 1",
+            "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS progress_weight numeric",
+        ),
+    ),
+    Migration(
+        7,
+        "task_leases",
+        (
+            "ALTER TABLE job_tasks"
+            " ADD COLUMN IF NOT EXISTS lease_expires_at timestamptz",
+            "ALTER TABLE job_tasks"
+            " ADD COLUMN IF NOT EXISTS lease_token bigint NOT NULL DEFAULT 0",
+            # Lets the claim query find expired leases next to the queued tasks.
+            "CREATE INDEX IF NOT EXISTS job_tasks_lease_idx"
+            " ON job_tasks (service_name, lease_expires_at)"
+            " WHERE status IN ('starting', 'running')",
+        ),
+    ),
+    Migration(
+        8,
+        "critical_path_hints",
+        (
+            "ALTER TABLE workflows ADD COLUMN IF NOT EXISTS critical_path jsonb",
+            "ALTER TABLE job_tasks"
+            " ADD COLUMN IF NOT EXISTS downstream_depth int NOT NULL DEFAULT 0",
+            "ALTER TABLE job_tasks"
+            " ADD COLUMN IF NOT EXISTS remaining_work double precision",
+        ),
+    ),
+    Migration(
+        9,
+        "status_counts",
+        (
+            *_status_counter(
+                "job_tasks", "task_status_counts", ("service_name", "status")
+            ),
+            *_status_counter("jobs", "job_status_counts", ("status",)),
+            # Oldest queued task per service as one index probe.
+            "CREATE INDEX IF NOT EXISTS job_tasks_queued_age_idx"
+            " ON job_tasks (service_name, created_at) WHERE status = 'queued'",
+        ),
+    ),
+    Migration(
+        10,
+        "builder_watermarks",
+        (
+            # Jobs submitted after the builder's order_seq watermark.
+            "CREATE INDEX IF NOT EXISTS jobs_queued_order_seq_idx"
+            " ON jobs (order_seq) WHERE status = 'queued'",
+        ),
+    ),
+    Migration(
+        11,
+        "node_wake_requests",
+        (
+            "ALTER TABLE nodes ADD COLUMN IF NOT EXISTS wake_requested_at timestamptz",
+            # Recent work per node for the idle check of the wake planner.
+            "CREATE INDEX IF NOT EXISTS job_tasks_node_finished_idx"
+            " ON job_tasks (assigned_node, finished_at)"
+            " WHERE assigned_node IS NOT NULL",
+        ),
+    ),
+    Migration(
+        12,
+        "task_latency_window",
+        (
+            # Tasks finished within a time window for the latency analytics.
+            "CREATE INDEX IF NOT EXISTS job_tasks_finished_at_idx"
+            " ON job_tasks (finished_at) WHERE finished_at IS NOT NULL",
+        ),
+    ),
+    Migration(
+        13,
+        "artifact_retention",
+        (
+            "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS artifacts_purged_at timestamptz",
+            # Finished jobs whose artifacts have not been collected yet.
+            "CREATE INDEX IF NOT EXISTS jobs_artifact_gc_idx"
+            " ON jobs (finished_at, id)"
+            " WHERE finished_at IS NOT NULL AND artifacts_purged_at IS NULL",
+            # Objects still referenced by rows of other jobs are kept.
+            "CREATE INDEX IF NOT EXISTS task_artifacts_object_idx"
+            " ON task_artifacts (bucket, key)",
+        ),
+    ),
+    Migration(
+        14,
+        "fair_share_workflow_index",
+        (
+            # Per-workflow heads of FairShareOrder(by="workflow") in job order.
+            "CREATE INDEX IF NOT EXISTS jobs_workflow_order_idx"
+            " ON jobs (workflow_id, order_seq)",
+        ),
+    ),
+    Migration(
+        15,
+        "status_counts_ordered_upserts",
+        (
+            _counter_function("task_status_counts", ("service_name", "status")),
+            _counter_function("job_status_counts", ("status",)),
+        ),
+    ),
+)
+
+
+def current_version(*, conn: Connection) -> int:
+    """Return the highest applied migration version, ``0`` if none."""
+    conn.execute(
+        text(
+            f"""
+            CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+                version int PRIMARY KEY,
+                name text NOT NULL,
+                applied_at timestamptz NOT NULL DEFAULT now()
+            )
+            """
+        )
+    )
+    version: int | None = conn.execute(
+        text(f"SELECT max(version) FROM {MIGRATIONS_TABLE}")
+    ).scalar_one()
+    return version or 0
+
+
+def apply_migrations(*, conn: Connection, target: int | None = None) -> list[int]:
+    """Apply pending migrations up to ``target`` and return applied versions.
+
+    The caller owns the transaction; Postgres DDL is transactional so a
+    failure rolls the whole batch back. An advisory lock serialises
+    concurrent callers. On SQLite the consolidated schema from
+    :mod:`accscore.db.sqlite` is created instead and ``target`` is ignored.
+    """
+    if sqlite.is_sqlite(conn):
+        return sqlite.apply_schema(conn=conn)
+
+    conn.execute(
+        text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": _MIGRATION_LOCK_ID}
+    )
+    version = current_version(conn=conn)
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        if target is not None and migration.version > target:
+            break
+        for statement in migration.statements:
+            conn.execute(text(statement))
+        conn.execute(
+            text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (:v, :n)"),
+            {"v": migration.version, "n": migration.name},
+        )
+        applied.append(migration.version)
+    return applied
+
+
+def _relations(plan: dict[str, Any]) -> list[str]:
+    """Collect the relation names read anywhere below ``plan``."""
+    found = [plan["Relation Name"]] if "Relation Name" in plan else []
+    for child in plan.get("Plans", []):
+        found.extend(_relations(child))
+    return found
+
+
+def _seq_scans(plan: dict[str, Any]) -> list[str]:
+    """Collect relation names read in full anywhere in ``plan``.
+
+    Besides sequential scans this includes every relation below a full
+    ``Sort`` node, which has to read all matching rows before the ``LIMIT``
+    can return the first one. Ordered index scans feeding a ``LIMIT`` or an
+    ``Incremental Sort`` stop early and are not reported.
+    """
+    node_type = plan.get("Node Type")
+    if node_type == "Seq Scan":
+        return [plan.get("Relation Name", "?")]
+    if node_type == "Sort":
+        return _relations(plan) or ["?"]
+    found = []
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def check_indexes(
+    *, conn: Connection, service: str = "", disable_seqscan: bool = True
+) -> list[str]:
+    """Run ``EXPLAIN`` on the claim query and warn about full scans and sorts.
+
+    Returns the names of relations that are still scanned sequentially or
+    sorted in full.
+
+    Parameters
+    ----------
+    conn:
+        Open SQLAlchemy connection to a Postgres database.
+    service:
+        Service name bound into the query. The plan shape does not depend on
+        it, so the default is fine for a health check.
+    disable_seqscan:
+        Discourage sequential scans and full sorts for the duration of the
+        check. Small or freshly created tables are otherwise always scanned
+        sequentially and sorted, so this answers "is there a usable index"
+        rather than "is it used today".
+    """
+    settings = ("enable_seqscan", "enable_sort") if disable_seqscan else ()
+    previous: dict[str, Any] = {
+        name: conn.execute(text(f"SHOW {name}")).scalar_one() for name in settings
+    }
+    for name in settings:
+        conn.execute(text("SELECT set_config(:name, 'off', true)"), {"name": name})
+    try:
+        raw: Any = conn.execute(
+            text("EXPLAIN (FORMAT JSON) " + _SELECT_RUNNABLE_SQL),
+            {"service": service, "now": _utcnow(), "limit": 1},
+        ).scalar_one()
+    finally:
+        for name, value in previous.items():
+            conn.execute(
+                text("SELECT set_config(:name, :v, true)"), {"name": name, "v": value}
+            )
+
+    if isinstance(raw, str):
+        raw = codec.loads(raw)
+    relations = list(dict.fromkeys(_seq_scans(raw[0]["Plan"])))
+    for relation in relations:
+        warnings.warn(
+            f"claim query reads {relation!r} in full; run apply_migrations()",
+            SeqScanWarning,
+            stacklevel=2,
+        )
+    return relations
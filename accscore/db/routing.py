@@ -0,0 +1,158 @@
+"""Route read-only work to streaming replicas.
+
+A :class:`ReplicaRouter` hands out replica engines round-robin for
+dashboards, timelines and analytics, keeping them off the primary that
+serves claims and task transitions. Each replica's replay lag is measured
+at most every ``check_interval`` seconds; replicas lagging more than
+``max_lag``, or unreachable, are skipped, and when none is left the
+primary serves the read.
+
+:func:`accscore.db.session_scope` with ``readonly=True`` and
+:func:`accscore.db.read_connection` use the shared router in
+:mod:`accscore.db`; helpers decorated with :func:`reads_from_replica` open
+such a connection when called without ``conn``.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import threading
+import time
+from collections.abc import Callable, Sequence
+from datetime import timedelta
+from typing import Any, TypeVar
+
+from sqlalchemy.engine import Connection, Engine
+
+from . import sqlite
+from .statements import statement
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+DEFAULT_MAX_LAG = timedelta(seconds=5)
+
+_LAG_SQL = """
+SELECT CASE
+  WHEN NOT pg_is_in_recovery() THEN 0
+  WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+  ELSE CAST(extract(epoch FROM now() - pg_last_xact_replay_timestamp()) AS float8)
+END
+"""
+
+
+def replica_lag(conn: Connection) -> float | None:
+    """Return how many seconds ``conn``'s server is behind its primary.
+
+    A primary, or a replica that replayed everything it received, reports
+    ``0``; ``None`` means the lag is unknown because nothing was replayed
+    yet.
+    """
+    if sqlite.is_sqlite(conn):
+        return 0.0
+    lag = conn.execute(statement(_LAG_SQL)).scalar()
+    return None if lag is None else max(0.0, float(lag))
+
+
+def begin_read_only(conn: Connection) -> None:
+    """Make the transaction just begun on ``conn`` read-only (Postgres)."""
+    if not sqlite.is_sqlite(conn):
+        conn.execute(statement("SET TRANSACTION READ ONLY"))
+
+
+class ReplicaRouter:
+    """Pick the engine for read-only work.
+
+    Parameters
+    ----------
+    primary:
+        Engine of the primary, used when no replica is fresh enough.
+    replicas:
+        Replica engines, used round-robin.
+    max_lag:
+        Largest replay lag a replica may have to serve reads.
+    check_interval:
+        Seconds a replica's measured lag is reused before it is measured
+        again.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: Sequence[Engine] = (),
+        *,
+        max_lag: timedelta = DEFAULT_MAX_LAG,
+        check_interval: float = 5.0,
+    ) -> None:
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._lags: dict[int, tuple[float, float | None]] = {}
+
+    def lag(self, index: int) -> float | None:
+        """Return the replay lag of ``replicas[index]``, measuring it when stale.
+
+        ``None`` means the replica is unreachable or its lag unknown.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._lags.get(index)
+        if cached is not None and now - cached[0] < self.check_interval:
+            return cached[1]
+        try:
+            with self.replicas[index].connect() as conn:
+                lag = replica_lag(conn)
+        except Exception as exc:
+            logger.warning("replica %d unavailable: %s", index, exc)
+            lag = None
+        with self._lock:
+            self._lags[index] = (now, lag)
+        return lag
+
+    def read_engine(self) -> Engine:
+        """Return the next replica within ``max_lag``, else the primary."""
+        limit = self.max_lag.total_seconds()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(1, len(self.replicas))
+        for offset in range(len(self.replicas)):
+            index = (start + offset) % len(self.replicas)
+            lag = self.lag(index)
+            if lag is not None and lag <= limit:
+                return self.replicas[index]
+        if self.replicas:
+            logger.debug("no replica within %.1fs lag, reading from the primary", limit)
+        return self.primary
+
+
+def reads_from_replica(func: F) -> F:
+    """Let ``func``'s keyword ``conn`` default to a read-only replica connection.
+
+    Without ``conn`` the call runs in :func:`accscore.db.read_connection`;
+    an explicit ``conn`` is used as is.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, conn: Connection | None = None, **kwargs: Any) -> Any:
+        if conn is not None:
+            return func(*args, conn=conn, **kwargs)
+        from . import read_connection
+
+        with read_connection() as conn:
+            return func(*args, conn=conn, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+__all__ = [
+    "DEFAULT_MAX_LAG",
+    "ReplicaRouter",
+    "begin_read_only",
+    "reads_from_replica",
+    "replica_lag",
+]
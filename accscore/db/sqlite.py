@@ -0,0 +1,824 @@
+"""Embedded SQLite backend for single-box deployments and local tests.
+
+The public helpers in :mod:`accscore.db` check the connection's dialect and
+delegate here on SQLite, so the job lifecycle (submission, instantiation,
+claims, leases and task transitions) runs without a Postgres server.
+
+SQLite has no row locks; instead :func:`create_sqlite_engine` starts every
+transaction with ``BEGIN IMMEDIATE``, which takes the database write lock
+up front, and turns on WAL so readers are not blocked meanwhile. A claim's
+select and update therefore run under one writer lock, and the update
+re-checks the claimable state so that connections from plain engines (whose
+transactions begin lazily) cannot double-claim either. ``depends_on``,
+``params`` and ``max_concurrency`` are stored as JSON text and queried with
+the JSON1 functions.
+
+Timestamps are UTC text in ``YYYY-MM-DD HH:MM:SS.SSS`` form, which sorts
+chronologically; :func:`timestamp` renders Python datetimes the same way.
+
+Not available on SQLite: the fair-share ordering, node affinity, the
+status counter triggers and the builder's ``SKIP LOCKED`` tick. Helpers
+asked for such a feature raise :class:`UnsupportedBackendError`.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine
+
+from .. import codec
+from ..ordering import CriticalPathOrder, OrderingPolicy, PriorityOrder, StrictOrder
+from .statements import statement
+
+# Highest Postgres migration the schema below corresponds to; bump both
+# together.
+SCHEMA_VERSION = 15
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Random version 4 UUID in canonical text form.
+_UUID = (
+    "lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4'"
+    " || substr(hex(randomblob(2)), 2) || '-'"
+    " || substr('89ab', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2)"
+    " || '-' || hex(randomblob(6)))"
+)
+
+_TASK_JSON_COLUMNS = ("depends_on", "params", "results")
+
+
+class UnsupportedBackendError(ValueError):
+    """Raised when a feature that needs Postgres is used on SQLite.
+
+    ``feature`` names the feature, e.g. ``"node affinity"``.
+    """
+
+    def __init__(self, feature: str) -> None:
+        super().__init__(f"{feature} is not supported on SQLite")
+        self.feature = feature
+
+
+SCHEMA: tuple[str, ...] = (
+    f"""
+    CREATE TABLE IF NOT EXISTS workflows (
+        id TEXT PRIMARY KEY DEFAULT ({_UUID}),
+        name TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        steps TEXT NOT NULL DEFAULT '[]',
+        critical_path TEXT,
+        created_at TEXT NOT NULL DEFAULT ({_NOW}),
+        updated_at TEXT,
+        UNIQUE (name, version)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY DEFAULT ({_UUID}),
+        workflow_id TEXT NOT NULL REFERENCES workflows(id),
+        status TEXT NOT NULL DEFAULT 'queued'
+            CHECK (status IN ('queued','running','done','error')),
+        progress REAL,
+        progress_weight REAL,
+        current_task_key TEXT,
+        priority INTEGER NOT NULL DEFAULT 0,
+        order_seq INTEGER,
+        options TEXT NOT NULL DEFAULT '{{}}',
+        scheduled_at TEXT,
+        error_code TEXT,
+        error_message TEXT,
+        created_at TEXT NOT NULL DEFAULT ({_NOW}),
+        started_at TEXT,
+        finished_at TEXT,
+        updated_at TEXT,
+        artifacts_purged_at TEXT
+    )
+    """,
+    # SQLite has no sequences; jobs inserted without order_seq get the next one.
+    """
+    CREATE TRIGGER IF NOT EXISTS jobs_order_seq AFTER INSERT ON jobs
+    WHEN NEW.order_seq IS NULL
+    BEGIN
+      UPDATE jobs SET order_seq = (SELECT COALESCE(max(order_seq), 0) + 1 FROM jobs)
+      WHERE rowid = NEW.rowid;
+    END
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS job_tasks (
+        id TEXT PRIMARY KEY DEFAULT ({_UUID}),
+        job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+        task_key TEXT NOT NULL,
+        service_name TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued'
+            CHECK (status IN ('queued','starting','running','done','error','skipped')),
+        depends_on TEXT NOT NULL DEFAULT '[]',
+        attempt INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        next_attempt_at TEXT,
+        priority INTEGER NOT NULL DEFAULT 0,
+        progress REAL,
+        weight REAL NOT NULL DEFAULT 1,
+        params TEXT NOT NULL DEFAULT '{{}}',
+        results TEXT,
+        assigned_node TEXT,
+        claimed_by TEXT,
+        claimed_at TEXT,
+        lease_expires_at TEXT,
+        lease_token INTEGER NOT NULL DEFAULT 0,
+        downstream_depth INTEGER NOT NULL DEFAULT 0,
+        remaining_work REAL,
+        started_at TEXT,
+        finished_at TEXT,
+        created_at TEXT NOT NULL DEFAULT ({_NOW}),
+        updated_at TEXT,
+        UNIQUE (job_id, task_key)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS task_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+        job_task_id TEXT REFERENCES job_tasks(id) ON DELETE CASCADE,
+        ts TEXT NOT NULL DEFAULT ({_NOW}),
+        source TEXT,
+        level TEXT NOT NULL CHECK (level IN ('debug','info','warn','error')),
+        type TEXT NOT NULL,
+        message TEXT,
+        data TEXT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS task_artifacts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+        job_task_id TEXT REFERENCES job_tasks(id) ON DELETE CASCADE,
+        kind TEXT NOT NULL CHECK (kind IN ('input','output','log')),
+        bucket TEXT NOT NULL,
+        key TEXT NOT NULL,
+        size_bytes INTEGER,
+        content_type TEXT,
+        checksum TEXT,
+        created_at TEXT NOT NULL DEFAULT ({_NOW})
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS nodes (
+        name TEXT PRIMARY KEY,
+        labels TEXT NOT NULL DEFAULT '{}',
+        last_seen TEXT,
+        awake_state TEXT NOT NULL DEFAULT 'unknown'
+            CHECK (awake_state IN ('unknown','awake','sleep')),
+        wake_method TEXT CHECK (wake_method IN ('wol','provider','script')),
+        mac TEXT,
+        provider_ref TEXT,
+        script TEXT,
+        max_concurrency TEXT NOT NULL DEFAULT '{}',
+        wake_requested_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS jobs_status_scheduled_at_idx"
+    " ON jobs (status, scheduled_at)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS jobs_order_seq_idx ON jobs (order_seq)",
+    "CREATE INDEX IF NOT EXISTS jobs_priority_order_idx"
+    " ON jobs (priority DESC, order_seq)",
+    "CREATE INDEX IF NOT EXISTS jobs_workflow_order_idx"
+    " ON jobs (workflow_id, order_seq)",
+    "CREATE INDEX IF NOT EXISTS job_tasks_claim_idx"
+    " ON job_tasks (service_name, next_attempt_at) WHERE status = 'queued'",
+    "CREATE INDEX IF NOT EXISTS job_tasks_lease_idx"
+    " ON job_tasks (service_name, lease_expires_at)"
+    " WHERE status IN ('starting', 'running')",
+    "CREATE INDEX IF NOT EXISTS job_tasks_job_status_idx"
+    " ON job_tasks (job_id, status)",
+    "CREATE INDEX IF NOT EXISTS job_tasks_node_finished_idx"
+    " ON job_tasks (assigned_node, finished_at) WHERE assigned_node IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS job_tasks_finished_at_idx"
+    " ON job_tasks (finished_at) WHERE finished_at IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS jobs_artifact_gc_idx ON jobs (finished_at, id)"
+    " WHERE finished_at IS NOT NULL AND artifacts_purged_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS task_artifacts_object_idx"
+    " ON task_artifacts (bucket, key)",
+    "CREATE INDEX IF NOT EXISTS task_events_job_ts_idx"
+    " ON task_events (job_id, ts DESC)",
+    "CREATE INDEX IF NOT EXISTS task_events_task_ts_idx"
+    " ON task_events (job_task_id, ts DESC)",
+    "CREATE INDEX IF NOT EXISTS task_artifacts_manifest_idx"
+    " ON task_artifacts (job_id, job_task_id, kind, id)",
+    "CREATE INDEX IF NOT EXISTS task_artifacts_checksum_idx"
+    " ON task_artifacts (checksum, size_bytes) WHERE checksum IS NOT NULL",
+)
+
+
+# Columns added after the first SQLite schema, keyed by the version that
+# added them; ``CREATE TABLE IF NOT EXISTS`` leaves existing tables alone.
+UPGRADES: dict[int, tuple[str, ...]] = {
+    13: ("ALTER TABLE jobs ADD COLUMN artifacts_purged_at TEXT",),
+}
+
+
+def is_sqlite(conn: Connection | Engine) -> bool:
+    """Whether ``conn``, a connection or engine, is connected to SQLite."""
+    return conn.dialect.name == "sqlite"
+
+
+def timestamp(value: datetime) -> str:
+    """Render ``value`` in the UTC text format used by the schema."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.astimezone(UTC).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def parse_timestamp(value: str | datetime) -> datetime:
+    """Return a timestamp read from the schema's text columns as aware UTC."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo is not None else value.replace(tzinfo=UTC)
+
+
+def create_sqlite_engine(url: str | Path, *, busy_timeout: float = 30.0) -> Engine:
+    """Create an engine for a SQLite database file.
+
+    Parameters
+    ----------
+    url:
+        ``sqlite:///`` URL or path of the database file.
+    busy_timeout:
+        Seconds a transaction waits for the write lock before failing.
+    """
+    url = str(url)
+    if not url.startswith("sqlite"):
+        url = f"sqlite:///{url}"
+    engine = create_engine(
+        url,
+        future=True,
+        json_serializer=codec.dumps,
+        json_deserializer=codec.loads,
+        connect_args={"timeout": busy_timeout, "check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_conn: Any, _record: Any) -> None:
+        # hand transaction control to the "begin" listener below
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn: Connection) -> None:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+def apply_schema(*, conn: Connection) -> list[int]:
+    """Create the tables and record :data:`SCHEMA_VERSION`; idempotent.
+
+    Databases created by an older version first get the columns listed in
+    :data:`UPGRADES`.
+
+    Returns ``[SCHEMA_VERSION]`` when the schema was created or upgraded,
+    otherwise an empty list, mirroring
+    :func:`accscore.db.migrations.apply_migrations`.
+    """
+    from .migrations import MIGRATIONS_TABLE
+
+    conn.execute(
+        statement(
+            f"""
+            CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT ({_NOW})
+            )
+            """
+        )
+    )
+    version = conn.execute(
+        statement(f"SELECT max(version) FROM {MIGRATIONS_TABLE}")
+    ).scalar()
+    if version is not None and version >= SCHEMA_VERSION:
+        return []
+    if version is not None:
+        for upgrade, statements in sorted(UPGRADES.items()):
+            if upgrade > version:
+                for ddl in statements:
+                    conn.exec_driver_sql(ddl)
+    for ddl in SCHEMA:
+        conn.exec_driver_sql(ddl)
+    conn.execute(
+        statement(
+            f"INSERT INTO {MIGRATIONS_TABLE} (version, name)"
+            " VALUES (:v, 'sqlite_schema')"
+        ),
+        {"v": SCHEMA_VERSION},
+    )
+    return [SCHEMA_VERSION]
+
+
+def decode_task(row: Mapping[Any, Any]) -> dict[str, Any]:
+    """Return a ``job_tasks`` row with its JSON columns decoded."""
+    task = dict(row)
+    for column in _TASK_JSON_COLUMNS:
+        if isinstance(task.get(column), str):
+            task[column] = codec.loads(task[column])
+    return task
+
+
+# -- claims ---------------------------------------------------------------
+
+_RUNNABLE_WHERE = """jt.service_name = :service
+      AND (
+        (jt.status = 'queued'
+         AND (jt.next_attempt_at IS NULL OR jt.next_attempt_at <= :now)
+         AND NOT EXISTS (
+           SELECT 1 FROM job_tasks dep, json_each(jt.depends_on) d
+           WHERE dep.job_id = jt.job_id
+             AND dep.task_key = d.value
+             AND dep.status <> 'done'
+         ))
+        OR (jt.status IN ('starting', 'running') AND jt.lease_expires_at < :now)
+      )"""
+
+_CLAIMABLE = (
+    "(status = 'queued'"
+    " OR (status IN ('starting', 'running') AND lease_expires_at < :now))"
+)
+
+
+def _order_by(ordering: OrderingPolicy | None) -> tuple[str, dict[str, Any]]:
+    if ordering is None or isinstance(ordering, StrictOrder | PriorityOrder):
+        return (ordering or StrictOrder()).order_by(), {}
+    if isinstance(ordering, CriticalPathOrder):
+        return (
+            "(COALESCE(jt.remaining_work, 0)"
+            " + :cp_aging * (julianday(:now) - julianday(jt.created_at)) * 86400) DESC,"
+            " jt.downstream_depth DESC, j.order_seq ASC, jt.created_at ASC, jt.id ASC",
+            ordering.params(),
+        )
+    raise UnsupportedBackendError(type(ordering).__name__)
+
+
+def get_capacity(
+    service_name: str, limit: int, *, conn: Connection, now: datetime
+) -> int:
+    """SQLite version of :func:`accscore.db.tasks._get_capacity`."""
+    running: int = conn.execute(
+        statement(
+            """
+            SELECT count(*) FROM job_tasks
+            WHERE service_name = :service
+              AND status IN ('starting', 'running')
+              AND (lease_expires_at IS NULL OR lease_expires_at >= :now)
+            """
+        ),
+        {"service": service_name, "now": timestamp(now)},
+    ).scalar_one()
+    max_concurrency: int | None = conn.execute(
+        statement(
+            """
+            SELECT sum(CAST(json_extract(max_concurrency, :path) AS INTEGER))
+            FROM nodes
+            WHERE json_type(max_concurrency, :path) IS NOT NULL
+            """
+        ),
+        {"path": f'$."{service_name}"'},
+    ).scalar_one()
+    if max_concurrency is None:
+        return limit
+    return max(0, min(limit, max_concurrency - running))
+
+
+def select_runnable(
+    service_name: str,
+    limit: int,
+    *,
+    conn: Connection,
+    now: datetime,
+    ordering: OrderingPolicy | None = None,
+) -> list[dict[str, Any]]:
+    """Return up to ``limit`` runnable tasks in claim order."""
+    order_by, params = _order_by(ordering)
+    head = ""
+    if isinstance(ordering, CriticalPathOrder):
+        # rank the same head of the global order as on Postgres
+        head = f"""
+              AND jt.id IN (
+                SELECT jt.id
+                FROM job_tasks jt
+                JOIN jobs j ON j.id = jt.job_id
+                WHERE {_RUNNABLE_WHERE}
+                ORDER BY {StrictOrder().order_by()}
+                LIMIT :cp_window
+              )"""
+    rows = conn.execute(
+        statement(
+            f"""
+            SELECT jt.*
+            FROM job_tasks jt
+            JOIN jobs j ON j.id = jt.job_id
+            WHERE {_RUNNABLE_WHERE}{head}
+            ORDER BY {order_by}
+            LIMIT :limit
+            """
+        ),
+        {**params, "service": service_name, "now": timestamp(now), "limit": limit},
+    ).mappings()
+    return [decode_task(row) for row in rows]
+
+
+def claim_ids(
+    task_ids: Sequence[Any],
+    agent: str,
+    *,
+    conn: Connection,
+    now: datetime,
+    lease_ttl: timedelta,
+    assigned_node: str | None = None,
+) -> list[dict[str, Any]]:
+    """Claim tasks that are still claimable and return the updated rows.
+
+    Rows come back in the order of ``task_ids``; tasks taken by another
+    claimer in the meantime are missing.
+    """
+    if not task_ids:
+        return []
+    ids = [str(task_id) for task_id in task_ids]
+    rows = conn.execute(
+        statement(
+            f"""
+            UPDATE job_tasks
+            SET status = 'starting', claimed_by = :agent, claimed_at = :now,
+                assigned_node = COALESCE(:assigned_node, assigned_node),
+                lease_expires_at = :expires, lease_token = lease_token + 1
+            WHERE id IN (SELECT value FROM json_each(:ids)) AND {_CLAIMABLE}
+            RETURNING *
+            """
+        ),
+        {
+            "agent": agent,
+            "assigned_node": assigned_node,
+            "now": timestamp(now),
+            "expires": timestamp(now + lease_ttl),
+            "ids": codec.dumps(ids),
+        },
+    ).mappings()
+    claimed = {row["id"]: decode_task(row) for row in rows}
+    return [claimed[task_id] for task_id in ids if task_id in claimed]
+
+
+def claim_tasks(
+    service: str,
+    limit: int,
+    agent: str,
+    *,
+    conn: Connection,
+    now: datetime,
+    lease_ttl: timedelta,
+    ordering: OrderingPolicy | None = None,
+    assigned_node: str | None = None,
+) -> list[dict[str, Any]]:
+    """Select and claim runnable tasks in one write transaction."""
+    selected = select_runnable(service, limit, conn=conn, now=now, ordering=ordering)
+    return claim_ids(
+        [task["id"] for task in selected],
+        agent,
+        conn=conn,
+        now=now,
+        lease_ttl=lease_ttl,
+        assigned_node=assigned_node,
+    )
+
+
+def renew_leases(
+    leases: Mapping[str, int], *, conn: Connection, expires: datetime
+) -> set[str]:
+    """SQLite version of :func:`accscore.db.leases.renew_leases`."""
+    rows = conn.execute(
+        statement(
+            """
+            UPDATE job_tasks
+            SET lease_expires_at = :expires
+            WHERE id IN (SELECT key FROM json_each(:leases))
+              AND lease_token = json_extract(:leases, '$."' || id || '"')
+              AND status IN ('starting', 'running')
+            RETURNING id
+            """
+        ),
+        {"expires": timestamp(expires), "leases": _leases_json(leases)},
+    )
+    return {row[0] for row in rows}
+
+
+def release_tasks(leases: Mapping[str, int], *, conn: Connection) -> set[str]:
+    """SQLite version of :func:`accscore.db.leases.release_tasks`."""
+    rows = conn.execute(
+        statement(
+            f"""
+            UPDATE job_tasks
+            SET status = 'queued', claimed_by = NULL, claimed_at = NULL,
+                lease_expires_at = NULL, updated_at = {_NOW}
+            WHERE id IN (SELECT key FROM json_each(:leases))
+              AND lease_token = json_extract(:leases, '$."' || id || '"')
+              AND status = 'starting'
+            RETURNING id
+            """
+        ),
+        {"leases": _leases_json(leases)},
+    )
+    return {row[0] for row in rows}
+
+
+def _leases_json(leases: Mapping[str, int]) -> str:
+    return codec.dumps({str(task_id): int(token) for task_id, token in leases.items()})
+
+
+# -- jobs -----------------------------------------------------------------
+
+
+def next_order_seq(count: int, *, conn: Connection) -> int:
+    """Return the first of ``count`` contiguous ``order_seq`` values.
+
+    The caller's ``BEGIN IMMEDIATE`` transaction holds the write lock, so no
+    other submission can take the same range.
+    """
+    return conn.execute(
+        statement("SELECT COALESCE(max(order_seq), 0) + 1 FROM jobs")
+    ).scalar_one()
+
+
+def instantiate_jobs(
+    job_ids: Sequence[Any], *, conn: Connection, start: bool = True
+) -> int:
+    """Create the tasks of many jobs from their workflows' steps.
+
+    With ``start`` the jobs are also set to ``running``. Returns the number
+    of jobs found.
+    """
+    ids = codec.dumps([str(job_id) for job_id in job_ids])
+    conn.execute(
+        statement(
+            """
+            INSERT INTO job_tasks
+                (job_id, task_key, service_name, status, depends_on, params, weight,
+                 downstream_depth, remaining_work)
+            SELECT j.id, json_extract(s.value, '$.key'),
+                   json_extract(s.value, '$.service'), 'queued',
+                   COALESCE(json_extract(s.value, '$.depends_on'), '[]'),
+                   COALESCE(json_extract(s.value, '$.default_params'), '{}'),
+                   COALESCE(json_extract(s.value, '$.weight'), 1),
+                   COALESCE(json_extract(
+                     w.critical_path,
+                     '$."' || json_extract(s.value, '$.key') || '".depth'
+                   ), 0),
+                   json_extract(
+                     w.critical_path,
+                     '$."' || json_extract(s.value, '$.key') || '".remaining'
+                   )
+            FROM jobs j
+            JOIN workflows w ON w.id = j.workflow_id, json_each(w.steps) s
+            WHERE j.id IN (SELECT value FROM json_each(:job_ids))
+            ON CONFLICT (job_id, task_key) DO NOTHING
+            """
+        ),
+        {"job_ids": ids},
+    )
+    status = (
+        f", status = 'running', started_at = COALESCE(started_at, {_NOW})"
+        if start
+        else ""
+    )
+    result = conn.execute(
+        statement(
+            f"""
+            UPDATE jobs
+            SET progress = COALESCE(progress, 0),
+                progress_weight = (
+                  SELECT COALESCE(
+                    sum(COALESCE(json_extract(s.value, '$.weight'), 1)), 0
+                  )
+                  FROM workflows w, json_each(w.steps) s
+                  WHERE w.id = jobs.workflow_id
+                ){status}
+            WHERE id IN (SELECT value FROM json_each(:job_ids))
+            """
+        ),
+        {"job_ids": ids},
+    )
+    return result.rowcount
+
+
+# -- task transitions -----------------------------------------------------
+#
+# Each returns the number of task rows matched, so callers can apply the
+# same fencing check as on Postgres.
+
+_FENCE = "(:lease_token IS NULL OR lease_token = :lease_token)"
+
+_JOB_PROGRESS = """min(100, max(0,
+      COALESCE(progress, 0) + COALESCE(:delta / NULLIF(COALESCE(
+        progress_weight,
+        (SELECT sum(w.weight) FROM job_tasks w WHERE w.job_id = jobs.id)
+      ), 0), 0)
+    ))"""
+
+_NEXT_TASK_KEY = """COALESCE(
+      (SELECT o.task_key FROM job_tasks o
+       WHERE o.job_id = jobs.id AND o.id <> :task_id
+         AND o.status IN ('starting', 'running')
+       ORDER BY o.started_at DESC NULLS LAST
+       LIMIT 1),
+      :task_key
+    )"""
+
+
+def _fenced_task(task_id: str, lease_token: int | None, conn: Connection) -> Any:
+    return conn.execute(
+        statement(
+            f"""
+            SELECT job_id, task_key, weight, COALESCE(progress, 0) AS progress
+            FROM job_tasks WHERE id = :task_id AND {_FENCE}
+            """
+        ),
+        {"task_id": str(task_id), "lease_token": lease_token},
+    ).one_or_none()
+
+
+def mark_task_running(
+    task_id: str, *, conn: Connection, lease_token: int | None
+) -> int:
+    """SQLite version of :func:`accscore.db.mark_task_running`."""
+    task = conn.execute(
+        statement(
+            f"""
+            UPDATE job_tasks
+            SET status = 'running', started_at = COALESCE(started_at, {_NOW}),
+                updated_at = {_NOW}
+            WHERE id = :task_id AND {_FENCE}
+            RETURNING job_id, task_key
+            """
+        ),
+        {"task_id": str(task_id), "lease_token": lease_token},
+    ).one_or_none()
+    if task is None:
+        return 0
+    conn.execute(
+        statement(
+            f"""
+            UPDATE jobs
+            SET current_task_key = :task_key, started_at = COALESCE(started_at, {_NOW}),
+                updated_at = {_NOW}
+            WHERE id = :job_id
+            """
+        ),
+        {"task_key": task.task_key, "job_id": task.job_id},
+    )
+    return 1
+
+
+def update_task_progress(
+    task_id: str, percent: float, *, conn: Connection, lease_token: int | None
+) -> int:
+    """SQLite version of :func:`accscore.db.update_task_progress`."""
+    task = _fenced_task(task_id, lease_token, conn)
+    if task is None:
+        return 0
+    result = conn.execute(
+        statement(
+            f"UPDATE job_tasks SET progress = :percent, updated_at = {_NOW}"
+            f" WHERE id = :task_id AND {_FENCE}"
+        ),
+        {"task_id": str(task_id), "percent": percent, "lease_token": lease_token},
+    )
+    if not result.rowcount:
+        return 0
+    conn.execute(
+        statement(
+            f"UPDATE jobs SET progress = {_JOB_PROGRESS}, updated_at = {_NOW}"
+            " WHERE id = :job_id"
+        ),
+        {
+            "job_id": task.job_id,
+            "delta": task.weight * (percent - float(task.progress)),
+        },
+    )
+    return 1
+
+
+def mark_task_done(
+    task_id: str,
+    results: dict[str, Any] | None,
+    *,
+    conn: Connection,
+    lease_token: int | None,
+) -> int:
+    """SQLite version of :func:`accscore.db.mark_task_done`."""
+    task = _fenced_task(task_id, lease_token, conn)
+    if task is None:
+        return 0
+    result = conn.execute(
+        statement(
+            f"""
+            UPDATE job_tasks
+            SET status = 'done', progress = 100, results = COALESCE(:results, results),
+                lease_expires_at = NULL, finished_at = {_NOW}, updated_at = {_NOW}
+            WHERE id = :task_id AND {_FENCE}
+            """,
+            json=("results",),
+        ),
+        {"task_id": str(task_id), "results": results, "lease_token": lease_token},
+    )
+    if not result.rowcount:
+        return 0
+    conn.execute(
+        statement(
+            f"""
+            UPDATE jobs
+            SET progress = {_JOB_PROGRESS}, current_task_key = {_NEXT_TASK_KEY},
+                updated_at = {_NOW}
+            WHERE id = :job_id
+            """
+        ),
+        {
+            "job_id": task.job_id,
+            "task_id": str(task_id),
+            "task_key": task.task_key,
+            "delta": task.weight * (100 - float(task.progress)),
+        },
+    )
+    return 1
+
+
+def mark_task_error(
+    task_id: str,
+    error_code: str,
+    message: str,
+    *,
+    conn: Connection,
+    lease_token: int | None,
+) -> int:
+    """SQLite version of :func:`accscore.db.mark_task_error`."""
+    task = conn.execute(
+        statement(
+            f"""
+            UPDATE job_tasks
+            SET status = 'error', lease_expires_at = NULL, finished_at = {_NOW},
+                updated_at = {_NOW},
+                results = json_set(
+                  COALESCE(results, '{{}}'), '$.error',
+                  json_object('code', :code, 'message', :message)
+                )
+            WHERE id = :task_id AND {_FENCE}
+            RETURNING job_id, task_key
+            """
+        ),
+        {
+            "task_id": str(task_id),
+            "code": error_code,
+            "message": message,
+            "lease_token": lease_token,
+        },
+    ).one_or_none()
+    if task is None:
+        return 0
+    conn.execute(
+        statement(
+            f"UPDATE jobs SET current_task_key = {_NEXT_TASK_KEY}, updated_at = {_NOW}"
+            " WHERE id = :job_id"
+        ),
+        {"job_id": task.job_id, "task_id": str(task_id), "task_key": task.task_key},
+    )
+    return 1
+
+
+__all__ = [
+    "SCHEMA",
+    "SCHEMA_VERSION",
+    "UPGRADES",
+    "UnsupportedBackendError",
+    "apply_schema",
+    "claim_ids",
+    "claim_tasks",
+    "create_sqlite_engine",
+    "decode_task",
+    "get_capacity",
+    "instantiate_jobs",
+    "is_sqlite",
+    "mark_task_done",
+    "mark_task_error",
+    "mark_task_running",
+    "next_order_seq",
+    "parse_timestamp",
+    "release_tasks",
+    "renew_leases",
+    "select_runnable",
+    "timestamp",
+    "update_task_progress",
+]
@@ -0,0 +1,70 @@
+"""Shared statement registry for the SQL issued by accscore.
+
+Every helper obtains its SQL through :func:`statement`, which parses a SQL
+string into a :class:`~sqlalchemy.sql.expression.TextClause` once and hands
+out the same object afterwards. Reusing the object lets SQLAlchemy's
+compiled cache hit without re-parsing bind parameters on every call.
+
+Server-side preparation is a driver feature: with psycopg 3
+(``postgresql+psycopg://``) and ``ACC_DB_PREPARED_STATEMENTS=true``,
+:func:`connect_args` sets ``prepare_threshold`` so repeated statements are
+prepared once per connection and Postgres skips parsing them on later
+executions. It is off by default because PgBouncer in transaction pooling
+mode cannot track per-connection prepared statements. psycopg2 has no
+server-side preparation and only benefits from the client-side cache.
+
+The registry is keyed by the SQL text, so only fixed statements belong in
+it. Bulk writers pass their rows as array parameters (``unnest``) instead of
+rendering one placeholder per row, which would add an entry per batch size
+and evict the hot statements.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.expression import TextClause
+
+from .types import JSON_TYPE, TEXT_ARRAY_TYPE
+
+# Prepare from the second execution on, so one-off statements (DDL,
+# diagnostics) do not occupy the driver's prepared statement cache.
+_PREPARE_THRESHOLD = 1
+
+
+@lru_cache(maxsize=1024)
+def statement(
+    sql: str, *, json: tuple[str, ...] = (), arrays: tuple[str, ...] = ()
+) -> TextClause:
+    """Return the shared :class:`TextClause` for ``sql``, parsing it once.
+
+    ``json`` names bind parameters whose values are encoded with
+    :mod:`accscore.codec`, ``arrays`` names text array parameters; see
+    :mod:`accscore.db.types`.
+    """
+    clause = text(sql)
+    typed = [bindparam(name, type_=JSON_TYPE) for name in json]
+    typed += [bindparam(name, type_=TEXT_ARRAY_TYPE) for name in arrays]
+    return clause.bindparams(*typed) if typed else clause
+
+
+def connect_args(dsn: str, *, prepared: bool = False) -> dict[str, Any]:
+    """Return ``create_engine`` connect args controlling prepared statements.
+
+    Parameters
+    ----------
+    dsn:
+        Database URL the engine is created for.
+    prepared:
+        Use server-side prepared statements where the driver supports them.
+        Leave off behind PgBouncer in transaction pooling mode.
+    """
+    if make_url(dsn).get_driver_name() == "psycopg":
+        return {"prepare_threshold": _PREPARE_THRESHOLD if prepared else None}
+    return {}
+
+
+__all__ = ["statement", "connect_args"]
@@ -0,0 +1,136 @@
+"""Queue status summaries read from the incrementally maintained counters.
+
+Migration 9 installs statement-level triggers on ``job_tasks`` and ``jobs``
+that keep ``task_status_counts`` and ``job_status_counts`` in step with every
+insert, update and delete. Reading them costs a few rows per service instead
+of a scan of ``job_tasks``.
+
+Called without ``conn`` the helpers read from a replica, see
+:mod:`accscore.db.routing`.
+
+SQLite has no counter triggers; there the helpers count ``job_tasks`` and
+``jobs`` directly, which is fine at single-box sizes.
+"""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy.engine import Connection
+
+from .. import codec
+from . import sqlite
+from .routing import reads_from_replica
+from .statements import statement
+
+
+class ServiceStatus(NamedTuple):
+    """Queue summary of one service."""
+
+    service_name: str
+    queued: int
+    in_flight: int
+    oldest_queued_age: timedelta | None
+    counts: dict[str, int]
+
+
+_OLDEST_QUEUED_SQL = """
+SELECT s.service_name,
+       (SELECT min(jt.created_at) FROM job_tasks jt
+        WHERE jt.service_name = s.service_name AND jt.status = 'queued') AS created_at
+FROM unnest(CAST(:services AS text[])) AS s(service_name)
+"""
+
+_OLDEST_QUEUED_SQLITE_SQL = """
+SELECT service_name, min(created_at) AS created_at
+FROM job_tasks
+WHERE service_name IN (SELECT value FROM json_each(:services)) AND status = 'queued'
+GROUP BY service_name
+"""
+
+
+@reads_from_replica
+def task_status_counts(*, conn: Connection | None = None) -> dict[str, dict[str, int]]:
+    """Return task counts per service and status."""
+    assert conn is not None  # supplied by reads_from_replica
+    source = "job_tasks" if sqlite.is_sqlite(conn) else "task_status_counts"
+    total = "count(*)" if sqlite.is_sqlite(conn) else "sum(count)"
+    rows = conn.execute(
+        statement(
+            f"""
+            SELECT service_name, status, {total} AS n
+            FROM {source}
+            GROUP BY service_name, status
+            HAVING {total} <> 0
+            """
+        )
+    )
+    counts: dict[str, dict[str, int]] = {}
+    for row in rows:
+        counts.setdefault(row.service_name, {})[row.status] = int(row.n)
+    return counts
+
+
+@reads_from_replica
+def job_status_counts(*, conn: Connection | None = None) -> dict[str, int]:
+    """Return job counts per status."""
+    assert conn is not None  # supplied by reads_from_replica
+    source = "jobs" if sqlite.is_sqlite(conn) else "job_status_counts"
+    total = "count(*)" if sqlite.is_sqlite(conn) else "sum(count)"
+    rows = conn.execute(
+        statement(
+            f"""
+            SELECT status, {total} AS n
+            FROM {source}
+            GROUP BY status
+            HAVING {total} <> 0
+            """
+        )
+    )
+    return {row.status: int(row.n) for row in rows}
+
+
+@reads_from_replica
+def service_status(
+    *, conn: Connection | None = None, now: datetime | None = None
+) -> dict[str, ServiceStatus]:
+    """Return queue depth, in-flight count and oldest queued age per service.
+
+    ``queued`` counts all queued tasks, including those still waiting for
+    dependencies or a retry backoff; ``in_flight`` counts ``starting`` and
+    ``running`` tasks. The oldest queued age is measured from ``created_at``
+    with one index probe per service that has queued tasks.
+    """
+    assert conn is not None  # supplied by reads_from_replica
+    now = now or datetime.now(UTC)
+    counts = task_status_counts(conn=conn)
+    backlog = sorted(
+        name for name, by_status in counts.items() if by_status.get("queued")
+    )
+    oldest: dict[str, datetime] = {}
+    if backlog:
+        on_sqlite = sqlite.is_sqlite(conn)
+        rows = conn.execute(
+            statement(_OLDEST_QUEUED_SQLITE_SQL if on_sqlite else _OLDEST_QUEUED_SQL),
+            {"services": codec.dumps(backlog) if on_sqlite else backlog},
+        )
+        for row in rows:
+            if row.created_at and on_sqlite:
+                oldest[row.service_name] = sqlite.parse_timestamp(row.created_at)
+            elif row.created_at:
+                oldest[row.service_name] = row.created_at
+
+    return {
+        name: ServiceStatus(
+            service_name=name,
+            queued=by_status.get("queued", 0),
+            in_flight=by_status.get("starting", 0) + by_status.get("running", 0),
+            oldest_queued_age=now - oldest[name] if name in oldest else None,
+            counts=by_status,
+        )
+        for name, by_status in sorted(counts.items())
+    }
+
+
+__all__ = ["ServiceStatus", "job_status_counts", "service_status", "task_status_counts"]
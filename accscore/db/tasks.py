@@ -2,38 +2,99 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 from uuid import UUID
 
-from sqlalchemy import text
 from sqlalchemy.engine import Connection
 
+from ..affinity import NodeAffinity
+from ..ordering import DEFAULT_ORDERING, OrderingPolicy
+from . import sqlite
+from .leases import DEFAULT_LEASE_TTL
+from .statements import statement
+
 
 JobTaskRow = dict[str, Any]
 
 
+# Queued tasks whose dependencies are done, plus claimed tasks whose lease
+# expired; the latter are taken over in the same pass.
+_RUNNABLE_WHERE = """jt.service_name = :service
+      AND (
+        (jt.status = 'queued'
+         AND (jt.next_attempt_at IS NULL OR jt.next_attempt_at <= :now)
+         AND NOT EXISTS (
+           SELECT 1 FROM job_tasks dep
+           WHERE dep.job_id = jt.job_id
+             AND dep.task_key = ANY(jt.depends_on)
+             AND dep.status <> 'done'
+         ))
+        OR (jt.status IN ('starting', 'running') AND jt.lease_expires_at < :now)
+      )"""
+
+_SELECT_RUNNABLE_SQL = DEFAULT_ORDERING.select_sql(_RUNNABLE_WHERE)
+
+
+_CLAIM_SQL = """
+        UPDATE job_tasks
+        SET claimed_by = :node,
+            assigned_node = :node,
+            status = 'starting',
+            claimed_at = :now,
+            lease_expires_at = :now + :lease_ttl,
+            lease_token = lease_token + 1
+        WHERE id = ANY(:ids)
+"""
+
+
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def _get_capacity(service_name: str, limit: int, *, conn: Connection) -> int:
-    """Compute remaining capacity for a service respecting node limits."""
+def _runnable_select(
+    ordering: OrderingPolicy | None,
+    affinity: NodeAffinity | None,
+    *,
+    lock: bool = True,
+) -> tuple[str, dict[str, Any]]:
+    """Render the runnable select and its extra bind parameters."""
+    ordering = ordering or DEFAULT_ORDERING
+    params = ordering.params()
+    if affinity is None:
+        return ordering.select_sql(_RUNNABLE_WHERE, lock=lock), params
+
+    params.update(affinity.params())
+    where = f"{_RUNNABLE_WHERE}\n      AND {affinity.where()}"
+    return ordering.select_sql(where, affinity.prefer(), lock=lock), params
+
+
+def _get_capacity(
+    service_name: str, limit: int, *, conn: Connection, now: datetime | None = None
+) -> int:
+    """Compute remaining capacity for a service respecting node limits.
+
+    Tasks with an expired lease do not count as running since the claim
+    query hands them out again.
+    """
+    if sqlite.is_sqlite(conn):
+        return sqlite.get_capacity(service_name, limit, conn=conn, now=now or _utcnow())
 
     running = conn.execute(
-        text(
+        statement(
             """
             SELECT count(*)
             FROM job_tasks
             WHERE service_name = :service
               AND status IN ('starting', 'running')
+              AND (lease_expires_at IS NULL OR lease_expires_at >= :now)
             """
         ),
-        {"service": service_name},
+        {"service": service_name, "now": now or _utcnow()},
     ).scalar_one()
 
     max_concurrency = conn.execute(
-        text(
+        statement(
             """
             SELECT sum((max_concurrency->>:service)::int)
             FROM nodes
@@ -58,40 +119,35 @@ def select_runnable(
     *,
     conn: Connection,
     now: Optional[datetime] = None,
+    ordering: OrderingPolicy | None = None,
+    affinity: NodeAffinity | None = None,
 ) -> list[JobTaskRow]:
     """Select runnable tasks for a service using row-level locks.
 
     The caller is responsible for running this inside a transaction so that the
     selected rows remain locked until :func:`claim_tasks` is invoked.
+    Tasks in ``starting``/``running`` whose lease expired before ``now`` are
+    selected as well.
+    ``ordering`` selects the claim order; the strict global job order is used
+    when omitted. ``affinity`` restricts the selection to tasks whose label
+    requirements and home node suit the claiming node.
     """
 
     now = now or _utcnow()
-    capacity = _get_capacity(service_name, limit, conn=conn)
+    capacity = _get_capacity(service_name, limit, conn=conn, now=now)
     if capacity <= 0:
         return []
-
-    sql = text(
-        """
-        SELECT jt.*
-        FROM job_tasks jt
-        JOIN jobs j ON j.id = jt.job_id
-        WHERE jt.service_name = :service
-          AND jt.status = 'queued'
-          AND (jt.next_attempt_at IS NULL OR jt.next_attempt_at <= :now)
-          AND NOT EXISTS (
-            SELECT 1 FROM job_tasks dep
-            WHERE dep.job_id = jt.job_id
-              AND dep.task_key = ANY(jt.depends_on)
-              AND dep.status <> 'done'
-          )
-        ORDER BY j.order_seq ASC, jt.created_at ASC, jt.id ASC
-        FOR UPDATE SKIP LOCKED
-        LIMIT :limit
-        """
-    )
-
+    if sqlite.is_sqlite(conn):
+        if affinity is not None:
+            raise sqlite.UnsupportedBackendError("node affinity")
+        return sqlite.select_runnable(
+            service_name, capacity, conn=conn, now=now, ordering=ordering
+        )
+
+    select_sql, params = _runnable_select(ordering, affinity)
     rows = conn.execute(
-        sql, {"service": service_name, "now": now, "limit": capacity}
+        statement(select_sql),
+        {**params, "service": service_name, "now": now, "limit": capacity},
     ).mappings()
     return [dict(row) for row in rows]
 
@@ -102,23 +158,32 @@ def claim_tasks(
     *,
     conn: Connection,
     now: Optional[datetime] = None,
+    lease_ttl: timedelta = DEFAULT_LEASE_TTL,
 ) -> int:
-    """Claim previously selected tasks for a node."""
+    """Claim previously selected tasks for a node.
 
+    Each claim takes a lease until ``now + lease_ttl`` and increments the
+    task's ``lease_token``. Since the rows stay locked from
+    :func:`select_runnable`, the new fencing token is the selected row's
+    ``lease_token + 1``.
+    """
     if not task_ids:
         return 0
 
     now = now or _utcnow()
-    sql = text(
-        """
-        UPDATE job_tasks
-        SET claimed_by = :node,
-            assigned_node = :node,
-            status = 'starting',
-            claimed_at = :now
-        WHERE id = ANY(:ids)
-        """
+    if sqlite.is_sqlite(conn):
+        claimed = sqlite.claim_ids(
+            task_ids,
+            node_name,
+            conn=conn,
+            now=now,
+            lease_ttl=lease_ttl,
+            assigned_node=node_name,
+        )
+        return len(claimed)
+
+    result = conn.execute(
+        statement(_CLAIM_SQL),
+        {"node": node_name, "now": now, "lease_ttl": lease_ttl, "ids": list(task_ids)},
     )
-
-    result = conn.execute(sql, {"node": node_name, "now": now, "ids": list(task_ids)})
     return result.rowcount or 0
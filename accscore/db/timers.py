@@ -0,0 +1,137 @@
+"""Upcoming due times of delayed retries and scheduled jobs.
+
+Queued tasks with a future ``next_attempt_at`` become claimable, and queued
+jobs with a future ``scheduled_at`` become due for the builder, at a known
+time. These helpers read those times within a window ahead through the
+partial ``job_tasks_claim_idx`` and ``jobs_status_scheduled_at_idx``
+indexes, so :class:`accscore.agents.wakeups.WakeupScheduler` can wake the
+claim and builder loops exactly then instead of waiting for their next poll.
+
+With ``after`` and ``changed_since`` only the times a caller has not seen yet
+are returned: those past ``after``, the end of the window it loaded before,
+and those of rows written since ``changed_since`` (``updated_at``, else
+``created_at``), i.e. retries and jobs scheduled in the meantime.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, NamedTuple
+
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Connection
+
+from . import sqlite
+from .statements import statement
+
+_ATTEMPTS_SQL = """
+SELECT DISTINCT service_name AS service, next_attempt_at AS due_at
+FROM job_tasks
+WHERE status = 'queued'
+  AND service_name IN :services
+  AND next_attempt_at > :now AND next_attempt_at <= :until
+  {changed}
+ORDER BY due_at
+LIMIT :limit
+"""
+
+_SCHEDULES_SQL = """
+SELECT DISTINCT scheduled_at AS due_at
+FROM jobs
+WHERE status = 'queued'
+  AND scheduled_at > :now AND scheduled_at <= :until
+  {changed}
+ORDER BY due_at
+LIMIT :limit
+"""
+
+_CHANGED_SQL = (
+    "AND ({due} > :after OR COALESCE(updated_at, created_at) >= :changed_since)"
+)
+
+
+class DueTime(NamedTuple):
+    """When queued work becomes due; ``service`` is ``None`` for jobs."""
+
+    due_at: datetime
+    service: str | None
+
+
+def _params(
+    conn: Connection,
+    now: datetime,
+    until: datetime,
+    after: datetime | None,
+    changed_since: datetime | None,
+    limit: int,
+) -> tuple[str, dict[str, Any]]:
+    if (after is None) != (changed_since is None):
+        raise ValueError("after and changed_since go together")
+    times = {"now": now, "until": until, "after": after, "changed_since": changed_since}
+    on_sqlite = sqlite.is_sqlite(conn)
+    params: dict[str, Any] = {"limit": limit}
+    for name, value in times.items():
+        if value is not None:
+            params[name] = sqlite.timestamp(value) if on_sqlite else value
+    return ("" if after is None else _CHANGED_SQL), params
+
+
+def upcoming_attempts(
+    services: Sequence[str],
+    *,
+    conn: Connection,
+    now: datetime,
+    until: datetime,
+    after: datetime | None = None,
+    changed_since: datetime | None = None,
+    limit: int = 1000,
+) -> list[DueTime]:
+    """Return the distinct ``next_attempt_at`` of queued tasks due in ``(now, until]``.
+
+    Parameters
+    ----------
+    services:
+        Services whose tasks are considered.
+    conn:
+        Open SQLAlchemy connection.
+    now, until:
+        Window of due times.
+    after, changed_since:
+        Only return times past ``after`` or of rows written since
+        ``changed_since``; both or neither must be given.
+    limit:
+        Maximum number of times, earliest first.
+    """
+    if not services:
+        return []
+    changed, params = _params(conn, now, until, after, changed_since, limit)
+    sql = statement(
+        _ATTEMPTS_SQL.format(changed=changed.format(due="next_attempt_at"))
+    ).bindparams(bindparam("services", expanding=True))
+    rows = conn.execute(sql, {**params, "services": list(services)})
+    return [DueTime(sqlite.parse_timestamp(row.due_at), row.service) for row in rows]
+
+
+def upcoming_schedules(
+    *,
+    conn: Connection,
+    now: datetime,
+    until: datetime,
+    after: datetime | None = None,
+    changed_since: datetime | None = None,
+    limit: int = 1000,
+) -> list[DueTime]:
+    """Return the distinct ``scheduled_at`` of queued jobs due in ``(now, until]``.
+
+    Parameters are those of :func:`upcoming_attempts`.
+    """
+    changed, params = _params(conn, now, until, after, changed_since, limit)
+    sql = statement(_SCHEDULES_SQL.format(changed=changed.format(due="scheduled_at")))
+    return [
+        DueTime(sqlite.parse_timestamp(row.due_at), None)
+        for row in conn.execute(sql, params)
+    ]
+
+
+__all__ = ["DueTime", "upcoming_attempts", "upcoming_schedules"]
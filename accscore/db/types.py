@@ -0,0 +1,77 @@
+"""Bind parameter types for the raw SQL helpers.
+
+Helpers declare which parameters carry JSON or text arrays via
+:func:`accscore.db.statements.statement`; the types below then encode the
+values for the connected dialect, so call sites no longer branch on it.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Dialect
+from sqlalchemy.types import Text, TypeDecorator, TypeEngine
+
+from .. import codec
+
+
+def _encode(value: Any) -> str | None:
+    return None if value is None else codec.dumps(value)
+
+
+class CodecJSON(TypeDecorator):
+    """JSON encoded with :mod:`accscore.codec` regardless of engine settings.
+
+    Binds as ``jsonb`` on Postgres and as text elsewhere (SQLite stores the
+    document as is).
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        """Use ``jsonb`` on Postgres and text elsewhere."""
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.JSONB())
+        return dialect.type_descriptor(Text())
+
+    def bind_processor(self, dialect: Dialect) -> Callable[[Any], str | None]:
+        """Encode bound values with :mod:`accscore.codec`.
+
+        Replaces the JSONB processor, which would encode with the engine's
+        serializer; the driver receives the finished document.
+        """
+        return _encode
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Any:
+        """Decode documents the driver returns as text."""
+        return codec.loads(value) if isinstance(value, str | bytes) else value
+
+
+class TextArray(TypeDecorator):
+    """``text[]`` on Postgres, a JSON array on dialects without arrays."""
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        """Use ``text[]`` on Postgres and text elsewhere."""
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.ARRAY(Text))
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value: Any, dialect: Dialect) -> Any:
+        """Pass a list to Postgres and a JSON array to other dialects."""
+        if value is None:
+            return None
+        if dialect.name == "postgresql":
+            return list(value)
+        return codec.dumps(list(value))
+
+
+JSON_TYPE = CodecJSON()
+TEXT_ARRAY_TYPE = TextArray()
+
+__all__ = ["CodecJSON", "JSON_TYPE", "TEXT_ARRAY_TYPE", "TextArray"]
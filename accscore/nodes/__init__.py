@@ -0,0 +1 @@
+"""Service node management: waking nodes ahead of demand and sleeping idle ones."""
@@ -0,0 +1,356 @@
+"""Wake nodes ahead of demand and mark idle ones for sleep.
+
+Demand per service is the number of tasks expected to want a slot within the
+planning horizon: tasks already queued or in flight (read from the status
+counters) plus the steps of queued jobs that start within the horizon. A
+job's steps are placed on the timeline with :func:`earliest_starts` from its
+``scheduled_at``, using the step durations behind the workflow's stored
+critical-path hints (see :func:`accscore.critical_path.refresh_critical_path`),
+so a render step an hour into a job does not wake the render box now.
+Planning reads no task history.
+
+Capacity per service is the sum of ``max_concurrency`` over available nodes,
+i.e. nodes that sent a heartbeat recently or were asked to wake not long
+ago. For every service short of capacity the planner wakes sleeping nodes,
+largest capacity for that service first, until the demand is covered. Idle
+nodes whose capacity is not needed are put to sleep where the provider
+supports it and then marked ``awake_state='sleep'``; only nodes that can be
+woken again are considered.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from collections.abc import Collection, Mapping, Sequence
+from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy.engine import Connection, Engine
+
+from .. import codec
+from ..critical_path import DEFAULT_STEP_DURATION, earliest_starts, hint_durations
+from ..db import sqlite
+from ..db.statements import statement
+from ..db.status import task_status_counts
+from ..schema import AwakeState, Node, WakeMethod
+from .wake import WakeProvider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAKE_HORIZON = timedelta(minutes=5)
+
+_NODE_COLUMNS = tuple(Node.model_fields)
+
+
+class NodeState(NamedTuple):
+    """A node as seen by the planner."""
+
+    node: Node
+    up: bool
+    waking: bool
+    idle: bool
+
+    @property
+    def available(self) -> bool:
+        """Whether the node's capacity can be counted on."""
+        return self.up or self.waking
+
+
+class WakePlan(NamedTuple):
+    """Result of a planning pass.
+
+    ``capacity`` is the per-service capacity once the plan is carried out.
+    """
+
+    demand: dict[str, int]
+    capacity: dict[str, int]
+    wake: list[Node]
+    sleep: list[Node]
+
+
+def service_demand(
+    *,
+    conn: Connection,
+    now: datetime | None = None,
+    horizon: timedelta = DEFAULT_WAKE_HORIZON,
+    default_duration: float = DEFAULT_STEP_DURATION,
+) -> dict[str, int]:
+    """Return the number of tasks per service wanting a slot before ``now + horizon``.
+
+    Steps of workflows without stored critical-path hints are assumed to take
+    ``default_duration`` seconds. Needs Postgres; SQLite connections raise
+    :class:`~accscore.db.sqlite.UnsupportedBackendError`.
+    """
+    if sqlite.is_sqlite(conn):
+        raise sqlite.UnsupportedBackendError("wake planning")
+    now = now or datetime.now(UTC)
+    until = now + horizon
+    demand: Counter[str] = Counter()
+    for service, by_status in task_status_counts(conn=conn).items():
+        demand[service] += sum(
+            by_status.get(s, 0) for s in ("queued", "starting", "running")
+        )
+
+    upcoming = conn.execute(
+        statement(
+            """
+            SELECT workflow_id, scheduled_at, count(*) AS jobs
+            FROM jobs
+            WHERE status = 'queued' AND (scheduled_at IS NULL OR scheduled_at <= :until)
+            GROUP BY workflow_id, scheduled_at
+            """
+        ),
+        {"until": until},
+    ).all()
+    if upcoming:
+        workflows = conn.execute(
+            statement(
+                "SELECT id, steps, critical_path FROM workflows"
+                " WHERE id = ANY(CAST(:ids AS uuid[]))"
+            ),
+            {"ids": sorted({str(row.workflow_id) for row in upcoming})},
+        )
+        timelines: dict[str, list[tuple[str, float]]] = {}
+        for workflow in workflows:
+            steps, hints = workflow.steps, workflow.critical_path
+            if isinstance(steps, str):
+                steps = codec.loads(steps)
+            if isinstance(hints, str):
+                hints = codec.loads(hints)
+            steps = steps or []
+            starts = earliest_starts(
+                steps, hint_durations(steps, hints or {}), default_duration
+            )
+            timelines[str(workflow.id)] = [
+                (step["service"], starts[step["key"]]) for step in steps
+            ]
+        for row in upcoming:
+            start = max(row.scheduled_at or now, now)
+            for service, offset in timelines.get(str(row.workflow_id), ()):
+                if start + timedelta(seconds=offset) <= until:
+                    demand[service] += row.jobs
+    return {service: count for service, count in sorted(demand.items()) if count}
+
+
+def node_states(
+    *,
+    conn: Connection,
+    now: datetime | None = None,
+    seen_within: timedelta = timedelta(minutes=2),
+    wake_timeout: timedelta = timedelta(minutes=5),
+    idle_after: timedelta = timedelta(minutes=15),
+) -> list[NodeState]:
+    """Load all nodes with their availability.
+
+    Parameters
+    ----------
+    seen_within:
+        A node is up if its last heartbeat is this recent.
+    wake_timeout:
+        A node asked to wake counts as available for this long before it is
+        woken again.
+    idle_after:
+        A node is idle when it has no task in flight and finished none and
+        was not woken within this period.
+    """
+    now = now or datetime.now(UTC)
+    rows = conn.execute(
+        statement(
+            f"""
+            SELECT {", ".join(f"n.{column}" for column in _NODE_COLUMNS)},
+                   NOT EXISTS (
+                     SELECT 1 FROM job_tasks jt
+                     WHERE jt.claimed_by = n.name
+                       AND jt.status IN ('starting', 'running')
+                   ) AND NOT EXISTS (
+                     SELECT 1 FROM job_tasks jt
+                     WHERE jt.assigned_node = n.name AND jt.finished_at >= :idle_cutoff
+                   ) AND COALESCE(n.wake_requested_at < :idle_cutoff, true) AS idle
+            FROM nodes n
+            ORDER BY n.name
+            """
+        ),
+        {"idle_cutoff": now - idle_after},
+    )
+    states = []
+    for row in rows:
+        node = Node.model_validate(
+            {column: getattr(row, column) for column in _NODE_COLUMNS}
+        )
+        # nodes marked for sleep are going down even while still heartbeating
+        asleep = node.awake_state == AwakeState.SLEEP
+        up = (
+            not asleep
+            and node.last_seen is not None
+            and node.last_seen >= now - seen_within
+        )
+        waking = (
+            not up
+            and not asleep
+            and node.wake_requested_at is not None
+            and node.wake_requested_at >= now - wake_timeout
+        )
+        states.append(NodeState(node, up, waking, bool(row.idle)))
+    return states
+
+
+def plan_wakes(
+    states: Sequence[NodeState],
+    demand: Mapping[str, int],
+    *,
+    methods: Collection[WakeMethod] | None = None,
+) -> WakePlan:
+    """Decide which nodes to wake and which to put to sleep.
+
+    Parameters
+    ----------
+    states:
+        Nodes as returned by :func:`node_states`.
+    demand:
+        Tasks per service as returned by :func:`service_demand`.
+    methods:
+        Wake methods that can be carried out; nodes using other methods are
+        neither woken nor put to sleep. ``None`` allows all methods.
+    """  # noqa: D405, D411 - ``methods`` is a parameter, not a section
+
+    def controllable(node: Node) -> bool:
+        return node.wake_method is not None and (
+            methods is None or node.wake_method in methods
+        )
+
+    capacity: Counter[str] = Counter()
+    for state in states:
+        if state.available:
+            capacity.update(state.node.max_concurrency)
+
+    candidates = [s.node for s in states if not s.available and controllable(s.node)]
+    wake: list[Node] = []
+    shortfall = sorted(demand, key=lambda service: capacity[service] - demand[service])
+    for service in shortfall:
+        while capacity[service] < demand[service]:
+            best = max(
+                (n for n in candidates if n.max_concurrency.get(service, 0) > 0),
+                key=lambda n: (n.max_concurrency[service], n.name),
+                default=None,
+            )
+            if best is None:
+                break
+            candidates.remove(best)
+            wake.append(best)
+            capacity.update(best.max_concurrency)
+
+    sleep: list[Node] = []
+    idle = [s.node for s in states if s.up and s.idle and controllable(s.node)]
+    for node in sorted(idle, key=lambda n: (sum(n.max_concurrency.values()), n.name)):
+        if all(
+            capacity[s] - c >= demand.get(s, 0) for s, c in node.max_concurrency.items()
+        ):
+            sleep.append(node)
+            capacity.subtract(node.max_concurrency)
+
+    return WakePlan(
+        dict(demand), {s: c for s, c in sorted(capacity.items()) if c}, wake, sleep
+    )
+
+
+class WakePlanner:
+    """Periodically wake nodes for upcoming work and mark idle nodes for sleep.
+
+    Parameters
+    ----------
+    providers:
+        Provider per wake method, e.g. ``{"wol": WakeOnLAN()}``.
+    engine:
+        Engine to use, defaults to :data:`accscore.db.engine`.
+    horizon:
+        How far ahead demand is considered; roughly the nodes' boot time plus
+        the planning interval.
+    seen_within, wake_timeout, idle_after:
+        See :func:`node_states`.
+    """
+
+    def __init__(
+        self,
+        providers: Mapping[WakeMethod | str, WakeProvider],
+        *,
+        engine: Engine | None = None,
+        horizon: timedelta = DEFAULT_WAKE_HORIZON,
+        seen_within: timedelta = timedelta(minutes=2),
+        wake_timeout: timedelta = timedelta(minutes=5),
+        idle_after: timedelta = timedelta(minutes=15),
+    ) -> None:
+        if engine is None:
+            from .. import db
+
+            engine = db.engine
+        self.providers = {WakeMethod(method): p for method, p in providers.items()}
+        self.engine = engine
+        self.horizon = horizon
+        self.seen_within = seen_within
+        self.wake_timeout = wake_timeout
+        self.idle_after = idle_after
+
+    def _provider(self, node: Node) -> WakeProvider:
+        # plan_wakes only returns nodes with a wake method of self.providers
+        assert node.wake_method is not None
+        return self.providers[node.wake_method]
+
+    def tick(self, now: datetime | None = None) -> WakePlan:
+        """Plan and carry out one pass; returns the plan."""
+        now = now or datetime.now(UTC)
+        with self.engine.begin() as conn:
+            demand = service_demand(conn=conn, now=now, horizon=self.horizon)
+            states = node_states(
+                conn=conn,
+                now=now,
+                seen_within=self.seen_within,
+                wake_timeout=self.wake_timeout,
+                idle_after=self.idle_after,
+            )
+        plan = plan_wakes(states, demand, methods=self.providers.keys())
+
+        # provider calls can be slow; keep them out of the transaction
+        woken = [n.name for n in plan.wake if self._provider(n).wake(n)]
+        # a node left running must not be marked asleep, or its capacity
+        # would be ignored while it keeps claiming
+        slept = [n.name for n in plan.sleep if self._provider(n).sleep(n)]
+
+        with self.engine.begin() as conn:
+            if woken:
+                conn.execute(
+                    statement(
+                        "UPDATE nodes"
+                        " SET awake_state = 'awake', wake_requested_at = :now"
+                        " WHERE name = ANY(CAST(:names AS text[]))"
+                    ),
+                    {"now": now, "names": woken},
+                )
+            if slept:
+                conn.execute(
+                    statement(
+                        "UPDATE nodes SET awake_state = 'sleep'"
+                        " WHERE name = ANY(CAST(:names AS text[]))"
+                    ),
+                    {"names": slept},
+                )
+        if woken or slept:
+            logger.info("demand %s: woke %s, marked %s for sleep", demand, woken, slept)
+        if len(woken) < len(plan.wake):
+            failed = sorted({n.name for n in plan.wake} - set(woken))
+            logger.warning("could not wake %s", failed)
+        if len(slept) < len(plan.sleep):
+            failed = sorted({n.name for n in plan.sleep} - set(slept))
+            logger.info("could not put %s to sleep; leaving them awake", failed)
+        return plan
+
+
+__all__ = [
+    "DEFAULT_WAKE_HORIZON",
+    "NodeState",
+    "WakePlan",
+    "WakePlanner",
+    "node_states",
+    "plan_wakes",
+    "service_demand",
+]
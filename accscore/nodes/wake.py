@@ -0,0 +1,188 @@
+"""Wake and sleep service nodes.
+
+A :class:`WakeProvider` turns a :class:`~accscore.schema.Node` on (and
+optionally off) using the node's ``wake_method`` details:
+
+``wol``
+    :class:`WakeOnLAN` broadcasts a magic packet to ``node.mac``.
+``script``
+    :class:`ShellScript` runs ``node.script`` with ``wake``/``sleep`` and the
+    node name as arguments.
+``provider``
+    :class:`ProviderAPI` hands ``node.provider_ref`` to a callable wrapping
+    the infrastructure provider's API.
+
+Providers return ``False`` instead of raising when the request could not be
+sent, so one broken node does not stop a planning pass.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import socket
+import subprocess
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import Literal
+
+from ..schema import Node
+
+logger = logging.getLogger(__name__)
+
+WakeAction = Literal["wake", "sleep"]
+
+_MAC_RE = re.compile(r"^[0-9a-f]{12}$")
+
+
+class WakeProvider(ABC):
+    """Turn nodes on and, where supported, off."""
+
+    @abstractmethod
+    def wake(self, node: Node) -> bool:
+        """Request ``node`` to wake up; return whether the request was sent."""
+
+    def sleep(self, node: Node) -> bool:
+        """Request ``node`` to go to sleep; unsupported by default."""
+        return False
+
+
+def magic_packet(mac: str) -> bytes:
+    """Return the Wake-on-LAN magic packet for ``mac``.
+
+    Raises :class:`ValueError` if ``mac`` is not a 48-bit MAC address.
+    """
+    digits = re.sub(r"[:\-.]", "", mac).lower()
+    if not _MAC_RE.match(digits):
+        raise ValueError(f"invalid MAC address: {mac!r}")
+    return b"\xff" * 6 + bytes.fromhex(digits) * 16
+
+
+class WakeOnLAN(WakeProvider):
+    """Send Wake-on-LAN magic packets over UDP.
+
+    Parameters
+    ----------
+    broadcast:
+        Destination address, normally the broadcast address of the node's LAN.
+    port:
+        Destination UDP port (``9`` or ``7`` by convention).
+    source_address:
+        Local address to send from, selecting the interface on multi-homed
+        hosts.
+    """
+
+    def __init__(
+        self,
+        broadcast: str = "255.255.255.255",
+        port: int = 9,
+        source_address: str | None = None,
+    ) -> None:
+        self.broadcast = broadcast
+        self.port = port
+        self.source_address = source_address
+
+    def wake(self, node: Node) -> bool:
+        """Broadcast the magic packet for ``node.mac``."""
+        if not node.mac:
+            logger.warning("node %s has no MAC address", node.name)
+            return False
+        try:
+            packet = magic_packet(node.mac)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                if self.source_address:
+                    sock.bind((self.source_address, 0))
+                sock.sendto(packet, (self.broadcast, self.port))
+        except (OSError, ValueError) as exc:
+            logger.warning("could not wake node %s: %s", node.name, exc)
+            return False
+        return True
+
+
+class ShellScript(WakeProvider):
+    """Run ``node.script <action> <node name>``; exit status 0 means success.
+
+    Parameters
+    ----------
+    timeout:
+        Seconds before the script is killed and the request counted as failed.
+    """
+
+    def __init__(self, timeout: float = 30.0) -> None:
+        self.timeout = timeout
+
+    def _run(self, action: WakeAction, node: Node) -> bool:
+        if not node.script:
+            logger.warning("node %s has no %s script", node.name, action)
+            return False
+        try:
+            result = subprocess.run(
+                [node.script, action, node.name],
+                capture_output=True,
+                timeout=self.timeout,
+                check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired) as exc:
+            logger.warning("%s script of node %s failed: %s", action, node.name, exc)
+            return False
+        if result.returncode != 0:
+            logger.warning(
+                "%s script of node %s exited with %d: %s",
+                action,
+                node.name,
+                result.returncode,
+                result.stderr.decode(errors="replace").strip(),
+            )
+        return result.returncode == 0
+
+    def wake(self, node: Node) -> bool:
+        """Run the node's script with ``wake``."""
+        return self._run("wake", node)
+
+    def sleep(self, node: Node) -> bool:
+        """Run the node's script with ``sleep``."""
+        return self._run("sleep", node)
+
+
+class ProviderAPI(WakeProvider):
+    """Start and stop nodes through an infrastructure provider.
+
+    Parameters
+    ----------
+    call:
+        ``call(action, provider_ref)`` performing ``"wake"`` or ``"sleep"``
+        for the instance ``provider_ref``, e.g. a thin wrapper around a cloud
+        SDK's start/stop instance calls. Its return value is the result.
+    """
+
+    def __init__(self, call: Callable[[WakeAction, str], bool]) -> None:
+        self.call = call
+
+    def _run(self, action: WakeAction, node: Node) -> bool:
+        if not node.provider_ref:
+            logger.warning("node %s has no provider reference", node.name)
+            return False
+        try:
+            return bool(self.call(action, node.provider_ref))
+        except Exception as exc:
+            logger.warning("provider %s of node %s failed: %s", action, node.name, exc)
+            return False
+
+    def wake(self, node: Node) -> bool:
+        """Start the instance ``node.provider_ref``."""
+        return self._run("wake", node)
+
+    def sleep(self, node: Node) -> bool:
+        """Stop the instance ``node.provider_ref``."""
+        return self._run("sleep", node)
+
+
+__all__ = [
+    "ProviderAPI",
+    "ShellScript",
+    "WakeAction",
+    "WakeOnLAN",
+    "WakeProvider",
+    "magic_packet",
+]
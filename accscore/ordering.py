@@ -0,0 +1,278 @@
+"""Ordering policies for the task claim queries.
+
+A policy renders the ``SELECT`` used by :func:`accscore.db.tasks.select_runnable`
+and :func:`accscore.db.claim_tasks` around a shared runnable predicate. The
+query always selects from ``job_tasks jt JOIN jobs j`` and locks ``jt`` with
+``FOR UPDATE SKIP LOCKED``, so every policy works with concurrent claimers.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+_TIEBREAK = "j.order_seq ASC, jt.created_at ASC, jt.id ASC"
+
+
+def _leading(prefer: str) -> str:
+    return f"{prefer}, " if prefer else ""
+
+
+def _locking(lock: bool) -> str:
+    return "FOR UPDATE OF jt SKIP LOCKED" if lock else ""
+
+
+class OrderingPolicy(ABC):
+    """Base class for claim ordering policies."""
+
+    @abstractmethod
+    def order_by(self) -> str:
+        """Return the ``ORDER BY`` expression list for the claim query."""
+
+    def params(self) -> dict[str, Any]:
+        """Return extra bind parameters used by the rendered SQL."""
+        return {}
+
+    def select_sql(self, where: str, prefer: str = "", *, lock: bool = True) -> str:
+        """Render the locking select for runnable tasks matching ``where``.
+
+        ``prefer`` is an optional leading sort key, e.g. from
+        :class:`accscore.affinity.NodeAffinity`, applied before the policy.
+        Without ``lock`` the rows are read without taking row locks.
+        """
+        return f"""
+    SELECT jt.*
+    FROM job_tasks jt
+    JOIN jobs j ON j.id = jt.job_id
+    WHERE {where}
+    ORDER BY {_leading(prefer)}{self.order_by()}
+    {_locking(lock)}
+    LIMIT :limit
+"""
+
+
+@dataclass(frozen=True)
+class StrictOrder(OrderingPolicy):
+    """Global job order: ``jobs.order_seq`` then task creation time."""
+
+    def order_by(self) -> str:
+        """Return the strict global order."""
+        return _TIEBREAK
+
+
+@dataclass(frozen=True)
+class PriorityOrder(OrderingPolicy):
+    """Highest job priority first, then global order.
+
+    Task priority only orders the tasks of one job, so the leading keys match
+    the ``jobs (priority DESC, order_seq)`` index and the claim query walks it
+    instead of sorting every runnable task.
+    """
+
+    def order_by(self) -> str:
+        """Return priority-first ordering with the global order as tiebreak."""
+        return (
+            "j.priority DESC, j.order_seq ASC, jt.priority DESC,"
+            " jt.created_at ASC, jt.id ASC"
+        )
+
+
+@dataclass(frozen=True)
+class CriticalPathOrder(OrderingPolicy):
+    """Tasks with the most remaining work in their job first.
+
+    Uses the hints stored on ``job_tasks`` by :mod:`accscore.critical_path`,
+    so a task heading a long chain is claimed before short side branches.
+    To keep tasks near the end of their job from starving, every second a
+    task has existed adds ``aging`` seconds to its remaining work.
+
+    Only the first ``window`` runnable tasks in global order are ranked.
+    The aged score changes with the clock and cannot be indexed, so ranking
+    every runnable task would sort the whole queue on each claim; the window
+    is read in index order like :class:`StrictOrder` and also bounds how far
+    a task can be overtaken.
+
+    Parameters
+    ----------
+    aging:
+        Weight of task age against remaining work; ``0`` disables aging.
+    window:
+        Number of runnable tasks at the head of the global order ranked per
+        claim.
+    """
+
+    aging: float = 1.0
+    window: int = 500
+
+    def __post_init__(self) -> None:
+        if self.aging < 0:
+            raise ValueError("aging must not be negative")
+        if self.window <= 0:
+            raise ValueError("window must be positive")
+
+    def order_by(self) -> str:
+        """Return the aged remaining-work order with the global order as tiebreak."""
+        return (
+            "(COALESCE(jt.remaining_work, 0) + :cp_aging"
+            " * extract(epoch FROM CAST(:now AS timestamptz) - jt.created_at))"
+            f" DESC, jt.downstream_depth DESC, {_TIEBREAK}"
+        )
+
+    def params(self) -> dict[str, Any]:
+        """Return the aging weight and the window size."""
+        return {"cp_aging": float(self.aging), "cp_window": self.window}
+
+    def select_sql(self, where: str, prefer: str = "", *, lock: bool = True) -> str:
+        """Render the select ranking the head of the global order."""
+        return f"""
+    WITH head AS (
+      SELECT jt.id
+      FROM job_tasks jt
+      JOIN jobs j ON j.id = jt.job_id
+      WHERE {where}
+      ORDER BY {_leading(prefer)}{_TIEBREAK}
+      LIMIT :cp_window
+    )
+    SELECT jt.*
+    FROM head h
+    JOIN job_tasks jt ON jt.id = h.id
+    JOIN jobs j ON j.id = jt.job_id
+    WHERE {where}
+    ORDER BY {_leading(prefer)}{self.order_by()}
+    {_locking(lock)}
+    LIMIT :limit
+"""
+
+
+@dataclass(frozen=True)
+class FairShareOrder(OrderingPolicy):
+    """Weighted fair share of a service's slots across job classes.
+
+    Runnable tasks are grouped into classes by job priority or workflow. Each
+    candidate is ranked by ``(in_flight + position) / weight`` where
+    ``in_flight`` counts the class's ``starting``/``running`` tasks for the
+    service and ``position`` is the task's place within its class in global
+    order. Classes therefore converge to running slots in proportion to their
+    weights, and global order is preserved inside every class.
+
+    Parameters
+    ----------
+    by:
+        ``"priority"`` to share between ``jobs.priority`` values or
+        ``"workflow"`` to share between ``jobs.workflow_id`` values.
+    weights:
+        Weight per class, keyed by the priority value or workflow id.
+    default_weight:
+        Weight for classes missing from ``weights``.
+    """
+
+    by: Literal["priority", "workflow"] = "priority"
+    weights: dict[Any, float] = field(default_factory=dict)
+    default_weight: float = 1.0
+
+    def __post_init__(self) -> None:
+        if self.by not in ("priority", "workflow"):
+            raise ValueError(f"invalid fair share class: {self.by!r}")
+        if self.default_weight <= 0 or any(w <= 0 for w in self.weights.values()):
+            raise ValueError("fair share weights must be positive")
+
+    def _class_expr(self, alias: str) -> str:
+        column = "priority" if self.by == "priority" else "workflow_id"
+        return f"{alias}.{column}::text"
+
+    def _weight_expr(self, column: str) -> str:
+        if not self.weights:
+            return ":fs_default_weight"
+        cases = " ".join(
+            f"WHEN :fs_class_{i} THEN :fs_weight_{i}" for i in range(len(self.weights))
+        )
+        return f"(CASE {column} {cases} ELSE :fs_default_weight END)"
+
+    def order_by(self) -> str:
+        """Return the fair share ordering; only valid inside :meth:`select_sql`."""
+        return (
+            f"(COALESCE(fl.in_flight, 0) + r.class_rank)::float8"
+            f" / {self._weight_expr('r.share_class')}, {_TIEBREAK}"
+        )
+
+    def params(self) -> dict[str, Any]:
+        """Return bind parameters for class weights."""
+        params: dict[str, Any] = {"fs_default_weight": float(self.default_weight)}
+        for i, (cls, weight) in enumerate(self.weights.items()):
+            params[f"fs_class_{i}"] = str(cls)
+            params[f"fs_weight_{i}"] = float(weight)
+        return params
+
+    def _classes_sql(self) -> str:
+        if self.by == "workflow":
+            return "SELECT id AS cls FROM workflows"
+        # distinct priorities with one probe of jobs_priority_order_idx each
+        return """
+      (SELECT priority AS cls FROM jobs ORDER BY priority DESC LIMIT 1)
+      UNION ALL
+      SELECT (SELECT priority FROM jobs WHERE priority < c.cls
+              ORDER BY priority DESC LIMIT 1)
+      FROM classes c
+      WHERE c.cls IS NOT NULL"""
+
+    def select_sql(self, where: str, prefer: str = "", *, lock: bool = True) -> str:
+        """Render the ranked select; window functions cannot be locked directly.
+
+        Only the first ``:limit`` runnable tasks of every class are ranked,
+        each read in index order like :class:`StrictOrder`, so the cost grows
+        with the number of classes rather than the number of runnable tasks.
+        No claim takes more than ``:limit`` tasks from one class, so the
+        result is the same as ranking every runnable task.
+        """
+        column = "priority" if self.by == "priority" else "workflow_id"
+        return f"""
+    WITH RECURSIVE classes AS ({self._classes_sql()}
+    ),
+    head AS (
+      SELECT h.id, h.share_class,
+             row_number() OVER (
+               PARTITION BY h.share_class
+               ORDER BY h.order_seq, h.created_at, h.id
+             ) AS class_rank
+      FROM classes c
+      CROSS JOIN LATERAL (
+        SELECT jt.id, {self._class_expr("j")} AS share_class, j.order_seq, jt.created_at
+        FROM job_tasks jt
+        JOIN jobs j ON j.id = jt.job_id
+        WHERE j.{column} = c.cls AND {where}
+        ORDER BY {_leading(prefer)}{_TIEBREAK}
+        LIMIT :limit
+      ) h
+    ),
+    in_flight AS (
+      SELECT {self._class_expr("fj")} AS share_class, count(*) AS in_flight
+      FROM job_tasks f
+      JOIN jobs fj ON fj.id = f.job_id
+      WHERE f.service_name = :service
+        AND f.status IN ('starting', 'running')
+      GROUP BY 1
+    )
+    SELECT jt.*
+    FROM head r
+    JOIN job_tasks jt ON jt.id = r.id
+    JOIN jobs j ON j.id = jt.job_id
+    LEFT JOIN in_flight fl ON fl.share_class = r.share_class
+    WHERE {where}
+    ORDER BY {_leading(prefer)}{self.order_by()}
+    {_locking(lock)}
+    LIMIT :limit
+"""
+
+
+DEFAULT_ORDERING: OrderingPolicy = StrictOrder()
+
+
+__all__ = [
+    "OrderingPolicy",
+    "StrictOrder",
+    "PriorityOrder",
+    "CriticalPathOrder",
+    "FairShareOrder",
+    "DEFAULT_ORDERING",
+]
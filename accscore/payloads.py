@@ -0,0 +1,102 @@
+"""Offloading of large JSON payloads to object storage.
+
+Event ``data`` and task ``results`` larger than
+``Settings.payload_offload_bytes`` (serialised) are written to
+``Settings.payload_bucket`` and replaced in the database by a pointer::
+
+    {"$offloaded": {"bucket": ..., "key": ..., "size": ..., "checksum": ...}}
+
+Keys are ``payloads/<owner>/<sha256>.json`` where the owner is the job id for
+events and the task id for results, so retried writes reuse the same object.
+:func:`load_payload` and the accessors on :class:`accscore.schema.TaskEvent`
+and :class:`accscore.schema.JobTask` resolve pointers on demand.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Callable, Mapping
+from typing import Any
+
+from . import codec, storage
+
+OFFLOAD_KEY = "$offloaded"
+
+# Buckets known to exist, so each is checked once per process.
+_ready_buckets: set[str] = set()
+
+
+def is_offloaded(payload: Mapping[str, Any] | None) -> bool:
+    """Return whether ``payload`` is a pointer to an offloaded payload."""
+    return isinstance(payload, Mapping) and set(payload) == {OFFLOAD_KEY}
+
+
+def offload_payload(
+    payload: Mapping[str, Any] | None,
+    owner: str,
+    *,
+    threshold: int | None = None,
+    bucket: str | None = None,
+    before_upload: Callable[[], None] | None = None,
+) -> dict[str, Any] | None:
+    """Return ``payload`` itself or, when it is too large, a pointer to it.
+
+    Inline payloads come back as :class:`accscore.codec.EncodedDict`, so the
+    database binds reuse the document encoded for measuring.
+
+    Parameters
+    ----------
+    payload:
+        JSON serialisable mapping; ``None`` is returned unchanged.
+    owner:
+        Job or task id the payload belongs to, used in the object key.
+    threshold:
+        Size in bytes above which the payload is offloaded. Defaults to
+        ``Settings.payload_offload_bytes``; ``0`` disables offloading.
+    bucket:
+        Target bucket, defaults to ``Settings.payload_bucket``; it is
+        created on first use.
+    before_upload:
+        Called before an upload; raising from it leaves storage untouched.
+    """
+    if payload is None or is_offloaded(payload):
+        return None if payload is None else dict(payload)
+    threshold = (
+        storage.settings.payload_offload_bytes if threshold is None else threshold
+    )
+    data = codec.dumps_bytes(payload)
+    if threshold <= 0 or len(data) <= threshold:
+        return codec.encoded(payload, data)
+
+    if before_upload is not None:
+        before_upload()
+    bucket = bucket or storage.settings.payload_bucket
+    if bucket not in _ready_buckets:
+        storage.ensure_bucket(bucket)
+        _ready_buckets.add(bucket)
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"payloads/{owner}/{digest}.json"
+    storage.put_object(bucket, key, data, content_type="application/json")
+    return {
+        OFFLOAD_KEY: {
+            "bucket": bucket,
+            "key": key,
+            "size": len(data),
+            "checksum": f"sha256:{digest}",
+        }
+    }
+
+
+def load_payload(payload: Mapping[str, Any] | None) -> dict[str, Any]:
+    """Return the full payload, downloading it if ``payload`` is a pointer."""
+    if payload is None:
+        return {}
+    if not is_offloaded(payload):
+        return dict(payload)
+    ref = payload[OFFLOAD_KEY]
+    return codec.loads(
+        storage.get_object(ref["bucket"], ref["key"], ref.get("checksum"))
+    )
+
+
+__all__ = ["OFFLOAD_KEY", "is_offloaded", "load_payload", "offload_payload"]
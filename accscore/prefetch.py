@@ -0,0 +1,194 @@
+"""Background prefetching of upstream task outputs into a local staging area."""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from collections.abc import Iterable, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy.engine import Connection
+
+from . import codec, storage
+from .db.artifacts import artifact_manifest
+from .db.statements import statement
+
+_ObjectRef = tuple[str, str]
+
+
+class Prefetcher:
+    """Download the outputs of a task's ``depends_on`` steps ahead of time.
+
+    :meth:`prefetch` resolves upstream artifacts of claimed tasks through
+    ``task_artifacts`` and downloads them with bounded concurrency into
+    ``staging_dir/<bucket>/<key>`` (keys follow :func:`accscore.storage.build_key`).
+    :meth:`speculate` does the same for the next queued tasks of a service so
+    that inputs are often local before the task is even claimed. Downloads
+    are shared between tasks needing the same object and go through
+    :func:`accscore.storage.get_object`, i.e. the node-local cache when
+    configured and the artifact has a checksum.
+
+    Parameters
+    ----------
+    staging_dir:
+        Directory receiving the downloaded inputs.
+    max_workers:
+        Maximum number of concurrent downloads.
+    """
+
+    def __init__(self, staging_dir: str | Path, max_workers: int = 4) -> None:
+        self.staging_dir = Path(staging_dir)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="accscore-prefetch"
+        )
+        self._lock = threading.Lock()
+        self._downloads: dict[_ObjectRef, Future[Path]] = {}
+        self._inputs: dict[str, dict[str, list[_ObjectRef]]] = {}
+
+    def __enter__(self) -> Prefetcher:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Cancel pending downloads and stop the worker threads."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def staged_path(self, bucket: str, key: str) -> Path:
+        """Return the local path an object is staged at."""
+        return self.staging_dir / bucket / key
+
+    def _download(self, bucket: str, key: str, checksum: str | None) -> Path:
+        path = self.staged_path(bucket, key)
+        if path.exists():
+            return path
+        data = storage.get_object(bucket, key, checksum)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        tmp = Path(name)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            tmp.replace(path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return path
+
+    def _submit(self, artifact: Mapping[str, Any]) -> _ObjectRef:
+        ref = (artifact["bucket"], artifact["key"])
+        with self._lock:
+            future = self._downloads.get(ref)
+            if future is None or (future.done() and future.exception() is not None):
+                self._downloads[ref] = self._executor.submit(
+                    self._download, ref[0], ref[1], artifact.get("checksum")
+                )
+        return ref
+
+    def _schedule(
+        self, task: Mapping[Any, Any], conn: Connection, *, refresh: bool
+    ) -> None:
+        task_id = str(task["id"])
+        depends_on = task.get("depends_on") or []
+        if isinstance(depends_on, str):
+            depends_on = codec.loads(depends_on)
+        with self._lock:
+            if not depends_on or (task_id in self._inputs and not refresh):
+                self._inputs.setdefault(task_id, {})
+                return
+        manifest = artifact_manifest(
+            str(task["job_id"]), conn=conn, task_keys=depends_on, kinds=["output"]
+        )
+        inputs = {
+            task_key: [self._submit(a) for a in by_kind.get("output", [])]
+            for task_key, by_kind in manifest.items()
+            if task_key is not None
+        }
+        with self._lock:
+            self._inputs[task_id] = inputs
+
+    def prefetch(self, tasks: Iterable[Mapping[str, Any]], *, conn: Connection) -> None:
+        """Start downloading the upstream outputs of claimed ``tasks``.
+
+        ``tasks`` are ``job_tasks`` rows (e.g. from
+        :func:`accscore.db.tasks.select_runnable`) with ``id``, ``job_id`` and
+        ``depends_on``. Tasks seen by :meth:`speculate` are resolved again,
+        since their upstream tasks may have finished since; objects already
+        downloaded are reused.
+        """
+        for task in tasks:
+            self._schedule(task, conn, refresh=True)
+
+    def speculate(self, service_name: str, *, conn: Connection, limit: int = 4) -> int:
+        """Prefetch inputs for the next ``limit`` queued tasks of a service.
+
+        The peek follows the strict global order and takes no locks, so it
+        may prefetch for tasks another node ends up claiming; that only costs
+        bandwidth. Returns the number of tasks considered.
+        """
+        query = statement(
+            """
+            SELECT jt.id, jt.job_id, jt.depends_on
+            FROM job_tasks jt
+            JOIN jobs j ON j.id = jt.job_id
+            WHERE jt.service_name = :service AND jt.status = 'queued'
+            ORDER BY j.order_seq ASC, jt.created_at ASC, jt.id ASC
+            LIMIT :limit
+            """
+        )
+        params = {"service": service_name, "limit": limit}
+        rows = conn.execute(query, params).mappings().all()
+        for row in rows:
+            self._schedule(row, conn, refresh=False)
+        return len(rows)
+
+    def wait_for_inputs(
+        self, task: Mapping[str, Any] | str, timeout: float | None = None
+    ) -> dict[str, list[Path]]:
+        """Block until a task's inputs are staged and return their paths.
+
+        The result maps each upstream task key to its staged output files.
+        Download errors are re-raised; :class:`TimeoutError` is raised when
+        ``timeout`` seconds pass first.
+        """
+        task_id = str(task["id"] if isinstance(task, Mapping) else task)
+        with self._lock:
+            inputs = self._inputs.get(task_id)
+            if inputs is None:
+                raise KeyError(f"task {task_id!r} was not prefetched")
+            futures = {
+                ref: self._downloads[ref] for refs in inputs.values() for ref in refs
+            }
+        _, pending = wait_futures(futures.values(), timeout=timeout)
+        if pending:
+            raise TimeoutError(f"inputs of task {task_id!r} not ready")
+        return {
+            task_key: [futures[ref].result() for ref in refs]
+            for task_key, refs in inputs.items()
+        }
+
+    def release(self, task: Mapping[str, Any] | str) -> None:
+        """Forget a finished task and delete staged files no other task needs."""
+        task_id = str(task["id"] if isinstance(task, Mapping) else task)
+        with self._lock:
+            released = self._inputs.pop(task_id, {})
+            refs = {ref for refs in released.values() for ref in refs}
+            still_needed = {
+                ref
+                for inputs in self._inputs.values()
+                for group in inputs.values()
+                for ref in group
+            }
+            for ref in refs - still_needed:
+                future = self._downloads.pop(ref, None)
+                if future is not None and future.done() and future.exception() is None:
+                    future.result().unlink(missing_ok=True)
+
+
+__all__ = ["Prefetcher"]
@@ -0,0 +1,361 @@
+"""Retention-driven garbage collection of job artifacts.
+
+Jobs that finished longer than the retention period ago lose their objects
+in object storage and their ``task_artifacts`` rows, one batch of jobs at a
+time, oldest first:
+
+1. Candidate objects are the keys of the jobs' ``task_artifacts`` rows,
+   streamed from the database, and everything under the jobs' ``input/``,
+   ``output/`` and ``log/`` prefixes (see :func:`accscore.storage.build_key`)
+   in the buckets those rows use, which also catches uploads that were
+   never recorded. With ``payloads=True`` offloaded event data and task
+   results under ``payloads/<job or task id>/`` are included; their
+   pointers in ``task_events`` and ``job_tasks`` can no longer be loaded.
+2. Objects still referenced by rows of other jobs are kept: deduplicated
+   uploads point at the key of the first upload, which may live under an
+   expired job's prefix. They go once their last referencing job expires.
+   The jobs' rows are locked before this check so that an upload
+   deduplicating onto one of them cannot slip in between.
+3. The rest is deleted with multi-object delete requests spread over a
+   bounded thread pool; listings run in the same pool.
+4. The jobs' rows are deleted and ``jobs.artifacts_purged_at`` is stamped
+   in the transaction holding the locks.
+
+Deleting an object twice is harmless and a job is only stamped once all of
+its objects are gone, so an interrupted collection resumes by running it
+again; jobs whose objects failed to delete are retried on the next run.
+
+Example::
+
+    report = collect_artifacts(retention=timedelta(days=30))
+    print(f"reclaimed {report.bytes} bytes of {report.jobs} jobs")
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Connection, Engine
+
+from . import storage
+from .db import sqlite
+from .db.statements import statement
+
+logger = logging.getLogger(__name__)
+
+PREFIX_KINDS = ("input", "output", "log")
+
+# Keys per multi-object delete request, the S3 limit.
+_DELETE_CHUNK = 1000
+# Keys per reference check, bounded to stay below driver parameter limits.
+_CHECK_CHUNK = 500
+
+_EXPIRED_SQL = """
+SELECT id, finished_at
+FROM jobs
+WHERE finished_at IS NOT NULL AND artifacts_purged_at IS NULL
+  AND finished_at < :cutoff
+  {after}
+ORDER BY finished_at, id
+LIMIT :limit
+"""
+
+_AFTER_SQL = (
+    "AND (finished_at > :after_ts OR (finished_at = :after_ts AND id > :after_id))"
+)
+
+
+class CollectionReport(NamedTuple):
+    """What :func:`collect_artifacts` did.
+
+    ``bytes`` sums the sizes of the deleted objects as listed or recorded;
+    ``kept`` counts objects spared because other jobs still reference them
+    and ``failed`` those whose deletion failed.
+    """
+
+    jobs: int
+    objects: int
+    bytes: int
+    rows: int
+    kept: int
+    failed: int
+
+
+# (bucket, key) -> (size, owning job id)
+_Candidates = dict[tuple[str, str], tuple[int | None, str]]
+
+
+def _in(sql: str, *names: str) -> Any:
+    return statement(sql).bindparams(
+        *(bindparam(name, expanding=True) for name in names)
+    )
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _recorded(
+    job_ids: list[str], conn: Connection
+) -> tuple[_Candidates, dict[str, str]]:
+    """Return the objects recorded for ``job_ids`` and their task ids."""
+    candidates: _Candidates = {}
+    rows = conn.execution_options(stream_results=True, yield_per=1000).execute(
+        _in(
+            "SELECT job_id, bucket, key, size_bytes FROM task_artifacts"
+            " WHERE job_id IN :job_ids",
+            "job_ids",
+        ),
+        {"job_ids": job_ids},
+    )
+    for row in rows:
+        candidates.setdefault((row.bucket, row.key), (row.size_bytes, str(row.job_id)))
+    tasks = conn.execute(
+        _in("SELECT id, job_id FROM job_tasks WHERE job_id IN :job_ids", "job_ids"),
+        {"job_ids": job_ids},
+    )
+    return candidates, {str(row.id): str(row.job_id) for row in tasks}
+
+
+def _still_referenced(
+    candidates: _Candidates, job_ids: list[str], conn: Connection
+) -> set[tuple[str, str]]:
+    """Return the candidates referenced by rows of jobs outside ``job_ids``."""
+    by_bucket: dict[str, list[str]] = {}
+    for bucket, key in candidates:
+        by_bucket.setdefault(bucket, []).append(key)
+    sql = _in(
+        "SELECT DISTINCT key FROM task_artifacts"
+        " WHERE bucket = :bucket AND key IN :keys AND job_id NOT IN :job_ids",
+        "keys",
+        "job_ids",
+    )
+    referenced: set[tuple[str, str]] = set()
+    for bucket, keys in by_bucket.items():
+        for chunk in _chunks(keys, _CHECK_CHUNK):
+            rows = conn.execute(
+                sql, {"bucket": bucket, "keys": list(chunk), "job_ids": job_ids}
+            )
+            referenced.update((bucket, row.key) for row in rows)
+    return referenced
+
+
+def _list_prefixes(
+    candidates: _Candidates,
+    job_ids: list[str],
+    tasks: dict[str, str],
+    pool: ThreadPoolExecutor,
+    buckets: Sequence[str],
+    payload_bucket: str | None,
+) -> None:
+    """Add the objects under the jobs' prefixes to ``candidates``.
+
+    Payloads under ``payload_bucket`` are listed unless it is ``None``.
+    """
+    prefixes = [
+        (bucket, f"{kind}/{job_id}/", job_id)
+        for bucket in sorted({b for b, _ in candidates} | set(buckets))
+        for job_id in job_ids
+        for kind in PREFIX_KINDS
+    ]
+    if payload_bucket is not None:
+        owners = {**{job_id: job_id for job_id in job_ids}, **tasks}
+        prefixes += [
+            (payload_bucket, f"payloads/{owner}/", job_id)
+            for owner, job_id in owners.items()
+        ]
+    listings = pool.map(lambda p: list(storage.list_objects(p[0], p[1])), prefixes)
+    for (bucket, _, job_id), listing in zip(prefixes, listings, strict=True):
+        for key, size in listing:
+            candidates[(bucket, key)] = (size, job_id)
+
+
+def _delete(
+    candidates: _Candidates,
+    job_ids: list[str],
+    conn: Connection,
+    pool: ThreadPoolExecutor,
+    *,
+    dry_run: bool = False,
+) -> tuple[set[tuple[str, str]], list[tuple[str, str]], set[tuple[str, str]], int]:
+    """Delete the unreferenced candidates, then the rows of the purged jobs.
+
+    Unless ``dry_run``, the jobs' ``task_artifacts`` rows are locked first
+    and stay locked until ``conn`` commits. A concurrent deduplicated upload
+    locks the row it reuses (see :func:`accscore.db.artifacts.upload_artifact`),
+    so either its new row is seen by the reference check or it finds the
+    expired row gone and uploads the content again. On SQLite the write
+    transaction serializes both.
+
+    Returns the kept, deleted and failed objects and the number of deleted
+    rows.
+    """
+    if not dry_run and not sqlite.is_sqlite(conn):
+        conn.execute(
+            _in(
+                "SELECT 1 FROM task_artifacts WHERE job_id IN :job_ids FOR UPDATE",
+                "job_ids",
+            ),
+            {"job_ids": job_ids},
+        )
+    kept = _still_referenced(candidates, job_ids, conn)
+    doomed: dict[str, list[str]] = {}
+    for bucket, key in candidates:
+        if (bucket, key) not in kept:
+            doomed.setdefault(bucket, []).append(key)
+
+    failed: set[tuple[str, str]] = set()
+    if not dry_run:
+        futures = [
+            (bucket, pool.submit(storage.remove_objects, bucket, list(chunk)))
+            for bucket, keys in doomed.items()
+            for chunk in _chunks(keys, _DELETE_CHUNK)
+        ]
+        for bucket, future in futures:
+            failed.update((bucket, key) for key in future.result())
+
+    deleted = [
+        (bucket, key)
+        for bucket, keys in doomed.items()
+        for key in keys
+        if (bucket, key) not in failed
+    ]
+    retry = {candidates[obj][1] for obj in failed}
+    purged = [job_id for job_id in job_ids if job_id not in retry]
+    rows = 0
+    if purged and not dry_run:
+        rows = conn.execute(
+            _in("DELETE FROM task_artifacts WHERE job_id IN :job_ids", "job_ids"),
+            {"job_ids": purged},
+        ).rowcount
+        conn.execute(
+            _in(
+                "UPDATE jobs SET artifacts_purged_at = CURRENT_TIMESTAMP"
+                " WHERE id IN :job_ids",
+                "job_ids",
+            ),
+            {"job_ids": purged},
+        )
+    return kept, deleted, failed, rows
+
+
+def collect_artifacts(
+    *,
+    engine: Engine | None = None,
+    retention: timedelta | None = None,
+    now: datetime | None = None,
+    batch_size: int = 100,
+    max_batches: int | None = None,
+    max_workers: int = 4,
+    buckets: Sequence[str] = (),
+    payloads: bool = False,
+    dry_run: bool = False,
+) -> CollectionReport:
+    """Delete the objects and artifact rows of jobs past their retention.
+
+    Parameters
+    ----------
+    engine:
+        Engine to use, defaults to :data:`accscore.db.engine`.
+    retention:
+        Keep jobs that finished within this period. Defaults to
+        ``Settings.artifact_retention_days``.
+    now:
+        Reference time, defaults to the current UTC time.
+    batch_size:
+        Jobs collected per batch.
+    max_batches:
+        Stop after this many batches; the rest is left for the next run.
+    max_workers:
+        Concurrent listing and delete requests.
+    buckets:
+        Buckets whose job prefixes are listed in addition to the buckets
+        used by the jobs' ``task_artifacts`` rows.
+    payloads:
+        Also delete offloaded event data and task results from
+        ``Settings.payload_bucket``.
+    dry_run:
+        Only report what would be deleted.
+    """
+    if batch_size <= 0 or max_workers <= 0:
+        raise ValueError("batch_size and max_workers must be positive")
+    if engine is None:
+        from . import db
+
+        engine = db.engine
+    if retention is None:
+        retention = timedelta(days=storage.settings.artifact_retention_days)
+    cutoff = (now or datetime.now(UTC)) - retention
+    payload_bucket = storage.settings.payload_bucket if payloads else None
+
+    totals = dict.fromkeys(CollectionReport._fields, 0)
+    after: tuple[Any, Any] | None = None
+    batches = 0
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="accscore-gc"
+    ) as pool:
+        while max_batches is None or batches < max_batches:
+            with engine.connect() as conn:
+                on_sqlite = sqlite.is_sqlite(conn)
+                params: dict[str, Any] = {
+                    "cutoff": sqlite.timestamp(cutoff) if on_sqlite else cutoff,
+                    "limit": batch_size,
+                }
+                if after is not None:
+                    params.update(after_ts=after[0], after_id=after[1])
+                jobs = conn.execute(
+                    statement(_EXPIRED_SQL.format(after=_AFTER_SQL if after else "")),
+                    params,
+                ).all()
+                if not jobs:
+                    break
+                job_ids = [str(job.id) for job in jobs]
+                candidates, tasks = _recorded(job_ids, conn)
+            after = (jobs[-1].finished_at, jobs[-1].id)
+            batches += 1
+
+            _list_prefixes(candidates, job_ids, tasks, pool, buckets, payload_bucket)
+
+            if dry_run:
+                with engine.connect() as conn:
+                    kept, deleted, failed, rows = _delete(
+                        candidates, job_ids, conn, pool, dry_run=True
+                    )
+            else:
+                with engine.begin() as conn:
+                    kept, deleted, failed, rows = _delete(
+                        candidates, job_ids, conn, pool
+                    )
+            retry = {candidates[obj][1] for obj in failed}
+            purged = [job_id for job_id in job_ids if job_id not in retry]
+
+            batch = CollectionReport(
+                jobs=len(purged),
+                objects=len(deleted),
+                bytes=sum(candidates[obj][0] or 0 for obj in deleted),
+                rows=rows,
+                kept=len(kept),
+                failed=len(failed),
+            )
+            for field, value in batch._asdict().items():
+                totals[field] += value
+            logger.info(
+                "%s %d objects (%d bytes) of %d jobs, kept %d shared, %d failed",
+                "would delete" if dry_run else "deleted",
+                batch.objects,
+                batch.bytes,
+                batch.jobs,
+                batch.kept,
+                batch.failed,
+            )
+
+    return CollectionReport(**totals)
+
+
+__all__ = ["CollectionReport", "PREFIX_KINDS", "collect_artifacts"]
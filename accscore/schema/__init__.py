@@ -7,7 +7,7 @@ from enum import Enum
 from typing import Optional
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class JobStatus(str, Enum):
@@ -81,6 +81,7 @@ class WorkflowStep(BaseModel):
     service: str
     depends_on: list[str] = Field(default_factory=list)
     default_params: dict[str, object] = Field(default_factory=dict)
+    weight: float = Field(1.0, gt=0)
 
 
 class WorkflowDef(BaseModel):
@@ -90,6 +91,7 @@ class WorkflowDef(BaseModel):
     name: str
     version: int
     steps: list[WorkflowStep]
+    critical_path: dict[str, dict[str, float]] | None = None
     is_active: bool = True
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
@@ -102,6 +104,7 @@ class Job(BaseModel):
     workflow_id: UUID
     status: JobStatus
     progress: Optional[float] = None
+    progress_weight: float | None = None
     current_task_key: Optional[str] = None
     priority: int = 0
     order_seq: int
@@ -129,16 +132,38 @@ class JobTask(BaseModel):
     next_attempt_at: Optional[datetime] = None
     priority: int = 0
     progress: Optional[float] = None
+    weight: float = 1.0
+    downstream_depth: int = 0
+    remaining_work: float | None = None
     params: dict[str, object] = Field(default_factory=dict)
     results: dict[str, object] = Field(default_factory=dict)
     assigned_node: Optional[str] = None
     claimed_by: Optional[str] = None
     claimed_at: Optional[datetime] = None
+    lease_expires_at: datetime | None = None
+    lease_token: int = 0
     started_at: Optional[datetime] = None
     finished_at: Optional[datetime] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+    _results: dict[str, object] | None = PrivateAttr(None)
+
+    @property
+    def results_offloaded(self) -> bool:
+        """Whether ``results`` is a pointer to a payload in object storage."""
+        from ..payloads import is_offloaded
+
+        return is_offloaded(self.results)
+
+    def load_results(self) -> dict[str, object]:
+        """Return the full results, downloading offloaded ones once."""
+        if self._results is None:
+            from ..payloads import load_payload
+
+            self._results = load_payload(self.results)
+        return self._results
+
 
 class TaskEvent(BaseModel):
     """Append-only event for jobs or tasks."""
@@ -153,6 +178,23 @@ class TaskEvent(BaseModel):
     message: str
     data: dict[str, object] = Field(default_factory=dict)
 
+    _data: dict[str, object] | None = PrivateAttr(None)
+
+    @property
+    def data_offloaded(self) -> bool:
+        """Whether ``data`` is a pointer to a payload in object storage."""
+        from ..payloads import is_offloaded
+
+        return is_offloaded(self.data)
+
+    def load_data(self) -> dict[str, object]:
+        """Return the full payload, downloading an offloaded one once."""
+        if self._data is None:
+            from ..payloads import load_payload
+
+            self._data = load_payload(self.data)
+        return self._data
+
 
 class TaskArtifact(BaseModel):
     """References to artifacts produced by tasks."""
@@ -181,6 +223,7 @@ class Node(BaseModel):
     provider_ref: Optional[str] = None
     script: Optional[str] = None
     max_concurrency: dict[str, int] = Field(default_factory=dict)
+    wake_requested_at: datetime | None = None
 
 
 __all__ = [
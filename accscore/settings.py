@@ -26,5 +26,28 @@ class Settings(BaseSettings):
     postgres_dsn: str = Field(
         ..., validation_alias=AliasChoices("ACC_DB_URL", "POSTGRES_DSN")
     )
+    db_prepared_statements: bool = Field(
+        False, validation_alias="ACC_DB_PREPARED_STATEMENTS"
+    )
+    db_replica_urls: str = Field("", validation_alias="ACC_DB_REPLICA_URLS")
+    db_replica_max_lag: float = Field(5.0, validation_alias="ACC_DB_REPLICA_MAX_LAG")
     rabbitmq_url: str | None = Field(None, validation_alias="RABBITMQ_URL")
     service_url: str | None = Field(None, validation_alias="SERVICE_URL")
+    artifact_cache_dir: str | None = Field(
+        None, validation_alias="ACC_ARTIFACT_CACHE_DIR"
+    )
+    artifact_cache_max_bytes: int = Field(
+        10 * 1024**3, validation_alias="ACC_ARTIFACT_CACHE_MAX_BYTES"
+    )
+    payload_offload_bytes: int = Field(
+        64 * 1024, validation_alias="ACC_PAYLOAD_OFFLOAD_BYTES"
+    )
+    payload_bucket: str = Field("accs-payloads", validation_alias="ACC_PAYLOAD_BUCKET")
+    artifact_retention_days: int = Field(
+        90, validation_alias="ACC_ARTIFACT_RETENTION_DAYS"
+    )
+
+    @property
+    def replica_dsns(self) -> list[str]:
+        """Read replica URLs from the comma-separated ``ACC_DB_REPLICA_URLS``."""
+        return [url.strip() for url in self.db_replica_urls.split(",") if url.strip()]
@@ -0,0 +1,716 @@
+"""Discrete-event simulation of a fleet for capacity planning.
+
+:func:`simulate` replays job arrivals against a set of nodes in-process,
+following the rules of the claim path:
+
+- a task becomes runnable once all of its dependencies are done;
+- a node runs at most ``max_concurrency[service]`` tasks of a service at a
+  time, so a service's capacity is the sum over the nodes, as in
+  :func:`accscore.db.tasks.select_runnable`;
+- a free slot takes the first runnable task in the order of the
+  :mod:`accscore.ordering` policy, including critical-path aging within
+  the policy's window and weighted fair share between job classes;
+- with ``affinity`` a node only takes tasks whose ``required_labels`` its
+  labels contain, takes tasks it is the home node of first, and leaves
+  tasks homed elsewhere alone until ``fallback_after`` has passed, as
+  :class:`accscore.affinity.NodeAffinity` does.
+
+Agents are modelled as claiming the moment a slot frees up or a task
+becomes runnable, and jobs are instantiated as they arrive; builder and
+poll latency, failures, retries and lease expiry are not simulated. Tie
+breaks on ``job_tasks.id`` follow step order instead. Task priorities are
+``0``, which is what instantiation writes to ``job_tasks.priority``; tasks
+reprioritised in the database afterwards have no counterpart here.
+
+Jobs arrive as a Poisson process per :class:`Arrival` and task durations
+are drawn from a :class:`Duration` per service. A run is deterministic for
+a given ``seed`` and cheap enough to sweep configurations::
+
+    from accscore.schema import Node, WorkflowDef, WorkflowStep
+    from accscore.simulation import Arrival, fixed, lognormal, simulate
+
+    workflow = WorkflowDef(
+        name="render",
+        version=1,
+        steps=[
+            WorkflowStep(key="ingest", service="ingest"),
+            WorkflowStep(key="frames", service="gpu", depends_on=["ingest"]),
+        ],
+    )
+    durations = {"ingest": fixed(30), "gpu": lognormal(median=120, sigma=0.5)}
+    cpu = Node(name="cpu0", max_concurrency={"ingest": 4})
+    arrivals = [Arrival("render", per_hour=40)]
+    for gpus in (1, 2, 3):
+        gpu = [Node(name=f"gpu{i}", max_concurrency={"gpu": 2}) for i in range(gpus)]
+        result = simulate([workflow], [cpu, *gpu], arrivals, durations)
+        print(gpus, result.throughput, result.latency[0.9])
+"""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import itertools
+import math
+import random
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, NamedTuple
+
+from .affinity import PREFERRED_NODE_PARAM, REQUIRED_LABELS_PARAM
+from .critical_path import compile_critical_path
+from .ordering import (
+    DEFAULT_ORDERING,
+    CriticalPathOrder,
+    FairShareOrder,
+    OrderingPolicy,
+    PriorityOrder,
+    StrictOrder,
+)
+from .schema import Node, WorkflowDef
+
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.99)
+
+Seconds = float | timedelta
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class Duration:
+    """Distribution of a service's task run time in seconds.
+
+    ``median`` feeds the critical-path hints of workflows that carry none;
+    use the factories below to build one.
+    """
+
+    sample: Callable[[random.Random], float]
+    median: float
+
+
+def fixed(seconds: float) -> Duration:
+    """Return a distribution that always takes ``seconds``."""
+    return Duration(lambda rng: seconds, float(seconds))
+
+
+def exponential(mean: float) -> Duration:
+    """Return exponentially distributed durations with the given mean."""
+    return Duration(lambda rng: rng.expovariate(1.0 / mean), mean * math.log(2))
+
+
+def lognormal(median: float, sigma: float) -> Duration:
+    """Return log-normal durations; ``sigma`` is the spread of ``log(seconds)``."""
+    mu = math.log(median)
+    return Duration(lambda rng: rng.lognormvariate(mu, sigma), float(median))
+
+
+def empirical(samples: Sequence[float]) -> Duration:
+    """Return durations resampled from observed run times.
+
+    The samples would typically be the ``run_time`` durations behind
+    :func:`accscore.db.latency.task_latencies`.
+    """
+    values = sorted(float(s) for s in samples)
+    if not values:
+        raise ValueError("empirical durations need at least one sample")
+    return Duration(lambda rng: rng.choice(values), _percentile(values, 0.5))
+
+
+class Arrival(NamedTuple):
+    """Poisson stream of jobs of one workflow, by workflow name."""
+
+    workflow: str
+    per_hour: float
+    priority: int = 0
+
+
+class ServiceStats(NamedTuple):
+    """Behaviour of one service over the measured period.
+
+    ``queue_mean`` and ``queue_max`` describe the number of runnable tasks
+    waiting for a slot; ``queue_wait`` holds percentiles of the seconds
+    between becoming runnable and being claimed.
+    """
+
+    slots: int
+    tasks: int
+    utilization: float
+    queue_mean: float
+    queue_max: int
+    queue_wait: dict[float, float]
+
+
+class SimulationResult(NamedTuple):
+    """Outcome of :func:`simulate`.
+
+    ``throughput`` is in completed jobs per hour and ``latency`` holds
+    percentiles of the seconds from a job's arrival to its last task
+    finishing, both over jobs that arrived after the warm-up;
+    ``workflow_latency`` breaks the percentiles down by workflow name.
+    ``backlog``
+    counts jobs still unfinished at the end; a backlog growing with the
+    horizon means the fleet cannot keep up.
+    """
+
+    duration: float
+    jobs_submitted: int
+    jobs_completed: int
+    throughput: float
+    latency: dict[float, float]
+    mean_latency: float
+    workflow_latency: dict[str, dict[float, float]]
+    backlog: int
+    services: dict[str, ServiceStats]
+    nodes: dict[str, float]
+
+
+def _percentile(values: Sequence[float], p: float) -> float:
+    """Interpolate like ``percentile_cont`` over sorted ``values``."""
+    if not values:
+        return math.nan
+    position = p * (len(values) - 1)
+    low = math.floor(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def _seconds(value: Seconds) -> float:
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+@dataclass(eq=False)
+class _Job:
+    seq: int
+    workflow: str
+    priority: int
+    arrived: float
+    pending: int
+    share_class: Any
+
+
+@dataclass(eq=False)
+class _Task:
+    job: _Job
+    index: int
+    service: str
+    pending: int
+    remaining: float
+    depth: float
+    required: Mapping[str, Any]
+    preferred: str | None
+    priority: int = 0
+    dependents: list[_Task] = field(default_factory=list)
+    upstream: list[_Task] = field(default_factory=list)
+    ready: float = 0.0
+    key: tuple = ()
+    rank: tuple = ()
+    home: str | None = None
+    node: str | None = None
+    started: float = 0.0
+    finished: float = 0.0
+
+
+# (time, sequence, arrival stream index, finished task or the service of a
+# task whose home node fallback expires)
+_Event = tuple[float, int, int | _Task | str]
+
+
+class _Template(NamedTuple):
+    keys: list[str]
+    services: list[str]
+    depends: list[list[int]]
+    remaining: list[float]
+    depth: list[float]
+    required: list[Mapping[str, Any]]
+    preferred: list[str | None]
+
+    def instantiate(self, job: _Job) -> list[_Task]:
+        """Return the tasks of ``job`` linked to their dependencies."""
+        tasks = [
+            _Task(
+                job=job,
+                index=k,
+                service=service,
+                pending=len(self.depends[k]),
+                remaining=self.remaining[k],
+                depth=self.depth[k],
+                required=self.required[k],
+                preferred=self.preferred[k],
+            )
+            for k, service in enumerate(self.services)
+        ]
+        for task, depends in zip(tasks, self.depends, strict=True):
+            for dep in depends:
+                tasks[dep].dependents.append(task)
+                task.upstream.append(tasks[dep])
+        return tasks
+
+
+def _template(workflow: WorkflowDef, durations: Mapping[str, Duration]) -> _Template:
+    steps = workflow.steps
+    missing = sorted({s.service for s in steps} - set(durations))
+    if missing:
+        raise ValueError(f"no duration for services: {', '.join(missing)}")
+    hints = workflow.critical_path or {
+        key: hint._asdict()
+        for key, hint in compile_critical_path(
+            steps, {s.key: durations[s.service].median for s in steps}
+        ).items()
+    }
+    index = {s.key: i for i, s in enumerate(steps)}
+    params: list[dict[str, Any]] = [s.default_params for s in steps]
+    return _Template(
+        keys=[s.key for s in steps],
+        services=[s.service for s in steps],
+        depends=[[index[dep] for dep in s.depends_on] for s in steps],
+        remaining=[float(hints.get(s.key, {}).get("remaining", 0.0)) for s in steps],
+        depth=[float(hints.get(s.key, {}).get("depth", 0.0)) for s in steps],
+        required=[p.get(REQUIRED_LABELS_PARAM) or {} for p in params],
+        preferred=[p.get(PREFERRED_NODE_PARAM) for p in params],
+    )
+
+
+class _Fleet:
+    """State of one simulation run."""
+
+    def __init__(
+        self,
+        nodes: Sequence[Node],
+        ordering: OrderingPolicy,
+        fallback_after: float | None,
+        warmup: float,
+    ) -> None:
+        self.ordering = ordering
+        self.fallback_after = fallback_after
+        self.warmup = warmup
+        self.nodes = {node.name: node for node in nodes}
+        self.slots: dict[str, list[tuple[str, int]]] = {}
+        for node in sorted(nodes, key=lambda n: n.name):
+            for service, limit in node.max_concurrency.items():
+                if limit > 0:
+                    self.slots.setdefault(service, []).append((node.name, limit))
+        self.running: dict[tuple[str, str], int] = {}
+        self.in_flight: dict[tuple[str, Any], int] = {}
+        # runnable tasks per service (or per service and class for fair
+        # share), each list sorted by the policy's key
+        self.queues: dict[Any, list[tuple[tuple, int, _Task]]] = {}
+        self.queued: dict[str, int] = {}
+        self.queue_area: dict[str, float] = {}
+        self.queue_max: dict[str, int] = {}
+        self.queue_since: dict[str, float] = {}
+        self.waits: dict[str, list[float]] = {}
+        self.busy: dict[tuple[str, str], float] = {}
+        self.started: dict[str, int] = {}
+        self._counter = 0
+
+    def _sort_key(self, task: _Task) -> tuple:
+        job = task.job
+        tiebreak = (job.seq, task.index)
+        if isinstance(self.ordering, PriorityOrder):
+            # j.priority DESC, j.order_seq, jt.priority DESC, jt.created_at, jt.id
+            return (-job.priority, job.seq, -task.priority, task.index)
+        return tiebreak
+
+    def _critical_rank(self, policy: CriticalPathOrder, task: _Task) -> tuple:
+        # remaining + aging * (now - created) DESC; "now" is common to every
+        # candidate, so the order does not change as time passes
+        aged = task.remaining - policy.aging * task.job.arrived
+        return (-aged, -task.depth, *task.key)
+
+    def _queue_name(self, task: _Task) -> Any:
+        if isinstance(self.ordering, FairShareOrder):
+            return (task.service, task.job.share_class)
+        return task.service
+
+    def _track_queue(self, service: str, now: float, delta: int) -> None:
+        depth = self.queued.get(service, 0)
+        since = max(self.queue_since.get(service, now), self.warmup)
+        if now > since:
+            area = self.queue_area.get(service, 0.0)
+            self.queue_area[service] = area + depth * (now - since)
+        self.queue_since[service] = now
+        self.queued[service] = depth + delta
+        if now >= self.warmup:
+            self.queue_max[service] = max(self.queue_max.get(service, 0), depth + delta)
+
+    def enqueue(self, task: _Task, now: float) -> None:
+        task.ready = now
+        task.key = self._sort_key(task)
+        if isinstance(self.ordering, CriticalPathOrder):
+            task.rank = self._critical_rank(self.ordering, task)
+        if self.fallback_after is not None:
+            latest = max(task.upstream, key=lambda up: up.finished, default=None)
+            task.home = task.preferred or (latest.node if latest else None)
+        self._counter += 1
+        queue = self.queues.setdefault(self._queue_name(task), [])
+        bisect.insort(queue, (task.key, self._counter, task))
+        self._track_queue(task.service, now, 1)
+
+    def _eligible(self, task: _Task, node: str, now: float, home_only: bool) -> bool:
+        labels = self.nodes[node].labels
+        if any(labels.get(k, _MISSING) != v for k, v in task.required.items()):
+            return False
+        if task.home is None or task.home == node:
+            return not home_only or task.home == node
+        return not home_only and now >= self.fallback_at(task)
+
+    def fallback_at(self, task: _Task) -> float:
+        """Return when ``task`` may run on a node other than its home node."""
+        # tasks only get a home node when fallback_after is set
+        assert self.fallback_after is not None
+        return task.ready + self.fallback_after
+
+    def _pick(self, service: str, node: str, now: float) -> _Task | None:
+        if isinstance(self.ordering, FairShareOrder):
+            return self._pick_fair(self.ordering, service)
+        queue = self.queues.get(service)
+        if not queue:
+            return None
+        window = 1
+        if isinstance(self.ordering, CriticalPathOrder):
+            window = self.ordering.window
+        if self.fallback_after is None:
+            return queue.pop(self._best(queue, range(min(window, len(queue)))))[2]
+        for home_only in (True, False):
+            eligible = (
+                i
+                for i, (_, _, task) in enumerate(queue)
+                if self._eligible(task, node, now, home_only)
+            )
+            head = list(itertools.islice(eligible, window))
+            if head:
+                return queue.pop(self._best(queue, head))[2]
+        return None
+
+    def _best(self, queue: list[tuple[tuple, int, _Task]], head: Sequence[int]) -> int:
+        # critical path ranks the head of the global order, see CriticalPathOrder
+        if len(head) == 1:
+            return head[0]
+        return min(head, key=lambda i: queue[i][2].rank)
+
+    def _pick_fair(self, policy: FairShareOrder, service: str) -> _Task | None:
+        best = None
+        for (queue_service, share_class), queue in self.queues.items():
+            if queue_service != service or not queue:
+                continue
+            weight = policy.weights.get(share_class, policy.default_weight)
+            rank = (self.in_flight.get((service, share_class), 0) + 1) / weight
+            candidate = (rank, queue[0][0], share_class)
+            if best is None or candidate < best:
+                best = candidate
+        if best is None:
+            return None
+        return self.queues[(service, best[2])].pop(0)[2]
+
+    def dispatch(self, service: str, now: float) -> list[_Task]:
+        """Claim runnable tasks of ``service`` into free slots at ``now``."""
+        claimed = []
+        for node, limit in self.slots.get(service, ()):
+            while (
+                self.queued.get(service)
+                and self.running.get((node, service), 0) < limit
+            ):
+                task = self._pick(service, node, now)
+                if task is None:
+                    break
+                self._start(task, node, now)
+                claimed.append(task)
+        return claimed
+
+    def _start(self, task: _Task, node: str, now: float) -> None:
+        service = task.service
+        task.node, task.started = node, now
+        self.running[(node, service)] = self.running.get((node, service), 0) + 1
+        share = (service, task.job.share_class)
+        self.in_flight[share] = self.in_flight.get(share, 0) + 1
+        self._track_queue(service, now, -1)
+        if now >= self.warmup:
+            self.waits.setdefault(service, []).append(now - task.ready)
+            self.started[service] = self.started.get(service, 0) + 1
+
+    def finish(self, task: _Task, now: float) -> None:
+        service = task.service
+        task.finished = now
+        assert task.node is not None  # set by _start
+        self.running[(task.node, service)] -= 1
+        self.in_flight[(service, task.job.share_class)] -= 1
+        self._add_busy(task, now)
+
+    def _add_busy(self, task: _Task, until: float) -> None:
+        start = max(task.started, self.warmup)
+        assert task.node is not None  # set by _start
+        if until > start:
+            key = (task.node, task.service)
+            self.busy[key] = self.busy.get(key, 0.0) + until - start
+
+    def close(self, until: float, running: Sequence[_Task]) -> None:
+        """Account for the tasks still ``running`` and queued at the end."""
+        for task in running:
+            self._add_busy(task, until)
+        for service in list(self.queued):
+            self._track_queue(service, until, 0)
+
+    def service_stats(
+        self, measured: float, percentiles: Sequence[float]
+    ) -> dict[str, ServiceStats]:
+        """Return the statistics of every service with slots."""
+        stats = {}
+        for service, slots in sorted(self.slots.items()):
+            capacity = sum(limit for _, limit in slots)
+            busy = sum(self.busy.get((node, service), 0.0) for node, _ in slots)
+            waits = sorted(self.waits.get(service, ()))
+            stats[service] = ServiceStats(
+                slots=capacity,
+                tasks=self.started.get(service, 0),
+                utilization=busy / (capacity * measured),
+                queue_mean=self.queue_area.get(service, 0.0) / measured,
+                queue_max=self.queue_max.get(service, 0),
+                queue_wait={p: _percentile(waits, p) for p in percentiles},
+            )
+        return stats
+
+    def node_utilization(self, measured: float) -> dict[str, float]:
+        """Return the busy fraction of every node's slots."""
+        utilization = {}
+        for name, node in sorted(self.nodes.items()):
+            capacity = sum(max(0, limit) for limit in node.max_concurrency.values())
+            busy = sum(
+                seconds for (owner, _), seconds in self.busy.items() if owner == name
+            )
+            utilization[name] = busy / (capacity * measured) if capacity else 0.0
+        return utilization
+
+
+def _check_options(
+    horizon: float,
+    warmup: float,
+    ordering: OrderingPolicy,
+    affinity: bool,
+    percentiles: Sequence[float],
+) -> None:
+    """Raise :class:`ValueError` for options :func:`simulate` cannot honour."""
+    if warmup >= horizon:
+        raise ValueError("warmup must be shorter than the horizon")
+    if any(not 0 <= p <= 1 for p in percentiles):
+        raise ValueError("percentiles must be between 0 and 1")
+    if isinstance(ordering, FairShareOrder) and affinity:
+        raise ValueError("fair share ordering cannot be simulated with affinity")
+    supported = (StrictOrder, PriorityOrder, CriticalPathOrder, FairShareOrder)
+    if not isinstance(ordering, supported):
+        raise ValueError(f"unsupported ordering policy: {type(ordering).__name__}")
+
+
+def _templates(
+    workflows: Sequence[WorkflowDef],
+    arrivals: Sequence[Arrival],
+    durations: Mapping[str, Duration],
+) -> dict[str, _Template]:
+    """Return the template of every workflow named by ``arrivals``."""
+    by_name = {workflow.name: workflow for workflow in workflows}
+    unknown = sorted({a.workflow for a in arrivals} - set(by_name))
+    if unknown:
+        raise ValueError(f"unknown workflows: {', '.join(unknown)}")
+    return {a.workflow: _template(by_name[a.workflow], durations) for a in arrivals}
+
+
+def _enqueue(
+    fleet: _Fleet,
+    tasks: Sequence[_Task],
+    now: float,
+    events: list[_Event],
+    wakeups: set[tuple[float, str]],
+    counter: Iterator[int],
+) -> set[str]:
+    """Queue the runnable ``tasks``; return the services they belong to.
+
+    Tasks waiting for their home node get an event when their fallback
+    expires, at most one per time and service.
+    """
+    services = set()
+    for task in tasks:
+        fleet.enqueue(task, now)
+        services.add(task.service)
+        if task.home is not None:
+            wakeup = (fleet.fallback_at(task), task.service)
+            if wakeup not in wakeups:
+                wakeups.add(wakeup)
+                heapq.heappush(events, (wakeup[0], next(counter), task.service))
+    return services
+
+
+def _complete(
+    task: _Task, now: float, warmup: float, latencies: dict[str, list[float]]
+) -> list[_Task]:
+    """Count ``task`` as done for its job; return the dependents now runnable."""
+    job = task.job
+    job.pending -= 1
+    if not job.pending and job.arrived >= warmup:
+        latencies[job.workflow].append(now - job.arrived)
+    ready = []
+    for child in task.dependents:
+        child.pending -= 1
+        if not child.pending:
+            ready.append(child)
+    return ready
+
+
+def _result(
+    fleet: _Fleet,
+    jobs: Sequence[_Job],
+    latencies: dict[str, list[float]],
+    measured: float,
+    warmup: float,
+    percentiles: Sequence[float],
+) -> SimulationResult:
+    """Summarise a finished run over the ``measured`` seconds after ``warmup``."""
+    for values in latencies.values():
+        values.sort()
+    overall = sorted(value for values in latencies.values() for value in values)
+
+    submitted = [job for job in jobs if job.arrived >= warmup]
+    return SimulationResult(
+        duration=measured,
+        jobs_submitted=len(submitted),
+        jobs_completed=len(overall),
+        throughput=len(overall) / measured * 3600,
+        latency={p: _percentile(overall, p) for p in percentiles},
+        mean_latency=sum(overall) / len(overall) if overall else math.nan,
+        workflow_latency={
+            name: {p: _percentile(values, p) for p in percentiles}
+            for name, values in sorted(latencies.items())
+        },
+        backlog=sum(1 for job in jobs if job.pending),
+        services=fleet.service_stats(measured, percentiles),
+        nodes=fleet.node_utilization(measured),
+    )
+
+
+def simulate(
+    workflows: Sequence[WorkflowDef],
+    nodes: Sequence[Node],
+    arrivals: Sequence[Arrival],
+    durations: Mapping[str, Duration],
+    *,
+    horizon: Seconds = timedelta(hours=8),
+    warmup: Seconds = timedelta(0),
+    ordering: OrderingPolicy = DEFAULT_ORDERING,
+    affinity: bool = False,
+    fallback_after: Seconds = timedelta(minutes=2),
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    seed: int | None = 0,
+) -> SimulationResult:
+    """Simulate ``nodes`` serving ``arrivals`` for ``horizon``.
+
+    Parameters
+    ----------
+    workflows:
+        Workflow definitions, looked up by name from ``arrivals``. Stored
+        ``critical_path`` hints are used when present, otherwise they are
+        compiled from the median durations.
+    nodes:
+        The fleet; every node contributes ``max_concurrency[service]``
+        slots. Labels matter only with ``affinity``.
+    arrivals:
+        Job streams; ``priority`` is the priority of the submitted jobs.
+    durations:
+        Run time distribution per service name.
+    horizon:
+        Simulated time; jobs arrive until then and the run stops there.
+    warmup:
+        Initial period excluded from all statistics so they describe the
+        steady state rather than an empty fleet filling up.
+    ordering:
+        Claim ordering policy. For :class:`~accscore.ordering.FairShareOrder`
+        with ``by="workflow"`` classes are keyed by workflow name.
+    affinity:
+        Claim like agents using :class:`~accscore.affinity.NodeAffinity`.
+    fallback_after:
+        How long a ready task waits for its home node with ``affinity``.
+    percentiles:
+        Fractions between 0 and 1 reported for latencies and queue waits.
+    seed:
+        Seed of the random arrivals and durations.
+
+    Raises :class:`ValueError` if an arrival names an unknown workflow, a
+    service has no duration or no node offers slots for it, or a workflow
+    has a cycle.
+    """
+    horizon_s, warmup_s = _seconds(horizon), _seconds(warmup)
+    _check_options(horizon_s, warmup_s, ordering, affinity, percentiles)
+    templates = _templates(workflows, arrivals, durations)
+    fleet = _Fleet(
+        nodes, ordering, _seconds(fallback_after) if affinity else None, warmup_s
+    )
+    needed = {service for t in templates.values() for service in t.services}
+    stranded = sorted(needed - set(fleet.slots))
+    if stranded:
+        raise ValueError(f"no node has slots for services: {', '.join(stranded)}")
+
+    rng = random.Random(seed)
+    fair_by_workflow = (
+        isinstance(ordering, FairShareOrder) and ordering.by == "workflow"
+    )
+    events: list[_Event] = []
+    counter = itertools.count(1)
+    for i, arrival in enumerate(arrivals):
+        if arrival.per_hour > 0:
+            at = rng.expovariate(arrival.per_hour / 3600)
+            heapq.heappush(events, (at, next(counter), i))
+
+    jobs: list[_Job] = []
+    latencies: dict[str, list[float]] = {name: [] for name in templates}
+    wakeups: set[tuple[float, str]] = set()
+    now = 0.0
+    while events and events[0][0] <= horizon_s:
+        now = events[0][0]
+        touched: set[str] = set()
+        while events and events[0][0] == now:
+            _, _, item = heapq.heappop(events)
+            if isinstance(item, _Task):
+                fleet.finish(item, now)
+                touched.add(item.service)
+                ready = _complete(item, now, warmup_s, latencies)
+            elif isinstance(item, int):
+                arrival = arrivals[item]
+                at = now + rng.expovariate(arrival.per_hour / 3600)
+                heapq.heappush(events, (at, next(counter), item))
+                template = templates[arrival.workflow]
+                share_class = arrival.workflow if fair_by_workflow else arrival.priority
+                job = _Job(
+                    seq=len(jobs),
+                    workflow=arrival.workflow,
+                    priority=arrival.priority,
+                    arrived=now,
+                    pending=len(template.keys),
+                    share_class=share_class,
+                )
+                jobs.append(job)
+                ready = [task for task in template.instantiate(job) if not task.pending]
+            else:
+                wakeups.discard((now, item))
+                touched.add(item)
+                ready = []
+            touched |= _enqueue(fleet, ready, now, events, wakeups, counter)
+        for service in sorted(touched):
+            for task in fleet.dispatch(service, now):
+                at = now + durations[service].sample(rng)
+                heapq.heappush(events, (at, next(counter), task))
+
+    running = [item for _, _, item in events if isinstance(item, _Task)]
+    fleet.close(horizon_s, running)
+    return _result(fleet, jobs, latencies, horizon_s - warmup_s, warmup_s, percentiles)
+
+
+__all__ = [
+    "Arrival",
+    "DEFAULT_PERCENTILES",
+    "Duration",
+    "ServiceStats",
+    "SimulationResult",
+    "empirical",
+    "exponential",
+    "fixed",
+    "lognormal",
+    "simulate",
+]
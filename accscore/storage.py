@@ -1,12 +1,15 @@
 """MinIO storage helpers."""
 
 import io
+from collections.abc import Iterable, Iterator
 from datetime import timedelta
-from typing import Literal, Optional
+from typing import BinaryIO, Literal, Optional
 from uuid import UUID
 
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 
+from .cache import ArtifactCache
 from .settings import Settings
 
 
@@ -17,6 +20,11 @@ client = Minio(
     secret_key=settings.minio_secret_key,
     secure=settings.minio_secure,
 )
+cache: ArtifactCache | None = (
+    ArtifactCache(settings.artifact_cache_dir, settings.artifact_cache_max_bytes)
+    if settings.artifact_cache_dir
+    else None
+)
 
 
 def ensure_bucket(bucket: str) -> None:
@@ -30,8 +38,19 @@ def put_object(bucket: str, name: str, data: bytes, content_type: Optional[str]
     client.put_object(bucket, name, io.BytesIO(data), len(data), content_type=content_type)
 
 
-def get_object(bucket: str, name: str) -> bytes:
-    """Download object as bytes."""
+def put_stream(
+    bucket: str,
+    name: str,
+    stream: BinaryIO,
+    length: int,
+    content_type: str | None = None,
+) -> None:
+    """Upload ``length`` bytes read from a binary stream."""
+    content_type = content_type or "application/octet-stream"
+    client.put_object(bucket, name, stream, length, content_type=content_type)
+
+
+def _download(bucket: str, name: str) -> bytes:
     response = client.get_object(bucket, name)
     try:
         return response.read()
@@ -40,6 +59,44 @@ def get_object(bucket: str, name: str) -> bytes:
         response.release_conn()
 
 
+def get_object(
+    bucket: str, name: str, checksum: str | None = None, *, revalidate: bool = False
+) -> bytes:
+    """Download object as bytes, through the node-local cache when configured.
+
+    Cache entries are keyed on ``checksum``, e.g. ``TaskArtifact.checksum``
+    from ``task_artifacts``, so a hit costs no request to object storage.
+    Without a checksum the object is downloaded uncached, unless
+    ``revalidate`` is set: then its ETag is looked up with a HEAD request and
+    used as the cache key instead.
+    """
+    if cache is None:
+        return _download(bucket, name)
+    version = checksum
+    if not version and revalidate:
+        version = client.stat_object(bucket, name).etag
+    if not version:
+        # nothing identifies the content, so it cannot be cached safely
+        return _download(bucket, name)
+    return cache.fetch(bucket, name, version, lambda: _download(bucket, name))
+
+
+def list_objects(bucket: str, prefix: str) -> Iterator[tuple[str, int]]:
+    """Yield ``(name, size)`` of every object under ``prefix``."""
+    for obj in client.list_objects(bucket, prefix=prefix, recursive=True):
+        yield obj.object_name, obj.size
+
+
+def remove_objects(bucket: str, names: Iterable[str]) -> list[str]:
+    """Delete objects with multi-object delete requests (up to 1000 per request).
+
+    Missing objects count as deleted; returns the names that could not be
+    deleted.
+    """
+    errors = client.remove_objects(bucket, (DeleteObject(name) for name in names))
+    return [error.name for error in errors if error.name is not None]
+
+
 def presign(bucket: str, name: str, expires: timedelta = timedelta(hours=1)) -> str:
     """Generate presigned download URL."""
     return client.presigned_get_object(bucket, name, expires=expires)
@@ -0,0 +1,114 @@
+"""Measure claim throughput on SQLite or Postgres.
+
+Jobs of a one-step workflow are submitted and instantiated, then every
+task is claimed in batches and driven through ``running`` and ``done``
+with the public helpers of :mod:`accscore.db`, each batch in its own
+transaction like an agent would. Without ``--dsn`` a throwaway SQLite file
+is used; with ``--dsn`` pointing at a scratch Postgres database the same
+workload runs there (the tables are left behind).
+
+Usage::
+
+    python benchmarks/bench_claims.py [--jobs 2000] \
+        [--dsn postgresql://...|sqlite:///path]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+os.environ.setdefault("MINIO_ENDPOINT", "unused")
+os.environ.setdefault("MINIO_ACCESS_KEY", "unused")
+os.environ.setdefault("MINIO_SECRET_KEY", "unused")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from accscore import codec  # noqa: E402
+from accscore.db import claim_tasks, mark_task_done, mark_task_running  # noqa: E402
+from accscore.db.jobs import submit_jobs  # noqa: E402
+from accscore.db.migrations import apply_migrations  # noqa: E402
+from accscore.db.sqlite import create_sqlite_engine  # noqa: E402
+
+
+def _engine(dsn: str) -> Engine:
+    if dsn.startswith("sqlite"):
+        return create_sqlite_engine(dsn)
+    return create_engine(dsn, future=True)
+
+
+def bench(engine: Engine, jobs: int, batch: int) -> None:
+    """Seed ``jobs`` jobs and time claiming and finishing all their tasks."""
+    service = f"bench-{uuid4().hex[:8]}"
+    steps = codec.dumps([{"key": "a", "service": service}])
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text(
+                "INSERT INTO workflows (name, version, steps) VALUES (:name, 1, :steps)"
+            ),
+            {"name": service, "steps": steps},
+        )
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        submit_jobs(
+            service, [{"n": i} for i in range(jobs)], conn=conn, instantiate=True
+        )
+    submit = time.perf_counter() - start
+
+    claimed = 0
+    start = time.perf_counter()
+    while True:
+        with Session(engine) as session, session.begin():
+            tasks = claim_tasks(session, service, batch, "bench")
+        if not tasks:
+            break
+        with Session(engine) as session, session.begin():
+            for task in tasks:
+                mark_task_running(session, task["id"], lease_token=task["lease_token"])
+                mark_task_done(
+                    session, task["id"], None, lease_token=task["lease_token"]
+                )
+        claimed += len(tasks)
+    cycle = time.perf_counter() - start
+
+    print(f"{engine.dialect.name:<10} submit      {jobs / submit:9.0f} jobs/s")
+    print(
+        f"{engine.dialect.name:<10} claim+done  {claimed / cycle:9.0f} tasks/s"
+        f"   ({batch} per claim)"
+    )
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn", help="database to use, defaults to a temporary SQLite file"
+    )
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=16, help="tasks per claim")
+    args = parser.parse_args()
+
+    if args.dsn:
+        bench(_engine(args.dsn), args.jobs, args.batch)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(Path(tmp) / "bench.db")
+        try:
+            bench(engine, args.jobs, args.batch)
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Compare the stdlib and orjson backends of :mod:`accscore.codec`.
+
+Two synthetic workloads are encoded and decoded with every available
+backend: progress/log events as written by services, and task ``params``
+with nested options as written by job instantiation. With ``--dsn``
+pointing at a scratch Postgres database the events are also inserted
+through :func:`accscore.db.events.log_event`, in a transaction that is
+rolled back.
+
+Usage::
+
+    python benchmarks/bench_json.py [--dsn postgresql://...] [--rounds 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+from uuid import uuid4
+
+os.environ.setdefault("MINIO_ENDPOINT", "unused")
+os.environ.setdefault("MINIO_ACCESS_KEY", "unused")
+os.environ.setdefault("MINIO_SECRET_KEY", "unused")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from accscore import codec  # noqa: E402
+from accscore.db.events import log_event  # noqa: E402
+from accscore.db.migrations import apply_migrations  # noqa: E402
+from accscore.schema import TaskStatus  # noqa: E402
+
+
+def _event(i: int) -> dict:
+    return {
+        "task_id": uuid4(),
+        "status": TaskStatus.RUNNING,
+        "ts": datetime.now(UTC),
+        "percent": i % 100,
+        "fps": 48.7,
+        "line": (
+            f"frame={i} fps=48.7 q=28.0 size=  {i * 17}kB"
+            f" time=00:00:{i % 60:02d}.00"
+        ),
+    }
+
+
+def _params(i: int) -> dict:
+    return {
+        "preset": "ebu-r128",
+        "required_labels": {"gpu": True, "zone": "eu"},
+        "outputs": [
+            {
+                "name": f"out-{n}",
+                "codec": "h264",
+                "bitrate": 4000 + n,
+                "tags": ["a", "b"],
+            }
+            for n in range(8)
+        ],
+        "source": {"bucket": "media", "key": f"input/{uuid4()}/ingest/{i}.mxf"},
+    }
+
+
+def _time(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - start
+
+
+def bench_codec(rounds: int) -> None:
+    """Time encoding and decoding of both workloads per backend."""
+    workloads = {
+        "events": [_event(i) for i in range(rounds)],
+        "params": [_params(i) for i in range(rounds)],
+    }
+    previous = codec.backend
+    try:
+        for backend in ("json", "orjson"):
+            try:
+                codec.use_backend(backend)
+            except ValueError:
+                print(f"{backend:<7} not installed")
+                continue
+            for name, items in workloads.items():
+                encoded = [codec.dumps(item) for item in items]
+                dump = statistics.median(_time(codec.dumps, items) for _ in range(5))
+                load = statistics.median(_time(codec.loads, encoded) for _ in range(5))
+                per_item = 1e6 / len(items)
+                print(
+                    f"{backend:<7} {name:<7} dumps {dump * per_item:7.2f} us/doc"
+                    f"   loads {load * per_item:7.2f} us/doc"
+                )
+    finally:
+        codec.use_backend(previous)
+
+
+def bench_inserts(dsn: str, rounds: int) -> None:
+    """Time ``log_event`` inserts with each backend."""
+    engine = create_engine(dsn, future=True)
+    previous = codec.backend
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            apply_migrations(conn=conn)
+            wf_id = conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version)"
+                    " VALUES ('bench', 1) RETURNING id"
+                )
+            ).scalar_one()
+            job_id = conn.execute(
+                text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                {"wf": wf_id},
+            ).scalar_one()
+            events = [_event(i) for i in range(rounds)]
+            for backend in ("json", "orjson"):
+                try:
+                    codec.use_backend(backend)
+                except ValueError:
+                    continue
+                elapsed = _time(
+                    lambda data: log_event(
+                        "info", "progress", "tick", data=data, job_id=job_id, conn=conn
+                    ),
+                    events,
+                )
+                print(f"{backend:<7} log_event {elapsed * 1e6 / rounds:9.2f} us/insert")
+        finally:
+            codec.use_backend(previous)
+            trans.rollback()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", help="scratch Postgres database for insert timings")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    bench_codec(args.rounds)
+    if args.dsn:
+        bench_inserts(args.dsn, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
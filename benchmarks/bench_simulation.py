@@ -0,0 +1,103 @@
+"""Time a capacity sweep with the fleet simulator.
+
+A three-step workflow (ingest, GPU render, pack) is simulated for one day of
+arrivals against fleets with one to ``--max-gpus`` render nodes, for every
+claim ordering policy, and the predicted throughput and p90 job latency of
+each configuration are printed with the time the sweep took.
+
+Usage::
+
+    python benchmarks/bench_simulation.py [--per-hour 90] [--max-gpus 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("MINIO_ENDPOINT", "unused")
+os.environ.setdefault("MINIO_ACCESS_KEY", "unused")
+os.environ.setdefault("MINIO_SECRET_KEY", "unused")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from accscore.ordering import (  # noqa: E402
+    CriticalPathOrder,
+    FairShareOrder,
+    PriorityOrder,
+    StrictOrder,
+)
+from accscore.schema import Node, WorkflowDef, WorkflowStep  # noqa: E402
+from accscore.simulation import Arrival, exponential, lognormal, simulate  # noqa: E402
+
+WORKFLOW = WorkflowDef(
+    name="render",
+    version=1,
+    steps=[
+        WorkflowStep(key="ingest", service="ingest"),
+        WorkflowStep(key="render", service="render", depends_on=["ingest"]),
+        WorkflowStep(key="pack", service="pack", depends_on=["render"]),
+    ],
+)
+
+DURATIONS = {
+    "ingest": exponential(15),
+    "render": lognormal(90, 0.5),
+    "pack": exponential(10),
+}
+
+ORDERINGS = {
+    "strict": StrictOrder(),
+    "priority": PriorityOrder(),
+    "critical": CriticalPathOrder(),
+    "fair": FairShareOrder(weights={0: 1, 5: 3}),
+}
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-hour", type=float, default=90, help="jobs per hour")
+    parser.add_argument("--max-gpus", type=int, default=4)
+    args = parser.parse_args()
+
+    arrivals = [
+        Arrival("render", per_hour=args.per_hour * 0.8),
+        Arrival("render", per_hour=args.per_hour * 0.2, priority=5),
+    ]
+    runs = 0
+    jobs = 0
+    start = time.perf_counter()
+    for gpus in range(1, args.max_gpus + 1):
+        nodes = [Node(name="cpu", max_concurrency={"ingest": 4, "pack": 4})]
+        nodes += [
+            Node(name=f"gpu{i}", max_concurrency={"render": 1}) for i in range(gpus)
+        ]
+        for name, ordering in ORDERINGS.items():
+            result = simulate(
+                [WORKFLOW],
+                nodes,
+                arrivals,
+                DURATIONS,
+                horizon=86400,
+                warmup=3600,
+                ordering=ordering,
+            )
+            runs += 1
+            jobs += result.jobs_submitted
+            print(
+                f"{gpus} gpus {name:<9} {result.throughput:7.1f} jobs/h"
+                f"  p90 {result.latency[0.9]:9.0f}s  backlog {result.backlog}"
+            )
+    elapsed = time.perf_counter() - start
+    print(
+        f"{runs} simulated days ({jobs} jobs) in {elapsed:.2f}s,"
+        f" {elapsed / runs * 1000:.0f} ms each"
+    )
+
+
+if __name__ == "__main__":
+    main()
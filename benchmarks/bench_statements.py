@@ -0,0 +1,172 @@
+"""Compare statement overhead with and without the shared statement registry.
+
+Client side, the benchmark times building a fresh ``text()`` per call against
+:func:`accscore.db.statements.statement`. With ``--dsn`` pointing at a
+scratch Postgres database it also times batches of event inserts rendered as
+one ``VALUES`` statement per batch size against :func:`log_events`, which
+reuses one ``unnest`` statement; ``--prepared`` runs them as server-side
+prepared statements (psycopg 3 DSNs only). Everything runs in a transaction
+that is rolled back.
+
+Usage::
+
+    python benchmarks/bench_statements.py [--dsn postgresql://...] [--prepared]
+        [--rounds 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("MINIO_ENDPOINT", "unused")
+os.environ.setdefault("MINIO_ACCESS_KEY", "unused")
+os.environ.setdefault("MINIO_SECRET_KEY", "unused")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from accscore.db.events import log_events  # noqa: E402
+from accscore.db.migrations import apply_migrations  # noqa: E402
+from accscore.db.statements import connect_args, statement  # noqa: E402
+from accscore.db.tasks import _SELECT_RUNNABLE_SQL  # noqa: E402
+
+EVENT_INSERT_SQL = """
+    INSERT INTO task_events
+        (job_id, job_task_id, ts, source, level, type, message, data)
+    VALUES (:job_id, :job_task_id, COALESCE(:ts, CURRENT_TIMESTAMP), :source,
+            :level, :type, :message, :data)
+    RETURNING id
+"""
+
+
+def _report(name: str, samples: list[float], unit: str = "us") -> None:
+    scale = 1e6 if unit == "us" else 1.0
+    values = sorted(s * scale for s in samples)
+    p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+    median = statistics.median(values)
+    print(f"{name:<44} median {median:9.2f} {unit}   p95 {p95:9.2f} {unit}")
+
+
+def bench_client(rounds: int) -> None:
+    """Time statement construction for the claim and event SQL."""
+    for label, sql in (
+        ("claim", _SELECT_RUNNABLE_SQL),
+        ("event insert", EVENT_INSERT_SQL),
+    ):
+        for mode, build in (
+            ("text() per call", text),
+            ("statement() registry", statement),
+        ):
+            samples = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                build(sql)
+                samples.append(time.perf_counter() - start)
+            _report(f"client {label:<12} {mode}", samples)
+
+
+def _values_insert(batch: list[dict]) -> tuple[str, dict]:
+    """Render the per-batch-size ``VALUES`` statement used before ``unnest``."""
+    rows, params = [], {}
+    for i, event in enumerate(batch):
+        rows.append(
+            f"(:job_id_{i}, :job_task_id_{i}, COALESCE(:ts_{i}, CURRENT_TIMESTAMP),"
+            f" :source_{i}, :level_{i}, :type_{i}, :message_{i},"
+            f" CAST(:data_{i} AS jsonb))"
+        )
+        params.update({f"{key}_{i}": value for key, value in event.items()})
+    sql = (
+        "INSERT INTO task_events"
+        " (job_id, job_task_id, ts, source, level, type, message, data) VALUES "
+        + ", ".join(rows)
+    )
+    return sql, params
+
+
+def _seed(conn) -> str:
+    wf_id = conn.execute(
+        text("INSERT INTO workflows (name, version) VALUES ('bench', 1) RETURNING id")
+    ).scalar_one()
+    job_id = conn.execute(
+        text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+        {"wf": wf_id},
+    ).scalar_one()
+    return str(job_id)
+
+
+def bench_server(dsn: str, rounds: int, *, prepared: bool = False) -> None:
+    """Compare per-batch-size ``VALUES`` inserts with the fixed ``unnest`` form."""
+    engine = create_engine(
+        dsn, future=True, connect_args=connect_args(dsn, prepared=prepared)
+    )
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            apply_migrations(conn=conn)
+            job_id = _seed(conn)
+            for size in (1, 10, 100, 500):
+                events = [
+                    {
+                        "job_id": job_id,
+                        "job_task_id": None,
+                        "ts": None,
+                        "source": "bench",
+                        "level": "info",
+                        "type": "progress",
+                        "message": "tick",
+                        "data": json.dumps({"percent": i}),
+                    }
+                    for i in range(size)
+                ]
+                samples = []
+                for _ in range(rounds):
+                    sql, params = _values_insert(events)
+                    start = time.perf_counter()
+                    conn.execute(text(sql), params)
+                    samples.append((time.perf_counter() - start) * 1000)
+                _report(f"server {size:>3} events VALUES", samples, unit="ms")
+
+                events = [
+                    dict(event, data={"percent": i}) for i, event in enumerate(events)
+                ]
+                samples = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    log_events(events, conn=conn)
+                    samples.append((time.perf_counter() - start) * 1000)
+                _report(
+                    f"server {size:>3} events log_events (unnest)", samples, unit="ms"
+                )
+        finally:
+            trans.rollback()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn", help="scratch Postgres database for server-side timings"
+    )
+    parser.add_argument(
+        "--prepared",
+        action="store_true",
+        help="use server-side prepared statements (postgresql+psycopg:// only)",
+    )
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    bench_client(args.rounds)
+    if args.dsn:
+        bench_server(args.dsn, max(10, args.rounds // 10), prepared=args.prepared)
+        print(f"statement registry entries: {statement.cache_info().currsize}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.affinity import NodeAffinity
+from accscore.db.migrations import apply_migrations
+from accscore.db.tasks import select_runnable
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def test_affinity_params():
+    affinity = NodeAffinity("gpu1", fallback_after=timedelta(seconds=30))
+    assert affinity.params() == {
+        "aff_node": "gpu1",
+        "aff_fallback": timedelta(seconds=30),
+    }
+    assert ":aff_node" in affinity.where()
+    assert affinity.prefer().endswith("ASC")
+
+
+def _seed(conn):
+    conn.execute(
+        text(
+            "INSERT INTO nodes (name, labels) VALUES"
+            """ ('gpu1', '{"gpu": true, "zone": "eu"}'),"""
+            """ ('cpu1', '{"zone": "eu"}')"""
+        )
+    )
+    wf_id = conn.execute(
+        text("INSERT INTO workflows (name, version) VALUES ('wf', 1) RETURNING id")
+    ).scalar_one()
+    job_a, job_b = (
+        conn.execute(
+            text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+            {"wf": wf_id},
+        ).scalar_one()
+        for _ in range(2)
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO job_tasks (job_id, task_key, service_name, params, created_at)
+            VALUES
+              (:a, 'render', 'svc', '{"required_labels": {"gpu": true}}',
+               now() - interval '2s'),
+              (:a, 'plain', 'svc', '{}', now() - interval '1s')
+            """
+        ),
+        {"a": job_a},
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO job_tasks
+                (job_id, task_key, service_name, status, assigned_node, finished_at)
+            VALUES (:b, 'ingest', 'other', 'done', 'gpu1', now())
+            """
+        ),
+        {"b": job_b},
+    )
+    conn.execute(
+        text(
+            "INSERT INTO job_tasks (job_id, task_key, service_name, depends_on)"
+            " VALUES (:b, 'audio', 'svc', '{ingest}')"
+        ),
+        {"b": job_b},
+    )
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_label_filter_and_sticky_preference():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            _seed(conn)
+
+        def keys(node, limit=10, wait=timedelta(minutes=5)):
+            with engine.begin() as conn:
+                rows = select_runnable(
+                    "svc", limit, conn=conn, affinity=NodeAffinity(node, wait)
+                )
+                return [r["task_key"] for r in rows]
+
+        # the GPU node sees everything and prefers the task whose input it made
+        assert keys("gpu1") == ["audio", "render", "plain"]
+        assert keys("gpu1", limit=1) == ["audio"]
+        # the CPU node lacks the label and must wait for the upstream node
+        assert keys("cpu1") == ["plain"]
+        assert keys("cpu1", wait=timedelta(0)) == ["plain", "audio"]
+        # unaffine claims are unchanged
+        with engine.begin() as conn:
+            rows = select_runnable("svc", 10, conn=conn)
+            assert [r["task_key"] for r in rows] == ["render", "plain", "audio"]
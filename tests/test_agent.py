@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.agents import service
+from accscore.agents.service import ServiceAgent, TaskContext
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def _seed(engine, tasks: int) -> None:
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text(
+                "INSERT INTO nodes (name, max_concurrency)"
+                " VALUES ('n1', CAST('{\"svc\": 2}' AS jsonb))"
+            )
+        )
+        wf_id = conn.execute(
+            text("INSERT INTO workflows (name, version) VALUES ('wf', 1) RETURNING id")
+        ).scalar_one()
+        job_id = conn.execute(
+            text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+            {"wf": wf_id},
+        ).scalar_one()
+        for i in range(tasks):
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks (job_id, task_key, service_name, params)"
+                    " VALUES (:job, :key, 'svc', CAST(:params AS jsonb))"
+                ),
+                {"job": job_id, "key": f"t{i}", "params": f'{{"n": {i}}}'},
+            )
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_agent_runs_tasks_within_node_concurrency():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        _seed(engine, 5)
+
+        lock = threading.Lock()
+        active = peak = 0
+
+        def handler(ctx: TaskContext) -> dict:
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            ctx.progress(50)
+            ctx.event("halfway", data={"n": ctx.params["n"]})
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+            if ctx.params["n"] == 3:
+                raise ValueError("bad input")
+            return {"n": ctx.params["n"]}
+
+        agent = ServiceAgent("svc", "n1", handler, engine=engine, flush_interval=0.05)
+        agent.run(stop_when_idle=True)
+
+        assert agent.max_workers == 2
+        assert peak == 2
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT task_key, status, progress, results, started_at"
+                    " FROM job_tasks ORDER BY task_key"
+                )
+            ).all()
+            events = conn.execute(
+                text("SELECT count(*) FROM task_events WHERE message = 'halfway'")
+            ).scalar_one()
+            last_seen = conn.execute(
+                text("SELECT last_seen FROM nodes WHERE name = 'n1'")
+            ).scalar_one()
+        assert [r.status for r in rows] == ["done", "done", "done", "error", "done"]
+        assert rows[3].results["error"] == {
+            "code": "ValueError",
+            "message": "bad input",
+        }
+        assert rows[0].results == {"n": 0} and rows[0].progress == 100
+        assert all(r.started_at is not None for r in rows)
+        assert events == 5
+        assert last_seen is not None
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_agent_stop_drains_running_tasks():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        _seed(engine, 3)
+
+        started = threading.Semaphore(0)
+        release = threading.Event()
+
+        def handler(ctx: TaskContext) -> None:
+            started.release()
+            release.wait(5)
+
+        agent = ServiceAgent("svc", "n1", handler, engine=engine)
+        runner = threading.Thread(target=agent.run)
+        runner.start()
+        assert started.acquire(timeout=5) and started.acquire(timeout=5)
+        agent.stop()
+        time.sleep(0.2)
+        # stopping waits for the running handlers instead of abandoning them
+        assert runner.is_alive()
+        release.set()
+        runner.join(10)
+        assert not runner.is_alive()
+
+        with engine.connect() as conn:
+            statuses = sorted(
+                r.status for r in conn.execute(text("SELECT status FROM job_tasks"))
+            )
+        assert statuses == ["done", "done", "queued"]
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_failed_flush_keeps_reports_and_retries(monkeypatch):
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        _seed(engine, 3)
+
+        failures = []
+        log_events = service.log_events
+
+        def flaky_log_events(events, *, conn):
+            if len(failures) < 2:
+                failures.append(len(events))
+                raise ConnectionError("storage unavailable")
+            return log_events(events, conn=conn)
+
+        monkeypatch.setattr(service, "log_events", flaky_log_events)
+
+        def handler(ctx: TaskContext) -> dict:
+            ctx.event("hello")
+            return {"n": ctx.params["n"]}
+
+        agent = ServiceAgent("svc", "n1", handler, engine=engine, flush_interval=0.01)
+        agent.run(stop_when_idle=True)
+
+        assert len(failures) == 2
+        with engine.connect() as conn:
+            statuses = [
+                r.status for r in conn.execute(text("SELECT status FROM job_tasks"))
+            ]
+            events = conn.execute(
+                text("SELECT count(*) FROM task_events WHERE message = 'hello'")
+            ).scalar_one()
+        assert statuses == ["done"] * 3
+        assert events == 3
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_failed_claim_and_renewal_are_retried(monkeypatch):
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        _seed(engine, 3)
+
+        failures = {"claim": 0, "renew": 0}
+        claim_tasks, renew_leases = service.db.claim_tasks, service.renew_leases
+
+        def flaky_claim_tasks(*args, **kwargs):
+            if failures["claim"] < 2:
+                failures["claim"] += 1
+                raise ConnectionError("database unavailable")
+            return claim_tasks(*args, **kwargs)
+
+        def flaky_renew_leases(leases, **kwargs):
+            if leases and failures["renew"] < 2:
+                failures["renew"] += 1
+                raise ConnectionError("database unavailable")
+            return renew_leases(leases, **kwargs)
+
+        monkeypatch.setattr(service.db, "claim_tasks", flaky_claim_tasks)
+        monkeypatch.setattr(service, "renew_leases", flaky_renew_leases)
+
+        def handler(ctx: TaskContext) -> dict:
+            time.sleep(0.1)
+            return {"n": ctx.params["n"]}
+
+        agent = ServiceAgent(
+            "svc",
+            "n1",
+            handler,
+            engine=engine,
+            flush_interval=0.01,
+            lease_ttl=timedelta(seconds=0.3),
+        )
+        agent.run(stop_when_idle=True)
+
+        assert failures == {"claim": 2, "renew": 2}
+        with engine.connect() as conn:
+            statuses = [
+                r.status for r in conn.execute(text("SELECT status FROM job_tasks"))
+            ]
+        # the failed renewals neither cancelled the handlers nor dropped reports
+        assert statuses == ["done"] * 3
@@ -0,0 +1,227 @@
+import io
+import os
+from uuid import uuid4
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from accscore import storage
+from accscore.db.artifacts import artifact_manifest, record_artifacts, upload_artifact
+from accscore.schema import ArtifactKind, TaskArtifact
+
+
+class DummyClient:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def put_object(self, bucket, name, stream, length, content_type=None):
+        self.uploads += 1
+        self.objects[(bucket, name)] = stream.read(length)
+
+    def stat_object(self, bucket, name):
+        if (bucket, name) not in self.objects:
+            raise KeyError(name)
+        return object()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    dummy = DummyClient()
+    monkeypatch.setattr(storage, "client", dummy)
+    return dummy
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite:///:memory:", future=True)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                CREATE TABLE task_artifacts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    job_task_id TEXT,
+                    kind TEXT,
+                    bucket TEXT,
+                    key TEXT,
+                    size_bytes INTEGER,
+                    content_type TEXT,
+                    checksum TEXT,
+                    created_at TEXT
+                )
+                """
+            )
+        )
+        conn.execute(
+            text("CREATE TABLE job_tasks (id TEXT PRIMARY KEY, task_key TEXT)")
+        )
+        yield conn
+
+
+def test_upload_then_deduplicate(client, conn):
+    first = upload_artifact(
+        job_id="j1",
+        kind="output",
+        bucket="b",
+        key="output/j1/t/a.wav",
+        source=b"same",
+        conn=conn,
+    )
+    assert not first.deduplicated
+    assert first.checksum.startswith("sha256:")
+
+    second = upload_artifact(
+        job_id="j2",
+        kind="output",
+        bucket="b",
+        key="output/j2/t/a.wav",
+        source=io.BytesIO(b"same"),
+        conn=conn,
+    )
+    assert second.deduplicated
+    assert second.key == "output/j1/t/a.wav"
+    assert second.id != first.id
+    assert client.uploads == 1
+
+    rows = conn.execute(
+        text("SELECT job_id, key, size_bytes FROM task_artifacts ORDER BY id")
+    ).all()
+    assert [tuple(r) for r in rows] == [
+        ("j1", "output/j1/t/a.wav", 4),
+        ("j2", "output/j1/t/a.wav", 4),
+    ]
+
+
+def test_different_content_or_bucket_is_uploaded(client, conn):
+    upload_artifact(
+        job_id="j1", kind="output", bucket="b", key="k1", source=b"one", conn=conn
+    )
+    res = upload_artifact(
+        job_id="j1", kind="output", bucket="b", key="k2", source=b"two", conn=conn
+    )
+    assert not res.deduplicated
+    res = upload_artifact(
+        job_id="j1", kind="output", bucket="c", key="k3", source=b"one", conn=conn
+    )
+    assert not res.deduplicated
+    assert client.uploads == 3
+
+
+def test_missing_object_is_uploaded_again(client, conn):
+    upload_artifact(
+        job_id="j1", kind="output", bucket="b", key="k1", source=b"x", conn=conn
+    )
+    client.objects.clear()
+    res = upload_artifact(
+        job_id="j2", kind="output", bucket="b", key="k2", source=b"x", conn=conn
+    )
+    assert not res.deduplicated
+    assert res.key == "k2"
+    assert ("b", "k2") in client.objects
+
+
+def test_record_artifacts_in_batches(conn):
+    job_id = uuid4()
+    task_id = uuid4()
+    artifacts = [
+        {
+            "job_id": "j1",
+            "job_task_id": "t1",
+            "kind": "output",
+            "bucket": "b",
+            "key": f"f{i}",
+        }
+        for i in range(4)
+    ]
+    artifacts.append(
+        TaskArtifact(
+            job_id=job_id,
+            job_task_id=task_id,
+            kind=ArtifactKind.LOG,
+            bucket="b",
+            key="log.jsonl",
+            size_bytes=3,
+        )
+    )
+    assert record_artifacts(artifacts, conn=conn, batch_size=2) == 5
+    rows = conn.execute(
+        text("SELECT job_id, kind, key, size_bytes FROM task_artifacts ORDER BY id")
+    ).all()
+    assert len(rows) == 5
+    assert tuple(rows[-1]) == (str(job_id), "log", "log.jsonl", 3)
+    assert record_artifacts([], conn=conn) == 0
+
+
+def test_artifact_manifest_groups_by_task_and_kind(conn):
+    conn.execute(
+        text(
+            "INSERT INTO job_tasks (id, task_key)"
+            " VALUES ('t1', 'ingest'), ('t2', 'audio')"
+        )
+    )
+    record_artifacts(
+        [
+            {
+                "job_id": "j1",
+                "job_task_id": "t1",
+                "kind": "output",
+                "bucket": "b",
+                "key": "stem1",
+            },
+            {
+                "job_id": "j1",
+                "job_task_id": "t1",
+                "kind": "output",
+                "bucket": "b",
+                "key": "stem2",
+            },
+            {
+                "job_id": "j1",
+                "job_task_id": "t1",
+                "kind": "log",
+                "bucket": "b",
+                "key": "log",
+            },
+            {
+                "job_id": "j1",
+                "job_task_id": "t2",
+                "kind": "output",
+                "bucket": "b",
+                "key": "mix",
+            },
+            {
+                "job_id": "j1",
+                "job_task_id": None,
+                "kind": "input",
+                "bucket": "b",
+                "key": "src",
+            },
+            {
+                "job_id": "j2",
+                "job_task_id": None,
+                "kind": "input",
+                "bucket": "b",
+                "key": "other",
+            },
+        ],
+        conn=conn,
+    )
+
+    manifest = artifact_manifest("j1", conn=conn)
+    assert set(manifest) == {"ingest", "audio", None}
+    assert [a["key"] for a in manifest["ingest"]["output"]] == ["stem1", "stem2"]
+    assert [a["key"] for a in manifest["ingest"]["log"]] == ["log"]
+    assert [a["key"] for a in manifest[None]["input"]] == ["src"]
+
+    upstream = artifact_manifest(
+        "j1", conn=conn, task_keys=["ingest"], kinds=[ArtifactKind.OUTPUT]
+    )
+    assert list(upstream) == ["ingest"]
+    assert list(upstream["ingest"]) == ["output"]
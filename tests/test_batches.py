@@ -0,0 +1,178 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db import sqlite
+from accscore.db.batches import (
+    BatchSpec,
+    _group,
+    claim_batches,
+    mark_batch_done,
+    mark_batch_error,
+)
+from accscore.db.leases import LeaseLostError
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def test_group_keeps_order_and_bounds():
+    rows = [
+        {"id": 1, "params": {"preset": "ebu"}},
+        {"id": 2, "params": {}},
+        {"id": 3, "params": {"preset": "ebu"}},
+        {"id": 4, "params": {"preset": "atsc"}},
+        {"id": 5, "params": {"preset": "ebu"}},
+    ]
+    spec = BatchSpec(key="preset", size=2)
+    grouped = _group(rows, spec, max_batches=3, capacity=10)
+    assert [(key, [r["id"] for r in tasks]) for key, tasks in grouped] == [
+        ("ebu", [1, 3]),
+        (None, [2]),
+        ("atsc", [4]),
+    ]
+    assert [len(t) for _, t in _group(rows, spec, max_batches=3, capacity=2)] == [2]
+    with pytest.raises(ValueError):
+        BatchSpec(key="preset", size=0)
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_claim_and_finish_batches():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            wf_id = conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version)"
+                    " VALUES ('wf', 1) RETURNING id"
+                )
+            ).scalar_one()
+            for preset in ("ebu", "atsc", "ebu", "ebu"):
+                job_id = conn.execute(
+                    text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                    {"wf": wf_id},
+                ).scalar_one()
+                conn.execute(
+                    text(
+                        "INSERT INTO job_tasks (job_id, task_key, service_name, params)"
+                        " VALUES (:job, 'loudness', 'loudness',"
+                        " jsonb_build_object('preset', CAST(:preset AS text)))"
+                    ),
+                    {"job": job_id, "preset": preset},
+                )
+
+        spec = BatchSpec(key="preset", size=2)
+        with Session(engine) as session, session.begin():
+            (first,) = claim_batches(session, "loudness", "n1", spec)
+            assert first.key == "ebu" and len(first.tasks) == 2
+            assert all(
+                t["status"] == "starting" and t["lease_token"] == 1 for t in first.tasks
+            )
+            # the rest of the lookahead window stays claimable by others
+            with engine.connect() as other:
+                locked = other.execute(
+                    text(
+                        "SELECT count(*) FROM (SELECT id FROM job_tasks"
+                        " WHERE id <> ALL(:ids) FOR UPDATE NOWAIT) t"
+                    ),
+                    {"ids": [t["id"] for t in first.tasks]},
+                ).scalar_one()
+                assert locked == 2
+        with Session(engine) as session, session.begin():
+            batches = claim_batches(session, "loudness", "n1", spec, max_batches=5)
+            assert [(b.key, len(b.tasks)) for b in batches] == [("atsc", 1), ("ebu", 1)]
+
+        with Session(engine) as session, session.begin():
+            mark_batch_done(session, first)
+            # the stale token comes last: the earlier transition is rolled back
+            stale = batches[1]._replace(
+                tasks=batches[0].tasks + [{**batches[1].tasks[0], "lease_token": 0}]
+            )
+            with pytest.raises(LeaseLostError):
+                mark_batch_error(session, stale, "boom", "failed")
+            errored = session.execute(
+                text("SELECT count(*) FROM job_tasks WHERE status = 'error'")
+            ).scalar_one()
+            assert errored == 0
+            mark_batch_error(session, batches[0], "boom", "failed")
+
+        with engine.connect() as conn:
+            statuses = conn.execute(
+                text(
+                    "SELECT params->>'preset' AS preset, status FROM job_tasks"
+                    " ORDER BY params->>'preset', status"
+                )
+            ).all()
+        assert [tuple(r) for r in statuses] == [
+            ("atsc", "error"),
+            ("ebu", "done"),
+            ("ebu", "done"),
+            ("ebu", "starting"),
+        ]
+
+
+def test_claim_batches_on_sqlite(tmp_path):
+    engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text("INSERT INTO workflows (id, name, version) VALUES ('w', 'wf', 1)")
+        )
+        for n, preset in enumerate(("ebu", "atsc", "ebu", "ebu")):
+            conn.execute(
+                text(
+                    "INSERT INTO jobs (id, workflow_id, order_seq)"
+                    " VALUES (:job, 'w', :n)"
+                ),
+                {"job": f"j{n}", "n": n},
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks (job_id, task_key, service_name, params)"
+                    " VALUES (:job, 'loudness', 'loudness',"
+                    " json_object('preset', :preset))"
+                ),
+                {"job": f"j{n}", "preset": preset},
+            )
+
+    spec = BatchSpec(key="preset", size=2)
+    with Session(engine) as session, session.begin():
+        (first,) = claim_batches(session, "loudness", "n1", spec)
+        assert first.key == "ebu" and [t["job_id"] for t in first.tasks] == ["j0", "j2"]
+        assert all(
+            t["status"] == "starting" and t["lease_token"] == 1 for t in first.tasks
+        )
+    with Session(engine) as session, session.begin():
+        batches = claim_batches(session, "loudness", "n2", spec, max_batches=5)
+        assert [(b.key, len(b.tasks)) for b in batches] == [("atsc", 1), ("ebu", 1)]
+        mark_batch_done(session, first)
+
+    with engine.connect() as conn:
+        statuses = conn.execute(
+            text("SELECT job_id, status FROM job_tasks ORDER BY job_id")
+        ).all()
+    assert [tuple(r) for r in statuses] == [
+        ("j0", "done"),
+        ("j1", "starting"),
+        ("j2", "done"),
+        ("j3", "starting"),
+    ]
+    engine.dispose()
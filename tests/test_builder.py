@@ -0,0 +1,102 @@
+import json
+import os
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.agents.builder import Builder
+from accscore.db import sqlite
+from accscore.db.jobs import submit_jobs
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def test_builder_rejects_empty_batches():
+    with pytest.raises(ValueError):
+        Builder(engine=create_engine("sqlite://"), batch_size=0)
+
+
+def test_builder_tick_needs_postgres(tmp_path):
+    engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+    with pytest.raises(sqlite.UnsupportedBackendError):
+        Builder(engine=engine).tick()
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_builder_tick_follows_watermarks():
+    from testcontainers.postgres import PostgresContainer
+
+    steps = [
+        {"key": "ingest", "service": "ingest"},
+        {"key": "render", "service": "renderer", "depends_on": ["ingest"]},
+    ]
+    later = datetime.now(UTC) + timedelta(hours=1)
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version, steps)"
+                    " VALUES ('wf', 1, CAST(:steps AS jsonb))"
+                ),
+                {"steps": json.dumps(steps)},
+            )
+            submit_jobs("wf", [{}] * 5, conn=conn)
+            scheduled = submit_jobs("wf", [{}] * 2, conn=conn, scheduled_at=later)
+
+        builder = Builder(engine=engine, batch_size=2, max_batches=2, full_scan_every=4)
+        first = builder.tick()
+        assert (first.jobs, first.batches, first.full_scan, first.drained) == (
+            4,
+            2,
+            True,
+            False,
+        )
+        assert builder.due_after is None
+        second = builder.tick()
+        assert (second.jobs, second.full_scan, second.drained) == (1, True, True)
+
+        with engine.begin() as conn:
+            (locked,) = submit_jobs("wf", [{}], conn=conn)
+            submit_jobs("wf", [{}], conn=conn)
+        with engine.connect() as other:
+            with other.begin():
+                # another builder holds the older job: skip it, take the newer one
+                other.execute(
+                    text("SELECT 1 FROM jobs WHERE id = :id FOR UPDATE"), {"id": locked}
+                )
+                third = builder.tick()
+        assert (third.jobs, third.full_scan) == (1, False)
+        # the watermark moved past the skipped job; only the full scan finds it
+        assert builder.tick().jobs == 0
+        fourth = builder.tick()
+        assert (fourth.jobs, fourth.full_scan) == (1, True)
+
+        due = builder.tick(now=later + timedelta(minutes=5))
+        assert (due.jobs, due.full_scan) == (2, False)
+        assert 299 <= due.lag <= 301
+
+        with engine.connect() as conn:
+            jobs = conn.execute(
+                text("SELECT id, status, started_at FROM jobs ORDER BY order_seq")
+            ).all()
+            tasks = conn.execute(text("SELECT count(*) FROM job_tasks")).scalar_one()
+        assert all(j.status == "running" and j.started_at is not None for j in jobs)
+        assert {j.id for j in jobs[-4:-2]} == set(scheduled)
+        assert tasks == 2 * len(jobs)
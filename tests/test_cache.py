@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+from accscore.cache import ArtifactCache
+
+
+def test_miss_then_hit(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    assert cache.get("b", "k", "v1") is None
+    cache.put("b", "k", "v1", b"hello")
+    assert cache.get("b", "k", "v1") == b"hello"
+    # a new version is a different entry
+    assert cache.get("b", "k", "v2") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+    assert cache.stats.bytes_saved == 5
+
+
+def test_fetch_calls_loader_once(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return b"data"
+
+    assert cache.fetch("b", "k", "etag", loader) == b"data"
+    assert cache.fetch("b", "k", "etag", loader) == b"data"
+    assert len(calls) == 1
+
+
+def test_shared_between_instances(tmp_path):
+    ArtifactCache(tmp_path, max_bytes=1024).put("b", "k", "v", b"x")
+    assert ArtifactCache(tmp_path, max_bytes=1024).get("b", "k", "v") == b"x"
+
+
+def test_lru_eviction(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1000)
+    for name in ("a", "b", "c"):
+        path = cache.put("b", name, "v", b"x" * 100)
+        old = time.time() - 100 + ord(name)
+        os.utime(path, (old, old))
+    cache.max_bytes = 250
+    # touching "a" makes "b" the least recently used entry
+    assert cache.get("b", "a", "v") is not None
+    assert cache.evict() == 1
+    assert cache.path("b", "b", "v") is None
+    assert cache.path("b", "a", "v") is not None
+    assert cache.size() == 200
+    assert cache.stats.evictions == 1
+
+
+def test_put_evicts_when_over_cap(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=100)
+    for i in range(5):
+        cache.put("b", str(i), "v", b"x" * 40)
+    assert cache.size() <= 100
+
+
+def test_stale_tmp_files_are_removed(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=100)
+    shard = tmp_path / "objects" / "00"
+    shard.mkdir()
+    tmp = shard / ".tmp-abc"
+    tmp.write_bytes(b"partial")
+    os.utime(tmp, (0, 0))
+    assert cache.size() == 0
+    assert not tmp.exists()
+
+
+def test_invalid_max_bytes(tmp_path):
+    with pytest.raises(ValueError):
+        ArtifactCache(tmp_path, max_bytes=0)
@@ -0,0 +1,71 @@
+import os
+from datetime import UTC, datetime
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore import codec
+from accscore.db.statements import statement
+from accscore.schema import TaskStatus, WorkflowStep
+
+BACKENDS = ["json"] + (["orjson"] if codec.orjson is not None else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = codec.backend
+    codec.use_backend(request.param)
+    yield request.param
+    codec.use_backend(previous)
+
+
+def test_schema_values_encode_natively(backend):
+    task_id = uuid4()
+    ts = datetime(2024, 5, 1, 12, 30, tzinfo=UTC)
+    payload = {
+        "id": task_id,
+        "ts": ts,
+        "status": TaskStatus.DONE,
+        "progress": Decimal("12.5"),
+        "step": WorkflowStep(key="a", service="svc"),
+        3: "int key",
+    }
+    decoded = codec.loads(codec.dumps(payload))
+    assert decoded["id"] == str(task_id)
+    assert datetime.fromisoformat(decoded["ts"]) == ts
+    assert decoded["status"] == "done"
+    assert decoded["progress"] == 12.5
+    assert decoded["step"]["depends_on"] == []
+    assert decoded["3"] == "int key"
+    assert codec.dumps_bytes({"a": 1}) == b'{"a":1}'
+    with pytest.raises(TypeError):
+        codec.dumps({"x": object()})
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        codec.use_backend("simplejson")
+
+
+def test_typed_statement_binds_without_dialect_branching(backend):
+    engine = create_engine("sqlite://", future=True)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (params TEXT, deps TEXT)"))
+        conn.execute(
+            statement(
+                "INSERT INTO t VALUES (:params, :deps)",
+                json=("params",),
+                arrays=("deps",),
+            ),
+            {"params": {"job": uuid4(), "n": 1}, "deps": ("ingest",)},
+        )
+        params, deps = conn.execute(text("SELECT params, deps FROM t")).one()
+    assert codec.loads(params)["n"] == 1
+    assert codec.loads(deps) == ["ingest"]
@@ -0,0 +1,190 @@
+import json
+import os
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.critical_path import (
+    compile_critical_path,
+    earliest_starts,
+    hint_durations,
+    hints_to_json,
+    refresh_critical_path,
+)
+from accscore.db import instantiate_tasks
+from accscore.db.migrations import apply_migrations
+from accscore.db.tasks import select_runnable
+from accscore.ordering import CriticalPathOrder
+from accscore.schema import WorkflowStep
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+STEPS = [
+    {"key": "ingest", "service": "ingest"},
+    {"key": "thumb", "service": "ingest"},
+    {"key": "audio", "service": "audio", "depends_on": ["ingest"]},
+    {"key": "render", "service": "renderer", "depends_on": ["audio"]},
+    {"key": "upload", "service": "upload", "depends_on": ["render", "thumb"]},
+]
+
+
+def test_compile_depth_and_remaining_work():
+    hints = compile_critical_path(
+        [WorkflowStep(**step) for step in STEPS],
+        {"ingest": 10, "audio": 20, "render": 100},
+        default_duration=5,
+    )
+    assert hints["upload"] == (0, 5.0)
+    assert hints["render"] == (1, 105.0)
+    assert hints["ingest"] == (3, 135.0)
+    assert hints["thumb"] == (1, 10.0)
+
+
+def test_earliest_starts_follow_longest_upstream_chain():
+    starts = earliest_starts(STEPS, {"ingest": 10, "audio": 20, "render": 100}, 5)
+    assert starts == {
+        "ingest": 0.0,
+        "thumb": 0.0,
+        "audio": 10.0,
+        "render": 30.0,
+        "upload": 130.0,
+    }
+
+
+def test_hint_durations_invert_compilation():
+    durations = {"ingest": 10, "thumb": 5, "audio": 20, "render": 100, "upload": 5}
+    hints = compile_critical_path(STEPS, durations)
+    assert hint_durations(STEPS, hints) == pytest.approx(durations)
+    stored = hints_to_json(hints)
+    del stored["thumb"]
+    assert hint_durations(STEPS, stored) == pytest.approx(
+        {k: v for k, v in durations.items() if k != "thumb"}
+    )
+
+
+def test_compile_rejects_invalid_dags():
+    with pytest.raises(ValueError, match="unknown step"):
+        compile_critical_path([{"key": "a", "depends_on": ["b"]}])
+    with pytest.raises(ValueError, match="cycle"):
+        compile_critical_path(
+            [{"key": "a", "depends_on": ["b"]}, {"key": "b", "depends_on": ["a"]}]
+        )
+
+
+def test_critical_path_order_validates_aging():
+    assert CriticalPathOrder().params() == {"cp_aging": 1.0, "cp_window": 500}
+    with pytest.raises(ValueError):
+        CriticalPathOrder(aging=-1)
+    with pytest.raises(ValueError):
+        CriticalPathOrder(window=0)
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_history_seeds_hints_and_ordering():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            old_wf, wf = (
+                conn.execute(
+                    text(
+                        "INSERT INTO workflows (name, version, steps)"
+                        " VALUES ('media', :v, CAST(:steps AS jsonb)) RETURNING id"
+                    ),
+                    {"v": version, "steps": json.dumps(STEPS)},
+                ).scalar_one()
+                for version in (1, 2)
+            )
+            # history from the previous workflow version: rendering is slow
+            recent, stale = (
+                conn.execute(
+                    text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                    {"wf": old_wf},
+                ).scalar_one()
+                for _ in range(2)
+            )
+            start = datetime.now(UTC) - timedelta(days=1)
+            runs = [
+                (recent, "ingest", 30),
+                (recent, "thumb", 2),
+                (recent, "audio", 60),
+                (recent, "render", 600),
+                # older than the history window, so ignored
+                (stale, "render", 5),
+            ]
+            for job, key, seconds in runs:
+                if job == stale:
+                    start -= timedelta(days=30)
+                conn.execute(
+                    text(
+                        "INSERT INTO job_tasks"
+                        " (job_id, task_key, service_name, status, started_at,"
+                        " finished_at) VALUES (:job, :key, 'x', 'done', :s, :f)"
+                    ),
+                    {
+                        "job": job,
+                        "key": key,
+                        "s": start,
+                        "f": start + timedelta(seconds=seconds),
+                    },
+                )
+
+            hints = refresh_critical_path(str(wf), conn=conn, default_duration=1)
+            assert hints["ingest"].remaining == pytest.approx(30 + 60 + 600 + 1)
+            assert hints["thumb"].remaining == pytest.approx(3)
+            job_id = conn.execute(
+                text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                {"wf": wf},
+            ).scalar_one()
+
+        with Session(engine) as session, session.begin():
+            instantiate_tasks(session, str(job_id))
+        with engine.begin() as conn:
+            # the side branch was created first, so strict order prefers it
+            conn.execute(
+                text(
+                    "UPDATE job_tasks SET created_at = now() - interval '1 second'"
+                    " WHERE job_id = :job AND task_key = 'thumb'"
+                ),
+                {"job": job_id},
+            )
+            depth = conn.execute(
+                text(
+                    "SELECT downstream_depth FROM job_tasks"
+                    " WHERE job_id=:job AND task_key='ingest'"
+                ),
+                {"job": job_id},
+            ).scalar_one()
+            assert depth == 3
+
+        with engine.begin() as conn:
+            strict = select_runnable("ingest", 1, conn=conn)
+            critical = select_runnable(
+                "ingest", 1, conn=conn, ordering=CriticalPathOrder()
+            )
+            head = select_runnable(
+                "ingest", 1, conn=conn, ordering=CriticalPathOrder(window=1)
+            )
+        assert strict[0]["task_key"] == "thumb"
+        assert critical[0]["task_key"] == "ingest"
+        assert critical[0]["remaining_work"] == pytest.approx(691)
+        # only the head of the global order is ranked
+        assert head[0]["task_key"] == "thumb"
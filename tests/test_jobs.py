@@ -1,7 +1,11 @@
 import json
 import os
+import threading
+from datetime import UTC, datetime
 from uuid import uuid4
 
+import pytest
+
 os.environ.setdefault("MINIO_ENDPOINT", "example")
 os.environ.setdefault("MINIO_ACCESS_KEY", "key")
 os.environ.setdefault("MINIO_SECRET_KEY", "secret")
@@ -9,21 +13,39 @@ os.environ.setdefault("POSTGRES_DSN", "sqlite:///:memory:")
 
 from sqlalchemy import create_engine, text
 
-from accscore.db.jobs import instantiate_job_tasks
+from accscore.db.jobs import instantiate_job_tasks, submit_jobs
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
 
 
 def test_instantiate_job_tasks_idempotent():
     engine = create_engine("sqlite:///:memory:")
     # setup schema and seed data
     with engine.begin() as conn:
-        conn.execute(text("CREATE TABLE workflows (id TEXT PRIMARY KEY, steps TEXT)"))
+        conn.execute(
+            text(
+                "CREATE TABLE workflows"
+                " (id TEXT PRIMARY KEY, steps TEXT, critical_path TEXT)"
+            )
+        )
         conn.execute(
             text(
                 """
             CREATE TABLE jobs (
                 id TEXT PRIMARY KEY,
                 workflow_id TEXT,
-                status TEXT
+                status TEXT,
+                progress REAL,
+                progress_weight REAL
             )
             """
             )
@@ -40,7 +62,10 @@ def test_instantiate_job_tasks_idempotent():
                 depends_on TEXT,
                 params TEXT,
                 attempt INTEGER,
-                max_attempts INTEGER
+                max_attempts INTEGER,
+                weight REAL,
+                downstream_depth INTEGER,
+                remaining_work REAL
             )
             """
             )
@@ -50,15 +75,30 @@ def test_instantiate_job_tasks_idempotent():
         job_id = uuid4()
 
         steps = [
-            {"key": "s1", "service": "svc1", "default_params": {"a": 1}},
-            {"key": "s2", "service": "svc2", "depends_on": ["s1"], "default_params": {"b": 2}},
+            # a null weight counts like a missing one
+            {
+                "key": "s1",
+                "service": "svc1",
+                "default_params": {"a": 1},
+                "weight": None,
+            },
+            {
+                "key": "s2",
+                "service": "svc2",
+                "depends_on": ["s1"],
+                "default_params": {"b": 2},
+                "weight": 3,
+            },
         ]
         conn.execute(
             text("INSERT INTO workflows (id, steps) VALUES (:id, :steps)"),
             {"id": str(wf_id), "steps": json.dumps(steps)},
         )
         conn.execute(
-            text("INSERT INTO jobs (id, workflow_id, status) VALUES (:id, :wf, 'queued')"),
+            text(
+                "INSERT INTO jobs (id, workflow_id, status)"
+                " VALUES (:id, :wf, 'queued')"
+            ),
             {"id": str(job_id), "wf": str(wf_id)},
         )
 
@@ -67,7 +107,8 @@ def test_instantiate_job_tasks_idempotent():
 
         rows = conn.execute(
             text(
-                "SELECT task_key, service_name, status, depends_on, params, attempt, max_attempts FROM job_tasks ORDER BY id"
+                "SELECT task_key, service_name, status, depends_on, params,"
+                " attempt, max_attempts FROM job_tasks ORDER BY id"
             )
         ).fetchall()
         assert len(rows) == 2
@@ -78,9 +119,29 @@ def test_instantiate_job_tasks_idempotent():
         assert json.loads(rows[0][4]) == {"a": 1}
         assert rows[0][5] == 0 and rows[0][6] == 3
 
-        status = conn.execute(text("SELECT status FROM jobs WHERE id=:id"), {"id": str(job_id)}).scalar_one()
+        status = conn.execute(
+            text("SELECT status FROM jobs WHERE id=:id"), {"id": str(job_id)}
+        ).scalar_one()
         assert status == "running"
 
+        weights = (
+            conn.execute(text("SELECT weight FROM job_tasks ORDER BY id"))
+            .scalars()
+            .all()
+        )
+        assert weights == [1, 3]
+        depths = (
+            conn.execute(text("SELECT downstream_depth FROM job_tasks ORDER BY id"))
+            .scalars()
+            .all()
+        )
+        assert depths == [1, 0]
+        progress, total = conn.execute(
+            text("SELECT progress, progress_weight FROM jobs WHERE id=:id"),
+            {"id": str(job_id)},
+        ).one()
+        assert progress == 0 and total == 4
+
         conn.commit()
 
     with engine.connect() as conn:
@@ -88,3 +149,105 @@ def test_instantiate_job_tasks_idempotent():
         instantiate_job_tasks(job_id, conn=conn)
         count = conn.execute(text("SELECT COUNT(*) FROM job_tasks")).scalar_one()
         assert count == 2
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_submit_jobs_keeps_submission_order():
+    from testcontainers.postgres import PostgresContainer
+
+    steps = [
+        {"key": "ingest", "service": "ingest"},
+        {"key": "render", "service": "renderer", "depends_on": ["ingest"], "weight": 2},
+    ]
+    when = datetime(2030, 1, 1, tzinfo=UTC)
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version, steps)"
+                    " VALUES ('wf', 1, CAST(:steps AS jsonb))"
+                ),
+                {"steps": json.dumps(steps)},
+            )
+            conn.execute(
+                text("INSERT INTO jobs (workflow_id) SELECT id FROM workflows")
+            )
+
+        with engine.begin() as conn:
+            ids = submit_jobs(
+                "wf",
+                [{"n": i} for i in range(25)],
+                conn=conn,
+                scheduled_at=when,
+                instantiate=True,
+                batch_size=10,
+            )
+        assert len(ids) == 25
+
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT id, order_seq, options, scheduled_at, status,"
+                    " progress_weight FROM jobs WHERE scheduled_at IS NOT NULL"
+                    " ORDER BY order_seq"
+                )
+            ).all()
+            tasks = conn.execute(text("SELECT count(*) FROM job_tasks")).scalar_one()
+        assert [r.id for r in rows] == ids
+        assert [r.options["n"] for r in rows] == list(range(25))
+        seqs = [r.order_seq for r in rows]
+        assert seqs == sorted(set(seqs))
+        assert all(r.scheduled_at == when and r.status == "running" for r in rows)
+        assert rows[0].progress_weight == 3
+        assert tasks == 50
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_submit_jobs_with_concurrent_default_inserts():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            conn.execute(text("INSERT INTO workflows (name, version) VALUES ('wf', 1)"))
+
+        # single inserts take order_seq from the column default while the
+        # batches draw theirs
+        done = threading.Event()
+        singles = []
+
+        def insert_singles():
+            while not done.is_set():
+                with engine.begin() as conn:
+                    singles.append(
+                        conn.execute(
+                            text(
+                                "INSERT INTO jobs (workflow_id)"
+                                " SELECT id FROM workflows RETURNING order_seq"
+                            )
+                        ).scalar_one()
+                    )
+
+        inserter = threading.Thread(target=insert_singles)
+        inserter.start()
+        try:
+            batches = []
+            for _ in range(5):
+                with engine.begin() as conn:
+                    batches.append(
+                        submit_jobs("wf", [{}] * 5000, conn=conn, batch_size=2000)
+                    )
+        finally:
+            done.set()
+            inserter.join()
+
+        with engine.connect() as conn:
+            seq_by_id = dict(conn.execute(text("SELECT id, order_seq FROM jobs")).all())
+        assert singles
+        assert len(seq_by_id) == len(singles) + 25000
+        for ids in batches:
+            seqs = [seq_by_id[job_id] for job_id in ids]
+            assert seqs == sorted(seqs)
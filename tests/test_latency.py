@@ -0,0 +1,122 @@
+import os
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db import sqlite
+from accscore.db.latency import task_latencies
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=UTC)
+
+
+def _task(conn, job_id, key, service, node, offsets, depends_on=()):
+    claimed, started, finished = (T0 + timedelta(seconds=s) for s in offsets)
+    conn.execute(
+        text(
+            "INSERT INTO job_tasks (job_id, task_key, service_name, status, depends_on,"
+            " assigned_node, created_at, claimed_at, started_at, finished_at)"
+            " VALUES (:job, :key, :service, 'done', :deps, :node, :created, :claimed,"
+            " :started, :finished)"
+        ),
+        {
+            "job": job_id,
+            "key": key,
+            "service": service,
+            "deps": list(depends_on),
+            "node": node,
+            "created": T0,
+            "claimed": claimed,
+            "started": started,
+            "finished": finished,
+        },
+    )
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_stage_distributions_per_service_and_node():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            wf_id = conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version)"
+                    " VALUES ('wf', 1) RETURNING id"
+                )
+            ).scalar_one()
+            jobs = [
+                conn.execute(
+                    text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                    {"wf": wf_id},
+                ).scalar_one()
+                for _ in range(3)
+            ]
+            _task(conn, jobs[0], "ingest", "ingest", "n1", (1, 2, 12))
+            _task(conn, jobs[0], "render", "render", "n2", (15, 15.5, 75), ["ingest"])
+            _task(conn, jobs[1], "ingest", "ingest", "n1", (3, 4, 24))
+            # finished long before the window
+            _task(conn, jobs[2], "ingest", "ingest", "n1", (1, 2, -7200))
+
+        with engine.connect() as conn:
+            window = {"since": T0, "until": T0 + timedelta(minutes=5)}
+            by_service = {
+                (s.group, s.stage): s for s in task_latencies(conn=conn, **window)
+            }
+            by_node = task_latencies(
+                conn=conn, by="node", services=["render"], **window
+            )
+            by_workflow = task_latencies(
+                conn=conn, by="workflow", percentiles=(0.5,), buckets=(30.0,), **window
+            )
+
+        run = by_service[("ingest", "run_time")]
+        assert run.samples == 2 and run.mean == 15 and run.max == 20
+        assert run.percentiles[0.5] == 15
+        # 10s and 20s fall into the [5, 15) and [15, 60) buckets
+        assert run.histogram == (0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 0)
+
+        # the render task became ready when ingest finished at +12s
+        assert by_service[("render", "dependency_wait")].max == 12
+        assert by_service[("render", "queue_wait")].max == 3
+        assert by_service[("render", "claim_to_start")].max == 0.5
+
+        assert [(s.group, s.stage) for s in by_node] == [
+            ("n2", "dependency_wait"),
+            ("n2", "queue_wait"),
+            ("n2", "claim_to_start"),
+            ("n2", "run_time"),
+        ]
+        run_time = next(s for s in by_workflow if s.stage == "run_time")
+        assert run_time.group == "wf" and run_time.samples == 3
+        assert run_time.percentiles == {0.5: 20.0}
+        assert run_time.histogram == (2, 1)
+
+
+def test_rejects_sqlite(tmp_path):
+    engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+    with engine.connect() as conn:
+        with pytest.raises(
+            sqlite.UnsupportedBackendError, match="not supported on SQLite"
+        ):
+            task_latencies(conn=conn)
+    engine.dispose()
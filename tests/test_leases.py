@@ -0,0 +1,110 @@
+import os
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db import claim_tasks, mark_task_done, mark_task_running
+from accscore.db.leases import LeaseLostError, release_tasks, renew_leases
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_expired_lease_is_reclaimed_and_zombie_fenced():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            wf_id = conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version)"
+                    " VALUES ('wf', 1) RETURNING id"
+                )
+            ).scalar_one()
+            job_id = conn.execute(
+                text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                {"wf": wf_id},
+            ).scalar_one()
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks (job_id, task_key, service_name)"
+                    " VALUES (:job, 'a', 'svc'), (:job, 'b', 'svc')"
+                ),
+                {"job": job_id},
+            )
+
+        with Session(engine) as session, session.begin():
+            first = claim_tasks(
+                session, "svc", 2, "zombie", lease_ttl=timedelta(minutes=5)
+            )
+        assert [t["lease_token"] for t in first] == [1, 1]
+        leases = {str(t["id"]): t["lease_token"] for t in first}
+
+        with Session(engine) as session, session.begin():
+            # live leases are not handed out again
+            assert claim_tasks(session, "svc", 2, "other") == []
+
+        with engine.begin() as conn:
+            assert renew_leases(leases, conn=conn, ttl=timedelta(seconds=-1)) == set(
+                leases
+            )
+
+        with Session(engine) as session, session.begin():
+            taken = claim_tasks(session, "svc", 1, "rescuer")
+        assert len(taken) == 1 and taken[0]["lease_token"] == 2
+        stolen = str(taken[0]["id"])
+
+        with engine.begin() as conn:
+            # the zombie only keeps the task nobody took over
+            assert renew_leases(leases, conn=conn) == set(leases) - {stolen}
+
+        with pytest.raises(LeaseLostError):
+            with Session(engine) as session, session.begin():
+                mark_task_done(session, stolen, lease_token=leases[stolen])
+
+        with Session(engine) as session, session.begin():
+            mark_task_running(session, stolen, lease_token=2)
+            mark_task_done(session, stolen, lease_token=2)
+        with engine.connect() as conn:
+            row = conn.execute(
+                text(
+                    "SELECT status, claimed_by, lease_expires_at"
+                    " FROM job_tasks WHERE id=:id"
+                ),
+                {"id": stolen},
+            ).one()
+        assert (row.status, row.claimed_by, row.lease_expires_at) == (
+            "done",
+            "rescuer",
+            None,
+        )
+
+        with engine.begin() as conn:
+            other = str(next(t["id"] for t in first if str(t["id"]) != stolen))
+            # the zombie's task is still 'starting' and goes back to the queue
+            assert release_tasks({other: leases[other], stolen: 2}, conn=conn) == {
+                other
+            }
+            row = conn.execute(
+                text("SELECT status, claimed_by FROM job_tasks WHERE id=:id"),
+                {"id": other},
+            ).one()
+        assert (row.status, row.claimed_by) == ("queued", None)
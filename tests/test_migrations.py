@@ -0,0 +1,144 @@
+import os
+import warnings
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db.migrations import (
+    MIGRATIONS,
+    SeqScanWarning,
+    _seq_scans,
+    apply_migrations,
+    check_indexes,
+    current_version,
+)
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def test_migration_versions_are_sequential():
+    versions = [m.version for m in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+
+
+def test_migrations_cover_all_tables():
+    ddl = " ".join(s for m in MIGRATIONS for s in m.statements)
+    for table in (
+        "workflows",
+        "jobs",
+        "job_tasks",
+        "task_events",
+        "task_artifacts",
+        "nodes",
+    ):
+        assert f"CREATE TABLE IF NOT EXISTS {table} " in ddl
+    assert "WHERE status = 'queued'" in ddl
+
+
+def test_seq_scans_walks_nested_plans():
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "job_tasks",
+                "Index Cond": "x",
+            },
+            {"Node Type": "Index Only Scan", "Relation Name": "nodes"},
+            {
+                "Node Type": "Hash Join",
+                "Plans": [{"Node Type": "Seq Scan", "Relation Name": "jobs"}],
+            },
+            {
+                "Node Type": "Sort",
+                "Plans": [
+                    {"Node Type": "Index Scan", "Relation Name": "workflows"},
+                ],
+            },
+            {
+                "Node Type": "Incremental Sort",
+                "Plans": [{"Node Type": "Index Scan", "Relation Name": "job_tasks"}],
+            },
+        ],
+    }
+    assert _seq_scans(plan) == ["jobs", "workflows"]
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_apply_migrations_and_check_indexes():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            assert apply_migrations(conn=conn) == [m.version for m in MIGRATIONS]
+        with engine.begin() as conn:
+            assert apply_migrations(conn=conn) == []
+            assert current_version(conn=conn) == MIGRATIONS[-1].version
+
+        with engine.begin() as conn, warnings.catch_warnings():
+            warnings.simplefilter("error", SeqScanWarning)
+            assert check_indexes(conn=conn, service="svc") == []
+
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX jobs_order_seq_idx"))
+            conn.execute(text("DROP INDEX jobs_queued_order_seq_idx"))
+            conn.execute(text("DROP INDEX jobs_priority_order_idx"))
+            with pytest.warns(SeqScanWarning):
+                assert "jobs" in check_indexes(conn=conn, service="svc")
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_check_indexes_on_populated_tables():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version, steps)"
+                    " VALUES ('wf', 1, '[]')"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO jobs (workflow_id, priority)"
+                    " SELECT (SELECT id FROM workflows), i % 5"
+                    " FROM generate_series(1, 20000) i"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks (job_id, task_key, service_name)"
+                    " SELECT id, 'a', 'svc' FROM jobs"
+                )
+            )
+            conn.execute(text("ANALYZE"))
+
+        # the planner picks real plans here, with and without sequential scans
+        with engine.begin() as conn, warnings.catch_warnings():
+            warnings.simplefilter("error", SeqScanWarning)
+            assert check_indexes(conn=conn, service="svc") == []
+            assert check_indexes(conn=conn, service="svc", disable_seqscan=False) == []
+
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX jobs_order_seq_idx"))
+            conn.execute(text("DROP INDEX jobs_queued_order_seq_idx"))
+            conn.execute(text("DROP INDEX jobs_priority_order_idx"))
+            with pytest.warns(SeqScanWarning, match="in full"):
+                assert check_indexes(conn=conn, service="svc", disable_seqscan=False)
@@ -0,0 +1,180 @@
+import os
+from datetime import UTC, datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db.migrations import apply_migrations
+from accscore.db.tasks import select_runnable
+from accscore.ordering import (
+    CriticalPathOrder,
+    FairShareOrder,
+    OrderingPolicy,
+    PriorityOrder,
+    StrictOrder,
+)
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def test_strict_order_is_global_order():
+    assert StrictOrder().order_by().startswith("j.order_seq ASC")
+    assert "FOR UPDATE OF jt SKIP LOCKED" in StrictOrder().select_sql("true")
+
+
+def test_policies_must_define_order_by():
+    with pytest.raises(TypeError):
+        OrderingPolicy()
+
+
+def test_priority_order_sorts_by_priority_first():
+    assert PriorityOrder().order_by().startswith("j.priority DESC, j.order_seq ASC")
+
+
+def test_fair_share_params():
+    policy = FairShareOrder(by="priority", weights={10: 3, 0: 1}, default_weight=0.5)
+    params = policy.params()
+    assert params["fs_default_weight"] == 0.5
+    assert {params["fs_class_0"], params["fs_class_1"]} == {"10", "0"}
+    assert "row_number() OVER" in policy.select_sql("true")
+
+
+def test_fair_share_rejects_bad_config():
+    with pytest.raises(ValueError):
+        FairShareOrder(by="node")
+    with pytest.raises(ValueError):
+        FairShareOrder(weights={"a": 0})
+
+
+def _seed(conn, priorities):
+    wf_id = conn.execute(
+        text("INSERT INTO workflows (name, version) VALUES ('wf', 1) RETURNING id")
+    ).scalar_one()
+    for priority in priorities:
+        job_id = conn.execute(
+            text(
+                "INSERT INTO jobs (workflow_id, priority) VALUES (:wf, :p) RETURNING id"
+            ),
+            {"wf": wf_id, "p": priority},
+        ).scalar_one()
+        conn.execute(
+            text(
+                "INSERT INTO job_tasks (job_id, task_key, service_name, priority)"
+                " VALUES (:job, :key, 'svc', 0)"
+            ),
+            {"job": job_id, "key": f"p{priority}-{uuid4().hex[:6]}"},
+        )
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_policies_against_postgres():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            # a large low-priority batch submitted before two urgent jobs
+            _seed(conn, [0] * 6 + [5, 5])
+
+        def keys(policy, limit=4):
+            with engine.begin() as conn:
+                rows = select_runnable("svc", limit, conn=conn, ordering=policy)
+                return [r["task_key"].split("-")[0] for r in rows]
+
+        assert keys(None) == ["p0"] * 4
+        assert keys(StrictOrder()) == ["p0"] * 4
+        assert keys(PriorityOrder()) == ["p5", "p5", "p0", "p0"]
+        fair = keys(FairShareOrder(by="priority", weights={5: 1, 0: 1}))
+        assert sorted(fair) == ["p0", "p0", "p5", "p5"]
+        assert fair[:2] == ["p0", "p5"] or fair[:2] == ["p5", "p0"]
+
+        # with one urgent task already running, the weights favour class 0
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "UPDATE job_tasks SET status='running' WHERE id = ("
+                    " SELECT jt.id FROM job_tasks jt JOIN jobs j ON j.id = jt.job_id"
+                    " WHERE j.priority = 5 LIMIT 1)"
+                )
+            )
+        assert keys(FairShareOrder(weights={5: 1, 0: 1}), limit=2) == ["p0", "p0"]
+        assert keys(FairShareOrder(weights={5: 4, 0: 1}), limit=1) == ["p5"]
+
+
+def _rows_read(plan):
+    return max(
+        [plan.get("Actual Rows", 0)] + [_rows_read(p) for p in plan.get("Plans", [])]
+    )
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_claims_read_bounded_heads_of_populated_tables():
+    from testcontainers.postgres import PostgresContainer
+
+    from accscore.db.tasks import _runnable_select
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version)"
+                    " SELECT 'wf' || i, 1 FROM generate_series(1, 3) i"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO jobs (workflow_id, priority)"
+                    " SELECT w.id, i % 5 FROM generate_series(1, 20000) i"
+                    " JOIN workflows w ON w.name = 'wf' || (i % 3 + 1)"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks (job_id, task_key, service_name)"
+                    " SELECT id, 'a', 'svc' FROM jobs"
+                )
+            )
+            conn.execute(text("ANALYZE"))
+
+        for policy in (
+            PriorityOrder(),
+            CriticalPathOrder(window=50),
+            FairShareOrder(weights={4: 2}),
+            FairShareOrder(by="workflow"),
+        ):
+            sql, params = _runnable_select(policy, None)
+            with engine.begin() as conn:
+                (plan,) = conn.execute(
+                    text("EXPLAIN (ANALYZE, FORMAT JSON) " + sql),
+                    {**params, "service": "svc", "now": datetime.now(UTC), "limit": 10},
+                ).scalar_one()
+            # a few index-ordered heads instead of all 20000 runnable tasks
+            assert _rows_read(plan["Plan"]) <= 60, policy
+
+        with engine.begin() as conn:
+            rows = select_runnable(
+                "svc", 6, conn=conn, ordering=FairShareOrder(weights={4: 2})
+            )
+            priorities = conn.execute(
+                text("SELECT priority FROM jobs WHERE id = ANY(:ids)"),
+                {"ids": [r["job_id"] for r in rows]},
+            ).scalars()
+            # priority 4 gets a double share; every class still gets a slot
+            assert sorted(priorities) == [0, 1, 2, 3, 4, 4]
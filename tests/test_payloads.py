@@ -0,0 +1,141 @@
+import json
+import os
+from datetime import UTC, datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore import codec, payloads, storage
+from accscore.db import mark_task_done, sqlite
+from accscore.db.events import log_event
+from accscore.db.leases import LeaseLostError
+from accscore.db.migrations import apply_migrations
+from accscore.schema import TaskEvent
+
+
+class FakeStore:
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+        self.buckets = []
+
+    def ensure_bucket(self, bucket):
+        self.buckets.append(bucket)
+
+    def put_object(self, bucket, name, data, content_type=None):
+        self.objects[(bucket, name)] = data
+
+    def get_object(self, bucket, name, checksum=None):
+        self.gets += 1
+        return self.objects[(bucket, name)]
+
+
+def _patch(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(storage, "put_object", store.put_object)
+    monkeypatch.setattr(storage, "get_object", store.get_object)
+    monkeypatch.setattr(storage, "ensure_bucket", store.ensure_bucket)
+    monkeypatch.setattr(payloads, "_ready_buckets", set())
+    return store
+
+
+def test_small_payloads_stay_inline(monkeypatch):
+    store = _patch(monkeypatch)
+    assert payloads.offload_payload({"a": 1}, "job", threshold=100) == {"a": 1}
+    assert payloads.offload_payload({"a": "x" * 200}, "job", threshold=0) == {
+        "a": "x" * 200
+    }
+    assert payloads.offload_payload(None, "job") is None
+    assert store.objects == {}
+    # the document encoded for measuring is reused by the database binds
+    inline = payloads.offload_payload({"a": 1}, "job", threshold=100)
+    assert codec.dumps_bytes(inline) is inline.document
+
+
+def test_large_payload_round_trip(monkeypatch):
+    store = _patch(monkeypatch)
+    big = {"log": "frame=1\n" * 100}
+    pointer = payloads.offload_payload(big, "job1", threshold=100, bucket="b")
+    assert payloads.is_offloaded(pointer)
+    ref = pointer[payloads.OFFLOAD_KEY]
+    assert ref["bucket"] == "b" and ref["key"].startswith("payloads/job1/")
+    assert ref["checksum"].startswith("sha256:")
+    assert payloads.load_payload(pointer) == big
+    # offloading the same content again reuses the key
+    assert payloads.offload_payload(big, "job1", threshold=100, bucket="b") == pointer
+    assert len(store.objects) == 1
+    assert store.buckets == ["b"]
+
+
+def test_lost_lease_uploads_nothing(monkeypatch, tmp_path):
+    store = _patch(monkeypatch)
+    monkeypatch.setattr(storage.settings, "payload_offload_bytes", 64)
+    engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text("INSERT INTO workflows (id, name, version) VALUES ('w', 'wf', 1)")
+        )
+        conn.execute(text("INSERT INTO jobs (id, workflow_id) VALUES ('j', 'w')"))
+        conn.execute(
+            text(
+                "INSERT INTO job_tasks"
+                " (id, job_id, task_key, service_name, lease_token)"
+                " VALUES ('t', 'j', 'a', 'svc', 2)"
+            )
+        )
+
+    results = {"stdout": "x" * 500}
+    with Session(engine) as session, session.begin():
+        with pytest.raises(LeaseLostError):
+            mark_task_done(session, "t", results, lease_token=1)
+    assert store.objects == {}
+    with Session(engine) as session, session.begin():
+        mark_task_done(session, "t", results, lease_token=2)
+    assert len(store.objects) == 1
+    engine.dispose()
+
+
+def test_log_event_offloads_and_model_loads_lazily(monkeypatch):
+    store = _patch(monkeypatch)
+    monkeypatch.setattr(storage.settings, "payload_offload_bytes", 64)
+    engine = create_engine("sqlite:///:memory:", future=True)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE task_events"
+                " (id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, job_task_id TEXT,"
+                " ts TEXT, source TEXT, level TEXT, type TEXT, message TEXT, data TEXT)"
+            )
+        )
+        job_id = str(uuid4())
+        data = {"stderr": "x" * 500}
+        event_id = log_event(
+            "info", "log", "ffmpeg", data=data, job_id=job_id, conn=conn
+        )
+        stored = json.loads(
+            conn.execute(
+                text("SELECT data FROM task_events WHERE id=:id"), {"id": event_id}
+            ).scalar_one()
+        )
+
+    event = TaskEvent(
+        job_id=job_id,
+        ts=datetime.now(UTC),
+        source="service:x",
+        level="info",
+        type="log",
+        message="ffmpeg",
+        data=stored,
+    )
+    assert event.data_offloaded
+    assert event.load_data() == data
+    assert event.load_data() == data
+    assert store.gets == 1
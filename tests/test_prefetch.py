@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from accscore import storage
+from accscore.db.artifacts import record_artifacts
+from accscore.prefetch import Prefetcher
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class DummyClient:
+    def __init__(self):
+        self.gets = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def get_object(self, bucket, name):
+        self.gate.wait()
+        self.gets.append(name)
+        if name.endswith("broken"):
+            raise OSError("boom")
+        return Response(name.encode())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    dummy = DummyClient()
+    monkeypatch.setattr(storage, "client", dummy)
+    monkeypatch.setattr(storage, "cache", None)
+    return dummy
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite:///:memory:", future=True)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE jobs (id TEXT PRIMARY KEY, order_seq INTEGER)"))
+        conn.execute(
+            text(
+                """
+                CREATE TABLE job_tasks (
+                    id TEXT PRIMARY KEY, job_id TEXT, task_key TEXT, service_name TEXT,
+                    status TEXT, depends_on TEXT, created_at TEXT
+                )
+                """
+            )
+        )
+        conn.execute(
+            text(
+                """
+                CREATE TABLE task_artifacts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, job_task_id TEXT,
+                    kind TEXT, bucket TEXT, key TEXT, size_bytes INTEGER,
+                    content_type TEXT, checksum TEXT, created_at TEXT
+                )
+                """
+            )
+        )
+        for job, seq in (("j1", 1), ("j2", 2)):
+            conn.execute(text("INSERT INTO jobs VALUES (:j, :s)"), {"j": job, "s": seq})
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks"
+                    " VALUES (:id, :j, 'ingest', 'ingest', 'done', '[]', '1')"
+                ),
+                {"id": f"{job}-ingest", "j": job},
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO job_tasks"
+                    " VALUES (:id, :j, 'render', 'renderer', 'queued', :deps, '2')"
+                ),
+                {"id": f"{job}-render", "j": job, "deps": json.dumps(["ingest"])},
+            )
+            record_artifacts(
+                [
+                    {
+                        "job_id": job,
+                        "job_task_id": f"{job}-ingest",
+                        "kind": "output",
+                        "bucket": "b",
+                        "key": f"output/{job}/ingest/{name}",
+                    }
+                    for name in ("a.wav", "b.wav")
+                ]
+                + [
+                    {
+                        "job_id": job,
+                        "job_task_id": f"{job}-ingest",
+                        "kind": "log",
+                        "bucket": "b",
+                        "key": f"log/{job}/ingest/x.jsonl",
+                    }
+                ],
+                conn=conn,
+            )
+        yield conn
+
+
+def _task(conn, task_id):
+    return (
+        conn.execute(text("SELECT * FROM job_tasks WHERE id=:id"), {"id": task_id})
+        .mappings()
+        .one()
+    )
+
+
+def test_prefetch_and_wait(client, conn, tmp_path):
+    with Prefetcher(tmp_path, max_workers=2) as prefetcher:
+        task = _task(conn, "j1-render")
+        prefetcher.prefetch([task], conn=conn)
+        inputs = prefetcher.wait_for_inputs(task, timeout=5)
+        assert list(inputs) == ["ingest"]
+        assert [p.name for p in inputs["ingest"]] == ["a.wav", "b.wav"]
+        assert inputs["ingest"][0].read_bytes() == b"output/j1/ingest/a.wav"
+        # logs are not inputs
+        assert all("log/" not in name for name in client.gets)
+
+        prefetcher.release(task)
+        assert not inputs["ingest"][0].exists()
+
+
+def test_speculate_shares_downloads(client, conn, tmp_path):
+    with Prefetcher(tmp_path) as prefetcher:
+        assert prefetcher.speculate("renderer", conn=conn, limit=1) == 1
+        prefetcher.wait_for_inputs("j1-render", timeout=5)
+        prefetcher.prefetch([_task(conn, "j1-render")], conn=conn)
+        prefetcher.wait_for_inputs("j1-render", timeout=5)
+        assert len(client.gets) == 2
+
+
+def test_wait_timeout_and_errors(client, conn, tmp_path):
+    with Prefetcher(tmp_path) as prefetcher:
+        with pytest.raises(KeyError):
+            prefetcher.wait_for_inputs("unknown")
+
+        client.gate.clear()
+        prefetcher.prefetch([_task(conn, "j2-render")], conn=conn)
+        with pytest.raises(TimeoutError):
+            prefetcher.wait_for_inputs("j2-render", timeout=0.05)
+        client.gate.set()
+        prefetcher.wait_for_inputs("j2-render", timeout=5)
+
+        conn.execute(
+            text(
+                "INSERT INTO task_artifacts (job_id, job_task_id, kind, bucket, key)"
+                " VALUES ('j1', 'j1-ingest', 'output', 'b', 'broken')"
+            )
+        )
+        prefetcher.prefetch([_task(conn, "j1-render")], conn=conn)
+        with pytest.raises(OSError):
+            prefetcher.wait_for_inputs("j1-render", timeout=5)
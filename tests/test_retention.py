@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore import storage
+from accscore.db import sqlite
+from accscore.db.artifacts import record_artifacts, upload_artifact
+from accscore.db.jobs import submit_jobs
+from accscore.db.migrations import apply_migrations
+from accscore.retention import collect_artifacts
+
+NOW = datetime(2026, 6, 1, tzinfo=UTC)
+
+
+class DummyClient:
+    def __init__(self):
+        self.objects = {}
+        self.failing = set()
+        self.requests = 0
+
+    def list_objects(self, bucket, prefix=None, recursive=False):
+        return [
+            SimpleNamespace(object_name=key, size=len(data))
+            for (b, key), data in sorted(self.objects.items())
+            if b == bucket and key.startswith(prefix)
+        ]
+
+    def put_object(self, bucket, name, data, length, content_type=None):
+        self.objects[(bucket, name)] = data.read(length)
+
+    def stat_object(self, bucket, name):
+        if (bucket, name) not in self.objects:
+            raise KeyError(name)
+
+    def remove_objects(self, bucket, delete_object_list):
+        self.requests += 1
+        for obj in delete_object_list:
+            if (bucket, obj.name) in self.failing:
+                yield SimpleNamespace(name=obj.name)
+            else:
+                self.objects.pop((bucket, obj.name), None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    dummy = DummyClient()
+    monkeypatch.setattr(storage, "client", dummy)
+    return dummy
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+@pytest.fixture(
+    params=[
+        "sqlite",
+        pytest.param(
+            "postgres",
+            marks=pytest.mark.skipif(
+                not _docker_available(), reason="Docker not available"
+            ),
+        ),
+    ]
+)
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+        yield _seed(engine)
+        engine.dispose()
+        return
+
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        yield _seed(engine)
+        engine.dispose()
+
+
+def _seed(engine):
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text(
+                "INSERT INTO workflows (name, version, steps)"
+                """ VALUES ('wf', 1, '[{"key": "t", "service": "svc"}]')"""
+            )
+        )
+    return engine
+
+
+def _job(conn, finished_days_ago):
+    (job_id,) = submit_jobs("wf", [{}], conn=conn, instantiate=True)
+    finished_at = NOW - timedelta(days=finished_days_ago)
+    on_sqlite = sqlite.is_sqlite(conn)
+    conn.execute(
+        text("UPDATE jobs SET status = 'done', finished_at = :ts WHERE id = :id"),
+        {
+            "ts": sqlite.timestamp(finished_at) if on_sqlite else finished_at,
+            "id": str(job_id),
+        },
+    )
+    return str(job_id)
+
+
+def _store(client, conn, job_id, key, data, recorded=True):
+    client.objects[("media", key)] = data
+    if recorded:
+        record_artifacts(
+            [
+                {
+                    "job_id": job_id,
+                    "kind": "output",
+                    "bucket": "media",
+                    "key": key,
+                    "size_bytes": len(data),
+                }
+            ],
+            conn=conn,
+        )
+
+
+def test_collects_expired_jobs_and_keeps_shared_objects(client, engine):
+    with engine.begin() as conn:
+        old, stuck, recent = _job(conn, 100), _job(conn, 95), _job(conn, 1)
+        _store(client, conn, old, f"output/{old}/t/shared.wav", b"0123456789")
+        _store(client, conn, old, f"output/{old}/t/own.wav", b"1234567")
+        _store(client, conn, old, f"log/{old}/t/run.log", b"12345", recorded=False)
+        _store(client, conn, stuck, f"output/{stuck}/t/c.wav", b"123")
+        # a deduplicated upload of the recent job points into the old job's prefix
+        _store(client, conn, recent, f"output/{old}/t/shared.wav", b"0123456789")
+        _store(client, conn, recent, f"output/{recent}/t/new.wav", b"1")
+    client.objects[("accs-payloads", f"payloads/{old}/x.json")] = b"{}"
+    client.failing.add(("media", f"output/{stuck}/t/c.wav"))
+
+    dry = collect_artifacts(
+        engine=engine, retention=timedelta(days=30), now=NOW, batch_size=1, dry_run=True
+    )
+    assert (dry.objects, dry.bytes, dry.rows) == (3, 15, 0)
+    assert len(client.objects) == 6 and client.requests == 0
+
+    report = collect_artifacts(
+        engine=engine, retention=timedelta(days=30), now=NOW, batch_size=1
+    )
+    assert report.jobs == 1
+    assert report.objects == 2 and report.bytes == 12
+    assert report.rows == 2 and report.kept == 1 and report.failed == 1
+    assert {key for _, key in client.objects} == {
+        f"output/{old}/t/shared.wav",
+        f"output/{recent}/t/new.wav",
+        f"output/{stuck}/t/c.wav",
+        f"payloads/{old}/x.json",
+    }
+
+    # the failed job is retried on the next run; collected jobs are skipped
+    client.failing.clear()
+    again = collect_artifacts(engine=engine, retention=timedelta(days=30), now=NOW)
+    assert (again.jobs, again.objects, again.rows) == (1, 1, 1)
+
+    with engine.connect() as conn:
+        purged_sql = text(
+            "SELECT id FROM jobs WHERE artifacts_purged_at IS NOT NULL"
+            " ORDER BY order_seq"
+        )
+        purged = conn.execute(purged_sql).scalars().all()
+        remaining_sql = text("SELECT job_id FROM task_artifacts")
+        remaining = conn.execute(remaining_sql).scalars().all()
+    assert [str(job_id) for job_id in purged] == [old, stuck]
+    assert [str(job_id) for job_id in remaining] == [recent, recent]
+
+
+def test_payloads_are_opt_in(client, engine):
+    with engine.begin() as conn:
+        old = _job(conn, 100)
+        task_id = conn.execute(
+            text("SELECT id FROM job_tasks WHERE job_id = :id"), {"id": old}
+        ).scalar_one()
+    client.objects[("accs-payloads", f"payloads/{old}/event.json")] = b"{}"
+    client.objects[("accs-payloads", f"payloads/{task_id}/result.json")] = b"[]"
+
+    report = collect_artifacts(
+        engine=engine,
+        retention=timedelta(days=30),
+        now=NOW,
+        buckets=["media"],
+        payloads=True,
+    )
+    assert (report.jobs, report.objects, report.bytes) == (1, 2, 4)
+    assert client.objects == {}
+
+
+def test_deduplicated_upload_during_collection_keeps_the_object(client, engine):
+    with engine.begin() as conn:
+        old, recent = _job(conn, 100), _job(conn, 1)
+        upload_artifact(
+            job_id=old,
+            kind="output",
+            bucket="media",
+            key=f"output/{old}/t/a.wav",
+            source=b"0123456789",
+            conn=conn,
+        )
+
+    with engine.connect() as conn:
+        with conn.begin():
+            stored = upload_artifact(
+                job_id=recent,
+                kind="output",
+                bucket="media",
+                key=f"output/{recent}/t/a.wav",
+                source=b"0123456789",
+                conn=conn,
+            )
+            assert stored.deduplicated and stored.key == f"output/{old}/t/a.wav"
+            # collection waits for the uploading transaction
+            reports = []
+
+            def collect():
+                reports.append(
+                    collect_artifacts(
+                        engine=engine, retention=timedelta(days=30), now=NOW
+                    )
+                )
+
+            collector = threading.Thread(target=collect)
+            collector.start()
+            time.sleep(0.3)
+            assert collector.is_alive()
+        collector.join(10)
+
+    assert reports[0].jobs == 1 and reports[0].kept == 1 and reports[0].objects == 0
+    assert ("media", f"output/{old}/t/a.wav") in client.objects
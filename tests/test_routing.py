@@ -0,0 +1,123 @@
+import os
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore import db
+from accscore.db import routing
+from accscore.db.migrations import apply_migrations
+from accscore.db.routing import ReplicaRouter, replica_lag
+from accscore.db.status import job_status_counts
+from accscore.settings import Settings
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+@pytest.fixture
+def engines(tmp_path):
+    engines = [create_engine(f"sqlite:///{tmp_path / name}.db") for name in "pab"]
+    yield engines
+    for engine in engines:
+        engine.dispose()
+
+
+def _fake_lags(monkeypatch, lags):
+    calls = []
+
+    def lag(conn):
+        name = conn.engine.url.database.rsplit("/", 1)[-1][0]
+        calls.append(name)
+        value = lags[name]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    monkeypatch.setattr(routing, "replica_lag", lag)
+    return calls
+
+
+def test_round_robin_skips_lagging_replicas(monkeypatch, engines):
+    primary, a, b = engines
+    lags = {"a": 0.5, "b": 1.0}
+    calls = _fake_lags(monkeypatch, lags)
+    router = ReplicaRouter(
+        primary, [a, b], max_lag=timedelta(seconds=2), check_interval=60
+    )
+
+    assert [router.read_engine() for _ in range(4)] == [a, b, a, b]
+    # lags are measured once per check interval
+    assert calls == ["a", "b"]
+
+    router.check_interval = 0
+    lags["a"] = 30.0
+    assert {router.read_engine() for _ in range(4)} == {b}
+    lags["b"] = None
+    assert router.read_engine() is primary
+    lags["b"] = OSError("connection refused")
+    assert router.read_engine() is primary
+    lags["a"] = 0.0
+    assert router.read_engine() is a
+
+
+def test_without_replicas_reads_go_to_primary(engines):
+    primary = engines[0]
+    assert ReplicaRouter(primary).read_engine() is primary
+
+
+def test_replica_urls_setting(monkeypatch):
+    monkeypatch.setenv("ACC_DB_REPLICA_URLS", "postgresql://r1/db, postgresql://r2/db,")
+    assert Settings().replica_dsns == ["postgresql://r1/db", "postgresql://r2/db"]
+
+
+def test_readonly_sessions_and_helpers_use_the_router(monkeypatch, engines):
+    primary, replica, _ = engines
+    for engine in (primary, replica):
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE jobs (status TEXT)"))
+    with replica.begin() as conn:
+        conn.execute(text("INSERT INTO jobs VALUES ('done'), ('done'), ('done')"))
+    _fake_lags(monkeypatch, {"a": 0.0})
+    monkeypatch.setattr(db, "router", ReplicaRouter(primary, [replica]))
+
+    with db.session_scope(readonly=True) as session:
+        assert session.get_bind() is replica
+    assert job_status_counts() == {"done": 3}
+    with primary.connect() as conn:
+        assert job_status_counts(conn=conn) == {}
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_primary_reports_no_lag_and_read_connections_are_read_only(monkeypatch):
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            assert replica_lag(conn) == 0
+        monkeypatch.setattr(db, "router", ReplicaRouter(engine))
+
+        assert job_status_counts() == {}
+        with pytest.raises(DBAPIError):
+            with db.read_connection() as conn:
+                conn.execute(
+                    text("INSERT INTO workflows (name, version) VALUES ('wf', 1)")
+                )
+        with engine.connect() as conn:
+            count = conn.execute(text("SELECT count(*) FROM workflows")).scalar_one()
+            assert count == 0
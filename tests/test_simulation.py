@@ -0,0 +1,195 @@
+import os
+
+import pytest
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.ordering import FairShareOrder, PriorityOrder, StrictOrder
+from accscore.schema import Node, WorkflowDef, WorkflowStep
+from accscore.simulation import (
+    Arrival,
+    _Fleet,
+    _Job,
+    _Task,
+    exponential,
+    fixed,
+    simulate,
+)
+
+
+def _workflow(name, *steps):
+    return WorkflowDef(
+        name=name,
+        version=1,
+        steps=[
+            WorkflowStep(
+                key=key, service=service, depends_on=depends, default_params=params
+            )
+            for key, service, depends, params in steps
+        ],
+    )
+
+
+def test_single_server_queue_matches_theory():
+    # M/M/1 with utilisation 0.5: mean time in system 1 / (mu - lambda) = 2s
+    wf = _workflow("wf", ("t", "svc", [], {}))
+    result = simulate(
+        [wf],
+        [Node(name="n1", max_concurrency={"svc": 1})],
+        [Arrival("wf", per_hour=1800)],
+        {"svc": exponential(1.0)},
+        horizon=20000,
+        warmup=1000,
+        seed=1,
+    )
+    assert result.mean_latency == pytest.approx(2.0, rel=0.1)
+    assert result.services["svc"].utilization == pytest.approx(0.5, rel=0.05)
+    assert result.throughput == pytest.approx(1800, rel=0.05)
+    assert result.nodes == {"n1": result.services["svc"].utilization}
+
+
+def test_dependencies_and_capacity():
+    wf = _workflow(
+        "wf",
+        ("ingest", "cpu", [], {}),
+        ("a", "cpu", ["ingest"], {}),
+        ("b", "cpu", ["ingest"], {}),
+        ("join", "cpu", ["a", "b"], {}),
+    )
+
+    def run(slots):
+        return simulate(
+            [wf],
+            [Node(name="n", max_concurrency={"cpu": slots})],
+            [Arrival("wf", per_hour=60)],
+            {"cpu": fixed(10)},
+            horizon=3600,
+        )
+
+    one, two = run(1), run(2)
+    # the two branches run in parallel once a second slot exists
+    assert one.latency[0.5] >= 40
+    assert two.latency[0.5] == pytest.approx(30)
+    assert one.jobs_completed == two.jobs_completed
+    assert run(1) == one
+
+
+def test_overload_builds_a_backlog_that_capacity_removes():
+    wf = _workflow("wf", ("t", "svc", [], {}))
+    arrivals = [Arrival("wf", per_hour=720)]
+    durations = {"svc": fixed(10)}
+    small = simulate(
+        [wf], [Node(name="a", max_concurrency={"svc": 1})], arrivals, durations
+    )
+    large = simulate(
+        [wf],
+        [
+            Node(name="a", max_concurrency={"svc": 1}),
+            Node(name="b", max_concurrency={"svc": 2}),
+        ],
+        arrivals,
+        durations,
+    )
+    assert small.backlog > 100
+    assert small.services["svc"].utilization == pytest.approx(1.0, rel=0.01)
+    assert small.throughput == pytest.approx(360, rel=0.02)
+    assert large.backlog < 5 and large.throughput == pytest.approx(720, rel=0.05)
+    assert small.services["svc"].queue_mean > large.services["svc"].queue_mean
+
+
+def test_orderings_change_who_waits():
+    short = _workflow("short", ("t", "svc", [], {}))
+    long = _workflow("long", ("t", "svc", [], {}), ("u", "svc", ["t"], {}))
+
+    def p90(ordering):
+        result = simulate(
+            [short, long],
+            [Node(name="n", max_concurrency={"svc": 1})],
+            [Arrival("short", per_hour=150), Arrival("long", per_hour=100, priority=5)],
+            {"svc": fixed(10)},
+            ordering=ordering,
+            horizon=36000,
+            seed=3,
+        )
+        return {name: latency[0.9] for name, latency in result.workflow_latency.items()}
+
+    strict = p90(StrictOrder())
+    prioritised = p90(PriorityOrder())
+    assert prioritised["long"] < strict["long"] < prioritised["short"]
+    favour_low = p90(FairShareOrder(weights={0: 3, 5: 1}))
+    favour_high = p90(FairShareOrder(weights={0: 1, 5: 3}))
+    assert favour_low["short"] < strict["short"] < favour_high["short"]
+    assert favour_high["long"] < strict["long"] < favour_low["long"]
+
+
+def test_affinity_labels_and_home_node():
+    wf = _workflow(
+        "wf",
+        ("ingest", "cpu", [], {}),
+        ("render", "gpu", ["ingest"], {"required_labels": {"gpu": True}}),
+        ("pack", "cpu", ["render"], {}),
+    )
+    nodes = [
+        Node(name="a", labels={"gpu": True}, max_concurrency={"cpu": 1, "gpu": 1}),
+        Node(name="b", max_concurrency={"gpu": 1}),
+        Node(name="c", max_concurrency={"cpu": 2}),
+    ]
+
+    def run(**kwargs):
+        return simulate(
+            [wf],
+            nodes,
+            [Arrival("wf", per_hour=120)],
+            {"cpu": exponential(10), "gpu": exponential(20)},
+            horizon=7200,
+            seed=2,
+            **kwargs,
+        )
+
+    plain = run()
+    sticky = run(affinity=True, fallback_after=60)
+    eager = run(affinity=True, fallback_after=0)
+    assert plain.nodes["b"] > 0
+    # only a has the gpu label
+    assert sticky.nodes["b"] == eager.nodes["b"] == 0
+    # packing waits for the node that rendered
+    waits = sticky.services["cpu"].queue_wait, eager.services["cpu"].queue_wait
+    assert waits[0][0.99] > waits[1][0.99]
+
+
+def test_invalid_configurations():
+    wf = _workflow("wf", ("t", "svc", [], {}))
+    nodes = [Node(name="n", max_concurrency={"svc": 1})]
+    with pytest.raises(ValueError, match="unknown workflows"):
+        simulate([wf], nodes, [Arrival("other", per_hour=1)], {"svc": fixed(1)})
+    with pytest.raises(ValueError, match="no duration"):
+        simulate([wf], nodes, [Arrival("wf", per_hour=1)], {})
+    with pytest.raises(ValueError, match="no node has slots"):
+        simulate([wf], [Node(name="n")], [Arrival("wf", per_hour=1)], {"svc": fixed(1)})
+
+
+def test_priority_key_follows_the_claim_order():
+    # j.priority DESC, j.order_seq, jt.priority DESC, jt.created_at, jt.id
+    order_by = PriorityOrder().order_by()
+    assert order_by.startswith("j.priority DESC, j.order_seq ASC, jt.priority DESC")
+    nodes = [Node(name="n", max_concurrency={"svc": 1})]
+    fleet = _Fleet(nodes, PriorityOrder(), None, 0)
+    urgent, first, second = (
+        _Job(seq, "wf", priority, arrived=0, pending=1, share_class=0)
+        for seq, priority in ((3, 5), (1, 0), (2, 0))
+    )
+
+    def task(job, index, priority=0):
+        return _Task(job, index, "svc", 0, 0.0, 0, {}, None, priority=priority)
+
+    tasks = [
+        task(second, 0),
+        task(first, 1),
+        task(first, 2, priority=1),
+        task(urgent, 0),
+    ]
+    ordered = sorted(tasks, key=fleet._sort_key)
+    assert [(t.job.seq, t.index) for t in ordered] == [(3, 0), (1, 2), (1, 1), (2, 0)]
@@ -0,0 +1,226 @@
+import os
+import threading
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore import codec
+from accscore.affinity import NodeAffinity
+from accscore.agents.service import ServiceAgent, TaskContext
+from accscore.db import (
+    claim_tasks,
+    mark_task_done,
+    mark_task_error,
+    mark_task_running,
+    maybe_finish_job,
+    sqlite,
+    update_task_progress,
+)
+from accscore.db.events import log_event
+from accscore.db.jobs import submit_jobs
+from accscore.db.leases import LeaseLostError, release_tasks, renew_leases
+from accscore.db.migrations import MIGRATIONS, apply_migrations
+from accscore.db.tasks import claim_tasks as tasks_claim
+from accscore.db.tasks import select_runnable
+from accscore.ordering import FairShareOrder, PriorityOrder
+
+_STEPS = (
+    '[{"key": "a", "service": "svc"},'
+    ' {"key": "b", "service": "svc", "depends_on": ["a"], "weight": 3}]'
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+    with engine.begin() as conn:
+        assert apply_migrations(conn=conn) == [sqlite.SCHEMA_VERSION]
+        assert apply_migrations(conn=conn) == []
+        conn.execute(
+            text(
+                "INSERT INTO workflows (name, version, steps) VALUES ('wf', 1, :steps)"
+            ),
+            {"steps": _STEPS},
+        )
+    yield engine
+    engine.dispose()
+
+
+def _submit(engine, count, **kwargs):
+    with engine.begin() as conn:
+        return submit_jobs("wf", [{"n": i} for i in range(count)], conn=conn, **kwargs)
+
+
+def test_schema_version_matches_migrations():
+    assert sqlite.SCHEMA_VERSION == MIGRATIONS[-1].version
+
+
+def test_job_lifecycle(engine):
+    first, second = _submit(engine, 2, instantiate=True)
+
+    with Session(engine) as session, session.begin():
+        claimed = claim_tasks(session, "svc", 5, "agent")
+    # dependants wait for their dependencies; jobs are claimed in submission order
+    assert [(t["job_id"], t["task_key"]) for t in claimed] == [
+        (str(first), "a"),
+        (str(second), "a"),
+    ]
+    task = claimed[0]
+    assert task["lease_token"] == 1 and task["status"] == "starting"
+    assert task["params"] == {}
+
+    with Session(engine) as session, session.begin():
+        mark_task_running(session, task["id"], lease_token=1)
+        update_task_progress(session, task["id"], 50, lease_token=1)
+        log_event(
+            "info", "log", "halfway", job_task_id=task["id"], conn=session.connection()
+        )
+        mark_task_done(session, task["id"], {"ok": True}, lease_token=1)
+
+    with Session(engine) as session, session.begin():
+        (task_b,) = claim_tasks(session, "svc", 5, "agent")
+        assert (task_b["job_id"], task_b["task_key"]) == (str(first), "b")
+        mark_task_done(session, task_b["id"], None, lease_token=task_b["lease_token"])
+        maybe_finish_job(session, str(first))
+
+    with engine.connect() as conn:
+        job = conn.execute(
+            text("SELECT status, progress, finished_at FROM jobs WHERE id = :id"),
+            {"id": str(first)},
+        ).one()
+        results = conn.execute(
+            text("SELECT results FROM job_tasks WHERE id = :id"), {"id": task["id"]}
+        ).scalar_one()
+        events = conn.execute(text("SELECT message FROM task_events")).scalars().all()
+    assert job.status == "done" and job.progress == 100 and job.finished_at is not None
+    assert codec.loads(results) == {"ok": True}
+    assert events == ["halfway"]
+
+
+def test_capacity_and_priority(engine):
+    low = _submit(engine, 1, instantiate=True)
+    high = _submit(engine, 1, instantiate=True, priority=5)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO nodes (name, max_concurrency)"
+                """ VALUES ('n1', '{"svc": 1}')"""
+            )
+        )
+
+    with engine.begin() as conn:
+        selected = select_runnable("svc", 5, conn=conn, ordering=PriorityOrder())
+        assert [t["job_id"] for t in selected] == [str(high[0])]
+        assert tasks_claim([t["id"] for t in selected], "n1", conn=conn) == 1
+        # the node's limit for the service is used up
+        assert select_runnable("svc", 5, conn=conn) == []
+
+    with Session(engine) as session, session.begin():
+        mark_task_error(session, selected[0]["id"], "E", "failed", lease_token=1)
+    with engine.begin() as conn:
+        assert [t["job_id"] for t in select_runnable("svc", 5, conn=conn)] == [
+            str(low[0])
+        ]
+
+    with Session(engine) as session, session.begin():
+        with pytest.raises(
+            sqlite.UnsupportedBackendError, match="not supported on SQLite"
+        ):
+            claim_tasks(session, "svc", 1, "agent", ordering=FairShareOrder())
+        with pytest.raises(sqlite.UnsupportedBackendError) as unsupported:
+            claim_tasks(session, "svc", 1, "agent", affinity=NodeAffinity(node="n1"))
+        assert unsupported.value.feature == "node affinity"
+
+
+def test_expired_lease_is_reclaimed_and_zombie_fenced(engine):
+    _submit(engine, 1, instantiate=True)
+
+    with Session(engine) as session, session.begin():
+        (task,) = claim_tasks(
+            session, "svc", 1, "zombie", lease_ttl=timedelta(minutes=5)
+        )
+    leases = {task["id"]: task["lease_token"]}
+    with engine.begin() as conn:
+        assert renew_leases(leases, conn=conn, ttl=timedelta(seconds=-1)) == set(leases)
+
+    with Session(engine) as session, session.begin():
+        (taken,) = claim_tasks(session, "svc", 1, "other")
+    assert taken["id"] == task["id"] and taken["lease_token"] == 2
+
+    with engine.begin() as conn:
+        assert renew_leases(leases, conn=conn) == set()
+        assert release_tasks(leases, conn=conn) == set()
+    with Session(engine) as session, session.begin():
+        with pytest.raises(LeaseLostError):
+            mark_task_done(session, task["id"], {"late": True}, lease_token=1)
+    with engine.begin() as conn:
+        assert release_tasks({taken["id"]: 2}, conn=conn) == {taken["id"]}
+
+
+def test_concurrent_claims_do_not_overlap(engine):
+    _submit(engine, 40, instantiate=True)
+    claimed: list[str] = []
+    lock = threading.Lock()
+
+    def worker() -> None:
+        while True:
+            with Session(engine) as session, session.begin():
+                tasks = claim_tasks(session, "svc", 3, threading.current_thread().name)
+            if not tasks:
+                return
+            with lock:
+                claimed.extend(t["id"] for t in tasks)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert len(claimed) == 40
+    assert len(set(claimed)) == 40
+
+
+def test_service_agent_on_sqlite(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO nodes (name, max_concurrency)"
+                """ VALUES ('n1', '{"svc": 2}')"""
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO workflows (name, version, steps)"
+                """ VALUES ('single', 1, '[{"key": "a", "service": "svc"}]')"""
+            )
+        )
+        submit_jobs("single", [{}] * 5, conn=conn, instantiate=True)
+
+    def handler(ctx: TaskContext) -> dict:
+        ctx.progress(50)
+        ctx.event("working")
+        return {"key": ctx.task["task_key"]}
+
+    agent = ServiceAgent(
+        "svc", "n1", handler, engine=engine, flush_interval=0.01, poll_interval=0.05
+    )
+    agent.run(stop_when_idle=True)
+
+    assert agent.max_workers == 2
+    with engine.connect() as conn:
+        statuses = conn.execute(text("SELECT status FROM job_tasks")).scalars().all()
+        events = conn.execute(
+            text("SELECT count(*) FROM task_events WHERE message = 'working'")
+        ).scalar_one()
+        last_seen = conn.execute(text("SELECT last_seen FROM nodes")).scalar_one()
+    assert statuses == ["done"] * 5
+    assert events == 5
+    assert last_seen is not None
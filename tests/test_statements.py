@@ -0,0 +1,134 @@
+import os
+from datetime import UTC, datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore import codec
+from accscore.db import sqlite
+from accscore.db.artifacts import record_artifacts
+from accscore.db.events import log_events
+from accscore.db.jobs import submit_jobs
+from accscore.db.migrations import apply_migrations
+from accscore.db.statements import connect_args, statement
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def test_statement_is_parsed_once():
+    sql = "SELECT * FROM job_tasks WHERE id = :task_id"
+    first = statement(sql)
+    assert statement(sql) is first
+    assert "task_id" in first._bindparams
+    assert statement(sql + " ") is not first
+
+
+def test_connect_args_per_driver():
+    assert connect_args("postgresql+psycopg://u@h/db") == {"prepare_threshold": None}
+    assert connect_args("postgresql+psycopg://u@h/db", prepared=True) == {
+        "prepare_threshold": 1
+    }
+    assert connect_args("postgresql+psycopg2://u@h/db", prepared=True) == {}
+    assert connect_args("sqlite://") == {}
+
+
+@pytest.fixture(
+    params=[
+        "sqlite",
+        pytest.param(
+            "postgres",
+            marks=pytest.mark.skipif(
+                not _docker_available(), reason="Docker not available"
+            ),
+        ),
+    ]
+)
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+        yield engine
+        engine.dispose()
+        return
+
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        yield engine
+        engine.dispose()
+
+
+def _write(conn, count, batch_size):
+    options = [{"n": i} for i in range(count)]
+    job_ids = submit_jobs("wf", options, conn=conn, batch_size=batch_size)
+    ts = datetime(2026, 1, 1, tzinfo=UTC)
+    events = [
+        {
+            "job_id": job_id,
+            "level": "info",
+            "type": "log",
+            "message": "m",
+            "data": {"n": i},
+        }
+        for i, job_id in enumerate(job_ids)
+    ]
+    events[0]["ts"] = ts
+    assert log_events(events, conn=conn, batch_size=batch_size) == count
+    artifacts = [
+        {
+            "job_id": str(job_id),
+            "kind": "output",
+            "bucket": "b",
+            "key": f"k{i}",
+            "size_bytes": i,
+        }
+        for i, job_id in enumerate(job_ids)
+    ]
+    assert record_artifacts(artifacts, conn=conn, batch_size=batch_size) == count
+    return job_ids
+
+
+def test_bulk_writes_reuse_one_statement_per_shape(engine):
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text("INSERT INTO workflows (name, version, steps) VALUES ('wf', 1, '[]')")
+        )
+        _write(conn, 3, 2)
+        cached = statement.cache_info().currsize
+        job_ids = _write(conn, 7, 3) + _write(conn, 11, 4)
+        # batch sizes and remainders do not add statements to the registry
+        assert statement.cache_info().currsize == cached
+
+        seqs = (
+            conn.execute(text("SELECT order_seq FROM jobs ORDER BY order_seq"))
+            .scalars()
+            .all()
+        )
+        assert seqs == list(range(seqs[0], seqs[0] + 21))
+        rows = conn.execute(
+            text(
+                "SELECT CAST(e.job_id AS text), e.data, a.key, a.size_bytes"
+                " FROM task_events e JOIN task_artifacts a ON a.job_id = e.job_id"
+                " JOIN jobs j ON j.id = e.job_id ORDER BY j.order_seq"
+            )
+        ).all()
+        assert len(rows) == 21
+        last = rows[-1]
+        assert last[0] == str(job_ids[-1])
+        assert (last[2], last[3]) == ("k10", 10)
+        data = last[1] if isinstance(last[1], dict) else codec.loads(last[1])
+        assert data == {"n": 10}
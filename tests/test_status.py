@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db import claim_tasks, mark_task_done, mark_task_error, sqlite
+from accscore.db.jobs import submit_jobs
+from accscore.db.migrations import apply_migrations
+from accscore.db.status import job_status_counts, service_status, task_status_counts
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+STEPS = [
+    {"key": "ingest", "service": "ingest"},
+    {"key": "render", "service": "renderer", "depends_on": ["ingest"]},
+]
+
+
+def _actual(conn):
+    counts = {}
+    for row in conn.execute(
+        text("SELECT service_name, status, count(*) FROM job_tasks GROUP BY 1, 2")
+    ):
+        counts.setdefault(row[0], {})[row[1]] = row[2]
+    return counts
+
+
+@pytest.fixture(
+    params=[
+        "sqlite",
+        pytest.param(
+            "postgres",
+            marks=pytest.mark.skipif(
+                not _docker_available(), reason="Docker not available"
+            ),
+        ),
+    ]
+)
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+        yield _seed(engine)
+        engine.dispose()
+        return
+
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        yield _seed(engine)
+        engine.dispose()
+
+
+def _seed(engine):
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text(
+                "INSERT INTO workflows (name, version, steps) VALUES ('wf', 1, :steps)"
+            ),
+            {"steps": json.dumps(STEPS)},
+        )
+    return engine
+
+
+def test_counters_follow_transitions(engine):
+    with engine.begin() as conn:
+        job_ids = submit_jobs("wf", [{}] * 5, conn=conn, instantiate=True)
+
+    with Session(engine) as session, session.begin():
+        claimed = claim_tasks(session, "ingest", 3, "n1")
+    with Session(engine) as session, session.begin():
+        mark_task_done(session, str(claimed[0]["id"]))
+        mark_task_error(session, str(claimed[1]["id"]), "boom", "failed")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM jobs WHERE id = :id"), {"id": str(job_ids[-1])})
+
+    now = datetime.now(UTC) + timedelta(minutes=1)
+    with engine.connect() as conn:
+        assert task_status_counts(conn=conn) == _actual(conn)
+        assert job_status_counts(conn=conn) == {"running": 4}
+        status = service_status(conn=conn, now=now)
+
+    assert status["ingest"].queued == 1
+    assert status["ingest"].in_flight == 1
+    assert status["ingest"].counts == {
+        "queued": 1,
+        "starting": 1,
+        "done": 1,
+        "error": 1,
+    }
+    assert status["renderer"].queued == 4
+    assert status["renderer"].in_flight == 0
+    assert (
+        timedelta(minutes=1)
+        <= status["renderer"].oldest_queued_age
+        < timedelta(minutes=2)
+    )
@@ -37,3 +37,52 @@ def test_build_key(monkeypatch):
     job_id = uuid4()
     key = storage.build_key("input", job_id, "taskA", "file.txt")
     assert key == f"input/{job_id}/taskA/file.txt"
+
+
+def test_get_object_uses_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("MINIO_ENDPOINT", "localhost:9000")
+    monkeypatch.setenv("MINIO_ACCESS_KEY", "key")
+    monkeypatch.setenv("MINIO_SECRET_KEY", "secret")
+    monkeypatch.setenv("POSTGRES_DSN", "sqlite:///:memory:")
+    monkeypatch.setenv("ACC_ARTIFACT_CACHE_DIR", str(tmp_path))
+    from accscore import storage
+
+    reload(storage)
+
+    class Response:
+        def read(self):
+            return b"payload"
+
+        def close(self):
+            pass
+
+        def release_conn(self):
+            pass
+
+    class Stat:
+        etag = "etag-1"
+
+    class DummyClient:
+        def __init__(self):
+            self.downloads = 0
+            self.stats = 0
+
+        def stat_object(self, bucket, name):
+            self.stats += 1
+            return Stat()
+
+        def get_object(self, bucket, name):
+            self.downloads += 1
+            return Response()
+
+    storage.client = DummyClient()
+    assert storage.get_object("b", "k", checksum="sha256:abc") == b"payload"
+    assert storage.get_object("b", "k", checksum="sha256:abc") == b"payload"
+    # a checksum identifies the content without a HEAD request
+    assert (storage.client.downloads, storage.client.stats) == (1, 0)
+    assert storage.get_object("b", "k") == b"payload"
+    assert (storage.client.downloads, storage.client.stats) == (2, 0)
+    assert storage.get_object("b", "k", revalidate=True) == b"payload"
+    assert storage.get_object("b", "k", revalidate=True) == b"payload"
+    assert (storage.client.downloads, storage.client.stats) == (3, 2)
+    assert storage.cache.stats.hits == 2
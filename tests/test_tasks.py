@@ -46,7 +46,9 @@ def _setup_schema(conn):
                 created_at timestamptz NOT NULL DEFAULT now(),
                 assigned_node text,
                 claimed_by text,
-                claimed_at timestamptz
+                claimed_at timestamptz,
+                lease_expires_at timestamptz,
+                lease_token bigint NOT NULL DEFAULT 0
             );
             CREATE TABLE nodes (
                 name text PRIMARY KEY,
@@ -60,7 +62,10 @@ def _setup_schema(conn):
 def _insert_sample_data(conn):
     now = datetime.now(timezone.utc)
     conn.execute(
-        text("INSERT INTO nodes (name, max_concurrency) VALUES ('n1', :mc::jsonb)"),
+        text(
+            "INSERT INTO nodes (name, max_concurrency)"
+            " VALUES ('n1', CAST(:mc AS jsonb))"
+        ),
         {"mc": '{"svc":2}'},
     )
 
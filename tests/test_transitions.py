@@ -0,0 +1,123 @@
+import json
+import os
+from uuid import UUID
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db import (
+    instantiate_tasks,
+    mark_task_done,
+    mark_task_error,
+    mark_task_running,
+    update_task_progress,
+)
+from accscore.db.migrations import apply_migrations
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+STEPS = [
+    {"key": "ingest", "service": "ingest", "weight": 1},
+    {"key": "render", "service": "renderer", "depends_on": ["ingest"], "weight": 3},
+]
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_transitions_maintain_job_progress():
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            wf_id = conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version, steps)"
+                    " VALUES ('wf', 1, CAST(:steps AS jsonb)) RETURNING id"
+                ),
+                {"steps": json.dumps(STEPS)},
+            ).scalar_one()
+            job_id = str(
+                conn.execute(
+                    text("INSERT INTO jobs (workflow_id) VALUES (:wf) RETURNING id"),
+                    {"wf": wf_id},
+                ).scalar_one()
+            )
+
+        def job():
+            with engine.connect() as conn:
+                return (
+                    conn.execute(
+                        text(
+                            "SELECT progress, progress_weight, current_task_key,"
+                            " started_at FROM jobs WHERE id=:id"
+                        ),
+                        {"id": job_id},
+                    )
+                    .mappings()
+                    .one()
+                )
+
+        with Session(engine) as session, session.begin():
+            instantiate_tasks(session, job_id)
+            instantiate_tasks(session, job_id)  # idempotent
+        tasks = {}
+        with engine.connect() as conn:
+            for row in conn.execute(text("SELECT id, task_key FROM job_tasks")):
+                tasks[row.task_key] = str(row.id)
+        assert len(tasks) == 2
+        assert job()["progress"] == 0
+        assert job()["progress_weight"] == 4
+
+        with Session(engine) as session, session.begin():
+            mark_task_running(session, tasks["ingest"])
+            update_task_progress(session, tasks["ingest"], 50)
+        state = job()
+        assert state["current_task_key"] == "ingest"
+        assert state["started_at"] is not None
+        assert float(state["progress"]) == pytest.approx(12.5)
+
+        with Session(engine) as session, session.begin():
+            mark_task_done(
+                session, tasks["ingest"], {"frames": 240, "job": UUID(job_id)}
+            )
+            mark_task_running(session, tasks["render"])
+            update_task_progress(session, tasks["render"], 50)
+        state = job()
+        assert state["current_task_key"] == "render"
+        assert float(state["progress"]) == pytest.approx(62.5)
+
+        with Session(engine) as session, session.begin():
+            update_task_progress(session, tasks["render"], 20)
+        assert float(job()["progress"]) == pytest.approx(40)
+
+        with Session(engine) as session, session.begin():
+            mark_task_error(session, tasks["render"], "ffmpeg", "exit 1")
+        assert job()["current_task_key"] == "render"
+        with engine.connect() as conn:
+            results = conn.execute(
+                text("SELECT results FROM job_tasks WHERE id=:id"),
+                {"id": tasks["render"]},
+            ).scalar_one()
+        assert results["error"] == {"code": "ffmpeg", "message": "exit 1"}
+        with engine.connect() as conn:
+            results = conn.execute(
+                text("SELECT results FROM job_tasks WHERE id=:id"),
+                {"id": tasks["ingest"]},
+            ).scalar_one()
+        assert results == {"frames": 240, "job": job_id}
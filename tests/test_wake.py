@@ -0,0 +1,217 @@
+import json
+import os
+import socket
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.db import sqlite
+from accscore.db.jobs import submit_jobs
+from accscore.db.migrations import apply_migrations
+from accscore.nodes.planner import NodeState, WakePlanner, plan_wakes, service_demand
+from accscore.nodes.wake import (
+    ProviderAPI,
+    ShellScript,
+    WakeOnLAN,
+    WakeProvider,
+    magic_packet,
+)
+from accscore.schema import Node, WakeMethod
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+def _node(name, method="wol", **capacity):
+    return Node(
+        name=name, wake_method=method, mac="00:11:22:33:44:55", max_concurrency=capacity
+    )
+
+
+def test_magic_packet():
+    packet = magic_packet("00-11-22-33-44-55")
+    assert packet[:6] == b"\xff" * 6
+    assert packet[6:] == bytes.fromhex("001122334455") * 16
+    with pytest.raises(ValueError):
+        magic_packet("00:11:22")
+
+
+def test_wake_on_lan_sends_packet_to_local_listener():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.settimeout(2)
+        provider = WakeOnLAN(broadcast="127.0.0.1", port=listener.getsockname()[1])
+        assert provider.wake(_node("gpu1"))
+        assert listener.recv(1024) == magic_packet("00:11:22:33:44:55")
+    assert not provider.wake(Node(name="nomac", wake_method="wol"))
+    assert not provider.sleep(_node("gpu1"))
+
+
+def test_shell_script_passes_action_and_node(tmp_path):
+    log = tmp_path / "calls"
+    script = tmp_path / "power.sh"
+    script.write_text(f'#!/bin/sh\necho "$1 $2" >> {log}\n[ "$2" != broken ]\n')
+    script.chmod(0o755)
+    provider = ShellScript(timeout=5)
+    assert provider.wake(Node(name="gpu1", wake_method="script", script=str(script)))
+    assert provider.sleep(Node(name="gpu1", wake_method="script", script=str(script)))
+    assert not provider.wake(
+        Node(name="broken", wake_method="script", script=str(script))
+    )
+    assert not provider.wake(
+        Node(name="none", wake_method="script", script=str(tmp_path / "x"))
+    )
+    assert log.read_text().split("\n")[:3] == ["wake gpu1", "sleep gpu1", "wake broken"]
+
+
+def test_provider_api_hands_over_reference():
+    calls = []
+
+    def call(action, ref):
+        calls.append((action, ref))
+        if ref == "i-broken":
+            raise RuntimeError("api down")
+        return True
+
+    provider = ProviderAPI(call)
+    assert provider.wake(Node(name="a", wake_method="provider", provider_ref="i-123"))
+    assert provider.sleep(Node(name="a", wake_method="provider", provider_ref="i-123"))
+    assert not provider.wake(
+        Node(name="b", wake_method="provider", provider_ref="i-broken")
+    )
+    assert calls == [("wake", "i-123"), ("sleep", "i-123"), ("wake", "i-broken")]
+
+
+def test_service_demand_needs_postgres(tmp_path):
+    engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+    with engine.connect() as conn, pytest.raises(sqlite.UnsupportedBackendError):
+        service_demand(conn=conn)
+
+
+def test_plan_wakes_covers_demand_with_fewest_large_nodes():
+    states = [
+        NodeState(_node("small", render=1), up=False, waking=False, idle=True),
+        NodeState(_node("big", render=4), up=False, waking=False, idle=True),
+        NodeState(
+            _node("always", method=None, render=1), up=True, waking=False, idle=True
+        ),
+        NodeState(_node("audio", audio=2), up=True, waking=False, idle=True),
+        NodeState(_node("busy", audio=2), up=True, waking=False, idle=False),
+    ]
+    plan = plan_wakes(states, {"render": 4, "audio": 1})
+    assert [n.name for n in plan.wake] == ["big"]
+    # the idle audio node is not needed while the busy one covers the demand
+    assert [n.name for n in plan.sleep] == ["audio"]
+    assert plan.capacity == {"audio": 2, "render": 5}
+
+    plan = plan_wakes(states, {"render": 6}, methods={WakeMethod.SCRIPT})
+    assert plan.wake == [] and plan.sleep == []
+
+
+class _StubProvider(WakeProvider):
+    def __init__(self):
+        self.calls = []
+        self.can_sleep = True
+
+    def wake(self, node):
+        self.calls.append(("wake", node.name))
+        return True
+
+    def sleep(self, node):
+        self.calls.append(("sleep", node.name))
+        return self.can_sleep
+
+
+@pytest.mark.skipif(not _docker_available(), reason="Docker not available")
+def test_wake_planner_wakes_for_upcoming_steps():
+    from testcontainers.postgres import PostgresContainer
+
+    now = datetime.now(UTC)
+    steps = [
+        {"key": "ingest", "service": "ingest"},
+        {"key": "render", "service": "render", "depends_on": ["ingest"]},
+    ]
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        with engine.begin() as conn:
+            apply_migrations(conn=conn)
+            conn.execute(
+                text(
+                    "INSERT INTO nodes"
+                    " (name, wake_method, mac, max_concurrency, last_seen)"
+                    " VALUES ('cpu', 'wol', '00:00:00:00:00:01',"
+                    "         CAST('{\"ingest\": 2}' AS jsonb), NULL),"
+                    "        ('gpu', 'wol', '00:00:00:00:00:02',"
+                    "         CAST('{\"render\": 1}' AS jsonb), NULL),"
+                    "        ('spare', 'wol', '00:00:00:00:00:03',"
+                    "         CAST('{\"ingest\": 1}' AS jsonb), :now)"
+                ),
+                {"now": now},
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO workflows (name, version, steps)"
+                    " VALUES ('wf', 1, CAST(:steps AS jsonb))"
+                ),
+                {"steps": json.dumps(steps)},
+            )
+            # ingest starts in two minutes, render a default step duration later
+            submit_jobs(
+                "wf", [{}] * 2, conn=conn, scheduled_at=now + timedelta(minutes=2)
+            )
+
+        provider = _StubProvider()
+        planner = WakePlanner(
+            {"wol": provider},
+            engine=engine,
+            horizon=timedelta(minutes=2, seconds=30),
+            idle_after=timedelta(0),
+        )
+        plan = planner.tick(now=now)
+        assert plan.demand == {"ingest": 2}
+        # 'spare' alone cannot cover two ingest tasks and is idle once 'cpu' is woken
+        assert provider.calls == [("wake", "cpu"), ("sleep", "spare")]
+
+        with engine.connect() as conn:
+            states = dict(
+                conn.execute(text("SELECT name, awake_state FROM nodes")).tuples().all()
+            )
+        assert states == {"cpu": "awake", "gpu": "unknown", "spare": "sleep"}
+
+        # a minute later render is within the horizon; 'cpu' counts while it boots
+        provider.calls.clear()
+        plan = planner.tick(now=now + timedelta(minutes=1))
+        assert plan.demand == {"ingest": 2, "render": 2}
+        assert provider.calls == [("wake", "gpu")]
+
+        # a node that could not be put to sleep stays marked awake
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "UPDATE nodes SET awake_state = 'awake', last_seen = :seen"
+                    " WHERE name = 'spare'"
+                ),
+                {"seen": now + timedelta(minutes=1)},
+            )
+        provider.calls.clear()
+        provider.can_sleep = False
+        plan = planner.tick(now=now + timedelta(minutes=1))
+        assert [n.name for n in plan.sleep] == ["spare"]
+        with engine.connect() as conn:
+            state = conn.execute(
+                text("SELECT awake_state FROM nodes WHERE name = 'spare'")
+            ).scalar_one()
+        assert state == "awake"
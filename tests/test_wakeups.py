@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("MINIO_ENDPOINT", "dummy")
+os.environ.setdefault("MINIO_ACCESS_KEY", "key")
+os.environ.setdefault("MINIO_SECRET_KEY", "secret")
+os.environ.setdefault("POSTGRES_DSN", "sqlite://")
+
+from accscore.agents.builder import Builder
+from accscore.agents.service import ServiceAgent
+from accscore.agents.wakeups import WakeupScheduler
+from accscore.db import sqlite
+from accscore.db.jobs import submit_jobs
+from accscore.db.migrations import apply_migrations
+from accscore.db.timers import DueTime, upcoming_attempts, upcoming_schedules
+
+
+def _docker_available() -> bool:
+    try:
+        import docker
+
+        docker.from_env().ping()
+        return True
+    except Exception:
+        return False
+
+
+@pytest.fixture(
+    params=[
+        "sqlite",
+        pytest.param(
+            "postgres",
+            marks=pytest.mark.skipif(
+                not _docker_available(), reason="Docker not available"
+            ),
+        ),
+    ]
+)
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        engine = sqlite.create_sqlite_engine(tmp_path / "accscore.db")
+        yield _seed(engine)
+        engine.dispose()
+        return
+
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:15-alpine") as pg:
+        engine = create_engine(pg.get_connection_url(), future=True)
+        yield _seed(engine)
+        engine.dispose()
+
+
+def _seed(engine):
+    with engine.begin() as conn:
+        apply_migrations(conn=conn)
+        conn.execute(
+            text(
+                "INSERT INTO workflows (name, version, steps)"
+                """ VALUES ('wf', 1, '[{"key": "a", "service": "svc"}]')"""
+            )
+        )
+    return engine
+
+
+def _ts(conn, value):
+    return sqlite.timestamp(value) if sqlite.is_sqlite(conn) else value
+
+
+def _now():
+    return datetime.now(UTC).replace(microsecond=0)
+
+
+def _retry(conn, due_at):
+    (job_id,) = submit_jobs("wf", [{}], conn=conn, instantiate=True)
+    conn.execute(
+        text(
+            "UPDATE job_tasks SET next_attempt_at = :due, updated_at = :written"
+            " WHERE job_id = :job_id"
+        ),
+        {
+            "due": _ts(conn, due_at),
+            "written": _ts(conn, datetime.now(UTC)),
+            "job_id": str(job_id),
+        },
+    )
+    return str(job_id)
+
+
+def test_upcoming_due_times(engine):
+    now = _now()
+    with engine.begin() as conn:
+        _retry(conn, now + timedelta(seconds=30))
+        _retry(conn, now + timedelta(seconds=30))
+        _retry(conn, now - timedelta(seconds=5))
+        for delay in (timedelta(minutes=2), timedelta(hours=1)):
+            submit_jobs("wf", [{}], conn=conn, scheduled_at=now + delay)
+
+    window = {"now": now, "until": now + timedelta(minutes=10)}
+    with engine.connect() as conn:
+        assert upcoming_attempts(["svc", "other"], conn=conn, **window) == [
+            DueTime(now + timedelta(seconds=30), "svc")
+        ]
+        assert upcoming_attempts(["other"], conn=conn, **window) == []
+        assert upcoming_schedules(conn=conn, **window) == [
+            DueTime(now + timedelta(minutes=2), None)
+        ]
+        # incremental: nothing new past the loaded window and nothing written since
+        seen = {"after": window["until"], "changed_since": now + timedelta(minutes=1)}
+        assert upcoming_attempts(["svc"], conn=conn, **window, **seen) == []
+        assert upcoming_schedules(conn=conn, **window, **seen) == []
+        seen["changed_since"] = now - timedelta(minutes=1)
+        assert len(upcoming_schedules(conn=conn, **window, **seen)) == 1
+        with pytest.raises(ValueError):
+            upcoming_schedules(conn=conn, **window, after=now)
+
+
+def test_scheduler_fires_subscribers_when_due(engine):
+    now = _now()
+    with engine.begin() as conn:
+        _retry(conn, now + timedelta(seconds=30))
+        submit_jobs("wf", [{}], conn=conn, scheduled_at=now + timedelta(minutes=2))
+    calls = []
+    scheduler = WakeupScheduler(
+        engine=engine, horizon=timedelta(minutes=5), clock_slack=timedelta(0)
+    )
+    scheduler.subscribe(lambda: calls.append("svc"), "svc")
+    scheduler.subscribe(lambda: calls.append("builder"))
+
+    # keep clear of the millisecond resolution of SQLite timestamps
+    time.sleep(0.01)
+    loaded = datetime.now(UTC)
+    time.sleep(0.01)
+    assert scheduler.refresh(loaded) == 2
+    assert scheduler.next_due() == now + timedelta(seconds=30)
+    assert scheduler.fire(now) == 0
+    assert scheduler.fire(now + timedelta(seconds=30)) == 1
+    assert calls == ["svc"]
+
+    # only a retry scheduled since the last refresh is read again
+    with engine.begin() as conn:
+        job_id = _retry(conn, now + timedelta(seconds=40))
+    assert scheduler.refresh(loaded + timedelta(milliseconds=1)) == 1
+    scheduler.notify(now + timedelta(seconds=35), "svc")
+    assert scheduler.fire(now + timedelta(seconds=35)) == 1
+    assert scheduler.fire(now + timedelta(minutes=3)) == 2
+    assert calls == ["svc", "svc", "svc", "builder"]
+
+    # a new subscription triggers a full refresh, which drops times that no
+    # longer match a queued row
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE job_tasks SET next_attempt_at = :due WHERE job_id = :job_id"),
+            {"due": _ts(conn, now + timedelta(minutes=4)), "job_id": job_id},
+        )
+    scheduler.notify(now + timedelta(minutes=3), "svc")
+    scheduler.subscribe(lambda: calls.append("other"), "other")
+    assert scheduler.refresh(now + timedelta(seconds=1)) == 3
+    # the notified time is gone; the still queued retry and job fire again
+    assert scheduler.fire(now + timedelta(minutes=3, seconds=30)) == 2
+    assert calls[-2:] == ["svc", "builder"]
+    assert scheduler.next_due() == now + timedelta(minutes=4)
+
+
+def test_loops_wake_up_when_work_is_due(engine):
+    due = datetime.now(UTC) + timedelta(seconds=0.5)
+    with engine.begin() as conn:
+        retried = _retry(conn, due)
+        (scheduled,) = submit_jobs("wf", [{}], conn=conn, scheduled_at=due)
+    scheduler = WakeupScheduler(engine=engine, refresh_interval=0.1)
+    agent = ServiceAgent(
+        "svc",
+        "n1",
+        lambda ctx: {},
+        engine=engine,
+        max_workers=1,
+        flush_interval=0.01,
+        poll_interval=60,
+        scheduler=scheduler,
+    )
+    loops = [agent]
+    # the builder's due-job scan locks rows, which SQLite cannot do
+    on_sqlite = engine.dialect.name == "sqlite"
+    if not on_sqlite:
+        loops.append(Builder(engine=engine, tick_interval=60, scheduler=scheduler))
+    threads = [threading.Thread(target=loop.run) for loop in loops]
+    for thread in threads:
+        thread.start()
+    threads.append(scheduler.start())
+
+    deadline = time.monotonic() + 10
+    statuses = {}
+    try:
+        while time.monotonic() < deadline:
+            with engine.connect() as conn:
+                statuses = dict(
+                    conn.execute(
+                        text(
+                            "SELECT CAST(j.id AS text), jt.status FROM jobs j"
+                            " LEFT JOIN job_tasks jt ON jt.job_id = j.id"
+                        )
+                    ).all()
+                )
+            if statuses.get(retried) == "done" and (
+                on_sqlite or statuses.get(str(scheduled))
+            ):
+                break
+            time.sleep(0.05)
+    finally:
+        for loop in loops:
+            loop.stop()
+        scheduler.stop()
+        for thread in threads:
+            thread.join(timeout=10)
+
+    # both loops would have slept for a minute without the scheduler
+    assert statuses[retried] == "done"
+    assert on_sqlite or statuses[str(scheduled)] is not None
+    assert time.monotonic() < deadline